@@ -6,147 +6,516 @@ Batch Markdown to HTML Converter
 """
 
 import argparse
+import heapq
+import json
+import os
 import sys
+import threading
 from pathlib import Path
-from typing import List
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from markdown_to_html import WeChatHTMLConverter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from conversion_manifest import ConversionManifest
+from conversion_trace import ConversionTrace
+from image_assets import DEFAULT_MAX_WIDTH, DEFAULT_QUALITY, ImageAssetStage, pillow_available
+from formatter_cache import sha256_file
+from markdown_to_html import CODE_RENDER_MODES, CONVERTER_VERSION, WeChatHTMLConverter, theme_css_path
 import time
 
+# 同时在途的任务数上限 = 并发数 × 该倍数（线程模式按文件计，进程模式按批计），
+# 超出后先等待已完成的任务，内存占用与文件总数无关
+INFLIGHT_PER_WORKER = 4
+# 内存中保留的失败记录数（完整记录写入失败报告）
+FAILED_FILES_KEPT = 20
+# 静默模式下输出进度的间隔（秒）
+PROGRESS_INTERVAL = 5.0
+# 启用图片阶段时，每转换这么多个文件处理一次图片
+IMAGE_BATCH_SIZE = 500
+# 默认的失败报告文件名（位于清单所在目录）
+FAILURE_REPORT_NAME = 'convert-failures.jsonl'
+
+# 进程池中每个工作进程各自持有的转换器（在进程初始化时创建一次）
+_worker_converter: Optional[WeChatHTMLConverter] = None
+
+
+def _walk_markdown_files(directory: Path, recursive: bool) -> Iterator[Path]:
+    """
+    逐个产出目录中的Markdown文件，顺序与 sorted(glob(...)) 一致（每层目录按名称排序后深度优先），
+    内存中只保留当前路径上各层目录的条目，不保存全部结果
+    """
+    try:
+        with os.scandir(directory) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+    except OSError as e:
+        print(f'⚠️  警告: 无法读取目录 {directory}: {e}')
+        return
+
+    for entry in entries:
+        # 与 glob('**') 一致：不进入指向目录的符号链接
+        if recursive and entry.is_dir(follow_symlinks=False):
+            yield from _walk_markdown_files(Path(entry.path), recursive)
+        elif entry.name.endswith(('.md', '.markdown')) and entry.is_file():
+            yield Path(entry.path)
+
+
+def _init_process_worker(theme: str, code_render: str = 'pre') -> None:
+    """进程池初始化：每个工作进程只构建一次转换器"""
+    global _worker_converter
+    _worker_converter = WeChatHTMLConverter(theme=theme, code_render=code_render)
+
+
+def _worker_name() -> str:
+    """当前工作者标识（进程号或线程名）"""
+    if _worker_converter is not None:
+        return f'pid-{os.getpid()}'
+    return threading.current_thread().name
+
+
+def _convert_one(converter: WeChatHTMLConverter, input_file: Path, output_file: Path) -> tuple:
+    """转换单个文件，返回 (成功, 输入文件, 输出路径或错误信息, 耗时, 工作者, 追踪汇总)"""
+    trace = ConversionTrace()
+    try:
+        start_time = time.time()
+        output_path = converter.convert_file(str(input_file), str(output_file), trace=trace)
+        elapsed = time.time() - start_time
+        return True, input_file, output_path, elapsed, _worker_name(), trace.summary()
+    except Exception as e:
+        return False, input_file, str(e), 0, _worker_name(), trace.summary()
+
+
+def _convert_chunk_in_process(tasks: List[Tuple[Path, Path]]) -> List[tuple]:
+    """在工作进程中转换一批文件"""
+    return [_convert_one(_worker_converter, input_file, output_file) for input_file, output_file in tasks]
+
 
 class BatchConverter:
     """批量转换器"""
 
-    def __init__(self, theme: str = 'tech', output_dir: str = None, workers: int = 4):
+    EXECUTORS = ('thread', 'process')
+
+    def __init__(self, theme: str = 'tech', output_dir: str = None, workers: int = 4,
+                 executor: str = 'thread', chunksize: Optional[int] = None,
+                 manifest_path: Optional[str] = None, force: bool = False, code_render: str = 'pre',
+                 image_stage: Optional[ImageAssetStage] = None, failure_report: Optional[str] = None,
+                 slowest: int = 5):
+        if executor not in self.EXECUTORS:
+            raise ValueError(f"Unknown executor: {executor}. Available: {', '.join(self.EXECUTORS)}")
+
         self.theme = theme
         self.output_dir = Path(output_dir) if output_dir else None
         self.workers = workers
-        self.converter = WeChatHTMLConverter(theme=theme)
-
-        # 统计信息
+        self.executor = executor
+        self.chunksize = chunksize
+        self.code_render = code_render
+        # 图片阶段（可选）：转换完成后处理引用的本地图片并改写输出HTML
+        self.image_stage = image_stage
+        # 代码块渲染方式、图片处理参数不同则输出不同，记入清单的转换器版本
+        self.converter_version = CONVERTER_VERSION if code_render == 'pre' else f'{CONVERTER_VERSION}+{code_render}'
+        if image_stage is not None:
+            self.converter_version += f'+{image_stage.options_key}'
+        # 进程模式下转换器在工作进程中创建，主进程无需构建
+        self.converter = WeChatHTMLConverter(theme=theme, code_render=code_render) if executor == 'thread' else None
+
+        # 增量转换清单：默认写在输出目录中；force=True 时忽略清单强制重建
+        if manifest_path is None and self.output_dir:
+            manifest_path = self.output_dir / ConversionManifest.FILE_NAME
+        self.manifest = ConversionManifest(manifest_path) if manifest_path else None
+        self.force = force
+        self.theme_hash = sha256_file(theme_css_path(theme))
+
+        # 失败报告（JSONL，每行一个失败文件）；内存中只保留前 FAILED_FILES_KEPT 条
+        self.failure_report = Path(failure_report) if failure_report else None
+        self._failure_fp = None
+
+        # 统计信息（与文件总数无关的固定大小）
         self.total_files = 0
         self.success_count = 0
         self.failed_count = 0
-        self.failed_files = []
-
-    def find_markdown_files(self, input_path: str, recursive: bool = False) -> List[Path]:
-        """查找Markdown文件"""
+        self.skipped_count = 0
+        self.failed_files: List[Tuple[Path, str]] = []
+        # 每个工作者的统计：{工作者: [文件数, 累计耗时]}
+        self.worker_stats: Dict[str, List[float]] = {}
+        self.wall_time = 0.0
+        # 最慢的文件（小顶堆，元素为 (总耗时, 序号, 输入文件, 追踪汇总)）和各阶段累计耗时
+        self.slowest = slowest
+        self._slowest_files: List[Tuple[float, int, Path, dict]] = []
+        self._stage_totals: Dict[str, Dict[str, float]] = {}
+        self._traced_count = 0
+
+    def iter_markdown_files(self, input_path: str, recursive: bool = False) -> Iterator[Path]:
+        """按路径顺序逐个查找Markdown文件（可直接传给 convert_batch，边查找边提交）"""
         path = Path(input_path)
 
         if path.is_file():
             if path.suffix.lower() in ['.md', '.markdown']:
-                return [path]
+                yield path
             else:
                 print(f'⚠️  警告: {path} 不是Markdown文件，已跳过')
-                return []
 
         elif path.is_dir():
-            pattern = '**/*.md' if recursive else '*.md'
-            markdown_files = list(path.glob(pattern))
-
-            # 也查找.markdown扩展名
-            markdown_pattern = '**/*.markdown' if recursive else '*.markdown'
-            markdown_files.extend(path.glob(markdown_pattern))
-
-            return sorted(set(markdown_files))
+            yield from _walk_markdown_files(path, recursive)
 
         else:
             raise FileNotFoundError(f'路径不存在: {input_path}')
 
+    def find_markdown_files(self, input_path: str, recursive: bool = False) -> List[Path]:
+        """查找Markdown文件（返回完整列表；文件很多时使用 iter_markdown_files）"""
+        return list(self.iter_markdown_files(input_path, recursive))
+
+    def output_path_for(self, input_file: Path) -> Path:
+        """确定输出文件路径"""
+        if self.output_dir:
+            return self.output_dir / f'{input_file.stem}.html'
+        return input_file.with_suffix('.html')
+
     def convert_single_file(self, input_file: Path) -> tuple:
         """转换单个文件"""
-        try:
-            # 确定输出文件路径
-            if self.output_dir:
-                output_file = self.output_dir / f'{input_file.stem}.html'
+        return _convert_one(self.converter, input_file, self.output_path_for(input_file))
+
+    def _iter_pending(self, input_files: Iterable[Path]) -> Iterator[Tuple[Path, Optional[str]]]:
+        """
+        逐个筛选需要重新转换的文件（按需计算哈希，不预先保存全部结果）
+
+        Yields:
+            (输入文件, 内容哈希)；无清单或读取失败时哈希为 None
+        """
+        for input_file in input_files:
+            if self.manifest is None:
+                yield input_file, None
+                continue
+            try:
+                input_hash = sha256_file(input_file)
+            except OSError:
+                # 读取失败交给转换阶段报告错误
+                yield input_file, None
+                continue
+
+            if not self.force and self.manifest.is_up_to_date(
+                    input_file, self.output_path_for(input_file), input_hash,
+                    self.theme_hash, self.converter_version) and self._images_up_to_date(input_file):
+                self.skipped_count += 1
             else:
-                output_file = input_file.with_suffix('.html')
-
-            # 转换
-            start_time = time.time()
-            output_path = self.converter.convert_file(str(input_file), str(output_file))
-            elapsed = time.time() - start_time
-
-            return True, input_file, output_path, elapsed
-
-        except Exception as e:
-            return False, input_file, str(e), 0
+                yield input_file, input_hash
+
+    def _images_up_to_date(self, input_file: Path) -> bool:
+        """图片阶段启用时，检查上次处理的源图片是否未变、资源文件是否仍然存在"""
+        if self.image_stage is None:
+            return True
+        for image in self.manifest.get(input_file).get('images', ()):
+            try:
+                if sha256_file(self.manifest.resolve(image['source'])) != image['source_hash']:
+                    return False
+            except OSError:
+                return False
+            if not self.manifest.resolve(image['asset']).exists():
+                return False
+        return True
+
+    def _run_image_stage(self, converted: List[Tuple[Path, Path, Optional[str]]]) -> None:
+        """处理一批输出引用的图片，改写HTML后再记入清单"""
+        if not converted:
+            return
+        images = self.image_stage.run([(input_file, output_path) for input_file, output_path, _ in converted])
 
-    def convert_batch(self, input_files: List[Path], show_progress: bool = True) -> None:
-        """批量转换文件"""
-        self.total_files = len(input_files)
+        if self.manifest is None:
+            return
+        for input_file, output_path, input_hash in converted:
+            if input_hash is None:
+                continue
+            records = [
+                {
+                    'src': image['src'],
+                    'source': self.manifest.relative_path(Path(image['source'])),
+                    'source_hash': image['source_hash'],
+                    'asset': self.manifest.relative_path(Path(image['asset'])),
+                }
+                for image in images.get(output_path, ())
+            ]
+            self.manifest.record(input_file, output_path, input_hash,
+                                 self.theme, self.theme_hash, self.converter_version, images=records)
+
+    def _chunk_size(self) -> int:
+        """进程模式下每次提交的文件数（默认每个工作进程约分到4批）"""
+        if self.chunksize:
+            return max(1, self.chunksize)
+        return max(1, min(64, self.total_files // (self.workers * 4) or 1))
+
+    @staticmethod
+    def _submit_windowed(executor, jobs: Iterable[tuple], limit: int) -> Iterator[tuple]:
+        """
+        滑动窗口提交：在途任务不超过 limit 个，按完成顺序产出 (future, 附带数据)
+
+        Args:
+            jobs: (附带数据, 函数, *参数) 的可迭代对象，按需读取
+        """
+        in_flight = {}
+        for payload, fn, *args in jobs:
+            while len(in_flight) >= limit:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future, in_flight.pop(future)
+            in_flight[executor.submit(fn, *args)] = payload
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future, in_flight.pop(future)
+
+    def _iter_results(self, pending: Iterable[Tuple[Path, Optional[str]]]) -> Iterator[Tuple[tuple, Optional[str]]]:
+        """按完成顺序产出 (转换结果, 内容哈希)"""
+        limit = self.workers * INFLIGHT_PER_WORKER
+        if self.executor == 'process':
+            # 进程池（multiprocessing）只在需要时导入，缩短线程模式的启动时间
+            from concurrent.futures import ProcessPoolExecutor
+
+            size = self._chunk_size()
+
+            def chunks():
+                tasks, hashes = [], []
+                for input_file, input_hash in pending:
+                    tasks.append((input_file, self.output_path_for(input_file)))
+                    hashes.append(input_hash)
+                    if len(tasks) == size:
+                        yield hashes, _convert_chunk_in_process, tasks
+                        tasks, hashes = [], []
+                if tasks:
+                    yield hashes, _convert_chunk_in_process, tasks
+
+            with ProcessPoolExecutor(max_workers=self.workers,
+                                     initializer=_init_process_worker,
+                                     initargs=(self.theme, self.code_render)) as executor:
+                for future, hashes in self._submit_windowed(executor, chunks(), limit):
+                    yield from zip(future.result(), hashes)
+        else:
+            # 使用线程池并发转换
+            jobs = ((input_hash, self.convert_single_file, input_file) for input_file, input_hash in pending)
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                for future, input_hash in self._submit_windowed(executor, jobs, limit):
+                    yield future.result(), input_hash
+
+    def _record_trace(self, input_file: Path, trace: dict) -> None:
+        """累计各阶段耗时，并只保留最慢的若干个文件"""
+        for stage, data in trace['stages'].items():
+            total = self._stage_totals.setdefault(stage, {'wall': 0.0, 'cpu': 0.0, 'calls': 0})
+            for key in total:
+                total[key] += data[key]
+        if self.slowest <= 0:
+            return
+        self._traced_count += 1
+        item = (trace['wall'], self._traced_count, input_file, trace)
+        if len(self._slowest_files) < self.slowest:
+            heapq.heappush(self._slowest_files, item)
+        elif item[0] > self._slowest_files[0][0]:
+            heapq.heapreplace(self._slowest_files, item)
+
+    def _record_failure(self, input_file: Path, error: str) -> None:
+        """失败记录写入报告文件，内存中只保留前几条用于摘要"""
+        if len(self.failed_files) < FAILED_FILES_KEPT:
+            self.failed_files.append((input_file, error))
+        if self.failure_report is None:
+            return
+        if self._failure_fp is None:
+            self.failure_report.parent.mkdir(parents=True, exist_ok=True)
+            self._failure_fp = open(self.failure_report, 'a', encoding='utf-8')
+        record = {'file': str(input_file), 'error': error, 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+        self._failure_fp.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._failure_fp.flush()
+
+    def _print_progress(self, start: float) -> None:
+        """静默模式下的周期性进度"""
+        done = self.skipped_count + self.success_count + self.failed_count
+        elapsed = time.time() - start
+        converted = self.success_count + self.failed_count
+        rate = converted / elapsed if elapsed > 0 else 0.0
+        remaining = self.total_files - done
+        eta = f'，预计剩余 {remaining / rate:.0f}s' if rate > 0 and remaining else ''
+        print(f'⏳ [{done}/{self.total_files}] 成功 {self.success_count}，失败 {self.failed_count}，'
+              f'跳过 {self.skipped_count}，{rate:.1f} 文件/秒{eta}', flush=True)
+
+    def convert_batch(self, input_files: Iterable[Path], show_progress: bool = True, banner: bool = True,
+                      total: Optional[int] = None) -> None:
+        """
+        批量转换文件（滑动窗口提交，逐个输出结果）
+
+        传入生成器（如 iter_markdown_files）时边读取边提交，内存中只有在途的任务；
+        增量清单仍会载入全部文件的记录（见 ConversionManifest）
+
+        Args:
+            input_files: 待转换的Markdown文件（列表或按需产出的可迭代对象）
+            show_progress: 是否逐个文件输出转换结果（否则每隔几秒输出一次进度）
+            banner: 是否输出开始和结束的提示信息（监听模式下关闭）
+            total: 文件总数（input_files 没有长度时必须传入，用于进度显示和进程模式的分批大小）
+        """
+        self.total_files = len(input_files) if total is None else total
 
         if self.total_files == 0:
             print('⚠️  未找到Markdown文件')
             return
 
-        print(f'📚 找到 {self.total_files} 个Markdown文件')
-        print(f'🎨 使用主题: {self.theme}')
-        print(f'⚙️  并发数: {self.workers}')
-        print()
-
         # 确保输出目录存在
         if self.output_dir:
             self.output_dir.mkdir(parents=True, exist_ok=True)
-            print(f'📁 输出目录: {self.output_dir}')
-        else:
-            print(f'📁 输出目录: 与源文件相同')
 
-        print()
-        print('🚀 开始转换...')
-        print('─' * 60)
+        if banner:
+            print(f'📚 找到 {self.total_files} 个Markdown文件')
+            print(f'🎨 使用主题: {self.theme}')
+            mode = '进程' if self.executor == 'process' else '线程'
+            print(f'⚙️  并发数: {self.workers} ({mode})')
+            print()
+            print(f'📁 输出目录: {self.output_dir}' if self.output_dir else '📁 输出目录: 与源文件相同')
+            if self.manifest is not None and not self.force:
+                print('⏭️  未变化的文件将自动跳过（使用 --force 强制重建）')
+            print()
+            print('🚀 开始转换...')
+            print('─' * 60)
 
-        # 使用线程池并发转换
-        with ThreadPoolExecutor(max_workers=self.workers) as executor:
-            # 提交所有任务
-            future_to_file = {
-                executor.submit(self.convert_single_file, file): file
-                for file in input_files
-            }
+        # 每次运行重新生成失败报告
+        if self.failure_report is not None and self.failure_report.exists():
+            self.failure_report.unlink()
 
-            # 处理完成的任务
-            for future in as_completed(future_to_file):
-                success, input_file, result, elapsed = future.result()
+        batch_start = time.time()
+        last_progress = batch_start
+        # 启用图片阶段时，成功转换的文件在图片处理后再记入清单（每 IMAGE_BATCH_SIZE 个处理一次）
+        converted: List[Tuple[Path, Path, Optional[str]]] = []
+        try:
+            for (success, input_file, result, elapsed, worker, trace), input_hash in \
+                    self._iter_results(self._iter_pending(input_files)):
+                stats = self.worker_stats.setdefault(worker, [0, 0.0])
+                stats[0] += 1
+                stats[1] += elapsed
 
                 if success:
                     self.success_count += 1
+                    self._record_trace(input_file, trace)
                     status = '✅'
                     output_path = result
                     message = f'{input_file.name} → {Path(output_path).name} ({elapsed:.2f}s)'
+                    if self.image_stage is not None:
+                        converted.append((input_file, Path(output_path), input_hash))
+                        if len(converted) >= IMAGE_BATCH_SIZE:
+                            self._run_image_stage(converted)
+                            converted = []
+                    elif self.manifest is not None and input_hash is not None:
+                        self.manifest.record(input_file, Path(output_path), input_hash,
+                                             self.theme, self.theme_hash, self.converter_version)
                 else:
                     self.failed_count += 1
-                    self.failed_files.append((input_file, result))
+                    self._record_failure(input_file, result)
                     status = '❌'
                     message = f'{input_file.name} - 失败: {result}'
+                    if self.manifest is not None:
+                        self.manifest.forget(input_file)
 
                 if show_progress:
-                    progress = f'[{self.success_count + self.failed_count}/{self.total_files}]'
+                    done = self.skipped_count + self.success_count + self.failed_count
+                    progress = f'[{done}/{self.total_files}]'
                     print(f'{status} {progress} {message}')
+                elif time.time() - last_progress >= PROGRESS_INTERVAL:
+                    last_progress = time.time()
+                    self._print_progress(batch_start)
+
+            if self.image_stage is not None:
+                self._run_image_stage(converted)
+        finally:
+            # 中断时也保存已完成部分，下次运行可以从断点继续
+            if self.manifest is not None:
+                self.manifest.save()
+            if self._failure_fp is not None:
+                self._failure_fp.close()
+                self._failure_fp = None
+
+        self.wall_time = time.time() - batch_start
+        if banner:
+            print('─' * 60)
+            print()
 
-        print('─' * 60)
-        print()
+    def stage_totals(self) -> Dict[str, Dict[str, float]]:
+        """所有文件的各阶段累计耗时：{阶段名: {'wall', 'cpu', 'calls'}}"""
+        return {stage: dict(total) for stage, total in self._stage_totals.items()}
 
-    def print_summary(self) -> None:
+    def slowest_files(self) -> List[Tuple[Path, dict]]:
+        """最慢的文件（按总耗时从高到低）：[(输入文件, 追踪汇总)]"""
+        ranked = sorted(self._slowest_files, reverse=True)
+        return [(input_file, trace) for _, _, input_file, trace in ranked]
+
+    def print_trace_summary(self, slowest: int = 5) -> None:
+        """打印最慢的文件和各阶段耗时"""
+        if not self._stage_totals:
+            return
+
+        totals = self.stage_totals()
+        all_wall = sum(data['wall'] for data in totals.values()) or 1
+        print()
+        print('各阶段耗时（所有文件合计）:')
+        print(f'  {"阶段":<14}{"墙钟":>10}{"CPU":>10}{"占比":>8}{"次数":>8}')
+        for stage, data in sorted(totals.items(), key=lambda item: item[1]['wall'], reverse=True):
+            print(f'  {stage:<16}{data["wall"]:9.3f}s{data["cpu"]:9.3f}s'
+                  f'{data["wall"] / all_wall * 100:7.1f}%{int(data["calls"]):8d}')
+
+        ranked = self.slowest_files()[:slowest]
+        if not ranked:
+            return
+        print()
+        print(f'最慢的 {len(ranked)} 个文件:')
+        for input_file, trace in ranked:
+            stage, data = max(trace['stages'].items(), key=lambda item: item[1]['wall'])
+            counts = trace['counts']
+            print(f'  • {input_file.name}: {trace["wall"]:.3f}s，'
+                  f'最慢阶段 {stage} {data["wall"]:.3f}s，'
+                  f'{trace["bytes_in"] / 1024:.1f} KB → {trace["bytes_out"] / 1024:.1f} KB，'
+                  f'代码块 {counts.get("code_blocks", 0)}，图片 {counts.get("images", 0)}，'
+                  f'样式元素 {counts.get("styled_elements", 0)}')
+
+    def print_summary(self, slowest: int = 5) -> None:
         """打印转换摘要"""
         print('📊 转换摘要')
         print('─' * 60)
         print(f'总文件数: {self.total_files}')
         print(f'✅ 成功: {self.success_count}')
         print(f'❌ 失败: {self.failed_count}')
+        if self.skipped_count:
+            print(f'⏭️  跳过(未变化): {self.skipped_count}')
 
         if self.failed_files:
             print()
             print('失败文件列表:')
             for file, error in self.failed_files:
                 print(f'  • {file.name}: {error}')
+            if self.failed_count > len(self.failed_files):
+                print(f'  … 另有 {self.failed_count - len(self.failed_files)} 个失败文件')
+            if self.failure_report is not None:
+                print(f'  完整失败报告: {self.failure_report}')
 
         print('─' * 60)
 
         # 计算成功率
-        if self.total_files > 0:
-            success_rate = (self.success_count / self.total_files) * 100
+        converted = self.success_count + self.failed_count
+        if converted > 0:
+            success_rate = (self.success_count / converted) * 100
             print(f'✨ 成功率: {success_rate:.1f}%')
 
+        # 吞吐量统计
+        if self.wall_time > 0 and converted > 0:
+            print(f'⏱️  总耗时: {self.wall_time:.2f}s，'
+                  f'吞吐量: {converted / self.wall_time:.1f} 文件/秒')
+
+        if len(self.worker_stats) > 1:
+            print()
+            print('工作者吞吐量:')
+            for worker, (count, busy) in sorted(self.worker_stats.items()):
+                rate = count / busy if busy > 0 else 0
+                print(f'  • {worker}: {int(count)} 个文件，忙碌 {busy:.2f}s，{rate:.1f} 文件/秒')
+
+        if self.image_stage is not None:
+            stage = self.image_stage
+            print()
+            print(f'🖼️  {stage.format_stats()}')
+            for input_file, src in stage.missing:
+                print(f'  ⚠️  图片不存在: {src}（{input_file.name}）')
+            for source, error in stage.failed:
+                print(f'  ❌ 图片处理失败: {source.name} - {error}')
+
+        if slowest > 0:
+            self.print_trace_summary(slowest)
+
 
 def main():
     """命令行入口"""
@@ -170,50 +539,144 @@ def main():
   # 使用8个并发线程加快转换速度
   python batch_convert.py --input articles/ --workers 8
 
+  # 大批量转换：使用多进程（绕开GIL，适合多核机器）
+  python batch_convert.py --input articles/ --recursive --executor process --workers 16
+
+  # 忽略增量清单，强制重新转换所有文件
+  python batch_convert.py --input articles/ --output output/ --force
+
+  # 直接输出微信兼容的代码块（无需再运行 convert-code-blocks.py）
+  python batch_convert.py --input articles/ --output output/ --code-render wechat
+
+  # 同时预处理引用的本地图片（缩放到1080像素宽、重新编码，需安装Pillow）
+  python batch_convert.py --input articles/ --output output/ --optimize-images
+
+  # 监听模式：持续监听文章目录，只重新转换变化的文件（主题CSS变化时重建全部）
+  python batch_convert.py --input articles/ --output output/ --recursive --watch
+
+  # 查看启动耗时分析
+  python batch_convert.py --profile-startup
+
 转换规则:
   - 默认情况下，HTML文件与Markdown文件在同一目录
   - 使用--output指定统一的输出目录
   - 支持.md和.markdown扩展名
-  - 并发转换提高效率（默认4个线程）
+  - 并发转换提高效率（默认4个线程，--executor process 使用多进程）
+  - 增量转换：清单记录输入/主题/转换器版本/输出哈希，未变化的文件自动跳过
+    （清单位于输出目录；未指定输出目录时位于输入目录）
+  - 大批量转换内存占用恒定：任务按滑动窗口提交，失败记录写入 JSONL 报告
         '''
     )
 
-    parser.add_argument('-i', '--input', required=True,
+    parser.add_argument('-i', '--input',
                         help='输入的Markdown文件或目录路径')
     parser.add_argument('-o', '--output',
                         help='输出目录（默认：与源文件相同目录）')
     parser.add_argument('-t', '--theme', default='tech',
                         choices=['tech', 'minimal', 'business'],
                         help='选择主题样式（默认：tech）')
+    parser.add_argument('--code-render', default='pre', choices=CODE_RENDER_MODES,
+                        help='代码块渲染方式：pre（浏览器预览）或 wechat（微信兼容格式）（默认：pre）')
     parser.add_argument('-r', '--recursive', action='store_true',
                         help='递归查找子目录中的Markdown文件')
     parser.add_argument('-w', '--workers', type=int, default=4,
-                        help='并发转换的线程数（默认：4）')
+                        help='并发转换的线程数/进程数（默认：4）')
+    parser.add_argument('-e', '--executor', default='thread',
+                        choices=BatchConverter.EXECUTORS,
+                        help='并发方式：thread（线程池）或 process（进程池，CPU密集型大批量推荐）')
+    parser.add_argument('--chunksize', type=int,
+                        help='进程模式下每次提交给工作进程的文件数（默认自动计算）')
+    parser.add_argument('--optimize-images', action='store_true',
+                        help='预处理文章引用的本地图片：缩放、重新编码、写入资源目录并改写HTML中的路径')
+    parser.add_argument('--asset-dir',
+                        help='图片资源目录（默认：输出目录下的 assets）')
+    parser.add_argument('--image-max-width', type=int, default=DEFAULT_MAX_WIDTH,
+                        help=f'图片最大宽度（像素，默认：{DEFAULT_MAX_WIDTH}）')
+    parser.add_argument('--image-quality', type=int, default=DEFAULT_QUALITY,
+                        help=f'JPEG/WebP质量（默认：{DEFAULT_QUALITY}）')
+    parser.add_argument('--webp', action='store_true',
+                        help='照片类图片输出WebP（注意：微信图文消息内图片上传接口只接受jpg/png）')
+    parser.add_argument('-f', '--force', action='store_true',
+                        help='忽略增量清单，强制重新转换所有文件')
     parser.add_argument('-q', '--quiet', action='store_true',
                         help='静默模式，只显示摘要')
+    parser.add_argument('--failure-report',
+                        help=f'失败记录的JSONL报告路径（默认：清单所在目录下的 {FAILURE_REPORT_NAME}）')
+    parser.add_argument('--slowest', type=int, default=5,
+                        help='摘要中列出最慢的文件数，0 表示不显示阶段耗时分析（默认：5）')
+    parser.add_argument('--watch', action='store_true',
+                        help='转换后持续监听输入目录，文件变化时增量转换（Ctrl+C 停止）')
+    parser.add_argument('--debounce', type=float, default=0.5,
+                        help='监听模式下合并文件事件的静默时间（秒，默认：0.5）')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='输出启动耗时分析（各阶段耗时、预算检查、导入耗时明细）后退出')
 
     args = parser.parse_args()
 
+    if args.profile_startup:
+        from startup_profile import print_startup_profile, profile_startup
+        sys.exit(0 if print_startup_profile(profile_startup('batch_convert', args.theme)) else 1)
+    if not args.input:
+        parser.error('需要指定 --input')
+
     try:
+        # 增量清单位置：输出目录，否则为输入目录（输入为单个文件时为其所在目录）
+        manifest_root = Path(args.output) if args.output else Path(args.input)
+        if manifest_root.is_file():
+            manifest_root = manifest_root.parent
+        manifest_path = manifest_root / ConversionManifest.FILE_NAME
+
+        if args.optimize_images and not pillow_available():
+            print('⚠️  未安装Pillow，跳过图片预处理（pip install Pillow）')
+            args.optimize_images = False
+
+        def make_batch(force: bool = args.force) -> BatchConverter:
+            """创建批量转换器（监听模式下每轮重新创建，以读取最新的主题CSS）"""
+            image_stage = None
+            if args.optimize_images:
+                image_stage = ImageAssetStage(
+                    Path(args.asset_dir) if args.asset_dir else manifest_root / 'assets',
+                    workers=args.workers, max_width=args.image_max_width,
+                    quality=args.image_quality, webp=args.webp,
+                )
+            return BatchConverter(
+                theme=args.theme,
+                output_dir=args.output,
+                workers=args.workers,
+                executor=args.executor,
+                chunksize=args.chunksize,
+                manifest_path=manifest_path,
+                force=force,
+                code_render=args.code_render,
+                image_stage=image_stage,
+                failure_report=args.failure_report or manifest_root / FAILURE_REPORT_NAME,
+                slowest=args.slowest
+            )
+
+        if args.watch:
+            # watchdog 只在监听模式下导入
+            from batch_watch import BatchWatcher
+
+            BatchWatcher(make_batch, Path(args.input), theme_css_path(args.theme), recursive=args.recursive,
+                         debounce=args.debounce, show_progress=not args.quiet).watch()
+            sys.exit(0)
+
         # 创建批量转换器
-        converter = BatchConverter(
-            theme=args.theme,
-            output_dir=args.output,
-            workers=args.workers
-        )
+        converter = make_batch()
 
-        # 查找Markdown文件
-        markdown_files = converter.find_markdown_files(args.input, args.recursive)
+        # 先统计文件数（不保存路径），转换时再遍历一次，边查找边提交
+        total = sum(1 for _ in converter.iter_markdown_files(args.input, args.recursive))
 
-        if not markdown_files:
+        if not total:
             print('❌ 未找到Markdown文件')
             sys.exit(1)
 
         # 执行批量转换
-        converter.convert_batch(markdown_files, show_progress=not args.quiet)
+        converter.convert_batch(converter.iter_markdown_files(args.input, args.recursive),
+                                show_progress=not args.quiet, total=total)
 
         # 打印摘要
-        converter.print_summary()
+        converter.print_summary(slowest=args.slowest)
 
         # 退出码
         sys.exit(0 if converter.failed_count == 0 else 1)
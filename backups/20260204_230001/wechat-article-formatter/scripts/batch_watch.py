@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batch Watch
+批量转换的监听模式：监听整个文章目录树，合并短时间内的大量文件事件，只重新转换受影响的文件；
+主题CSS变化时优先重建全部文章（最近编辑过的文章排在最前）
+"""
+
+import threading
+import time
+from pathlib import Path
+from typing import Callable, List, Set
+
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+MARKDOWN_SUFFIXES = ('.md', '.markdown')
+IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp')
+
+
+class BatchWatchHandler(FileSystemEventHandler):
+    """把文件系统事件转交给 BatchWatcher（移动事件的源路径和目标路径都算作变化）"""
+
+    def __init__(self, watcher: 'BatchWatcher'):
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        if event.is_directory or event.event_type in ('opened', 'closed_no_write'):
+            return
+        self.watcher.notify(Path(event.src_path))
+        dest_path = getattr(event, 'dest_path', None)
+        if dest_path:
+            self.watcher.notify(Path(dest_path))
+
+
+class BatchWatcher:
+    """
+    监听目录树并增量批量转换
+
+    Args:
+        make_batch: 创建 BatchConverter 的函数，接受 force 参数（每轮重新创建，以便读取最新的主题CSS；
+                    force 只用于首次完整转换）
+        input_path: 监听的目录（或单个Markdown文件）
+        theme_file: 主题CSS文件，变化时重建全部文章
+        recursive: 是否监听子目录
+        debounce: 最后一个事件之后等待的静默时间（秒）
+        max_delay: 事件持续不断时，距第一个事件最多等待的时间（秒）
+        show_progress: 是否逐个文件输出转换结果
+    """
+
+    def __init__(self, make_batch: Callable[..., 'BatchConverter'], input_path: Path, theme_file: Path,
+                 recursive: bool = False, debounce: float = 0.5, max_delay: float = 5.0,
+                 show_progress: bool = True):
+        self.make_batch = make_batch
+        self.input_path = Path(input_path).resolve()
+        self.root = self.input_path if self.input_path.is_dir() else self.input_path.parent
+        self.theme_file = Path(theme_file).resolve()
+        self.recursive = recursive
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.show_progress = show_progress
+
+        self._cond = threading.Condition()
+        self._pending: Set[Path] = set()
+        self._rebuild_all = False
+        self._first_event = 0.0
+        self._last_event = 0.0
+        self._stopped = False
+        # 最近一轮的批量转换器（用于查询清单中的图片引用）
+        self._batch = None
+
+    def _watches(self, path: Path) -> bool:
+        """路径是否位于监听范围内"""
+        if self.input_path.is_file():
+            return path == self.input_path
+        if self.recursive:
+            return self.root in path.parents
+        return path.parent == self.root
+
+    def _files_using_image(self, image: Path) -> List[Path]:
+        """清单中引用了该图片的Markdown文件（图片阶段启用时）"""
+        batch = self._batch
+        if batch is None or batch.image_stage is None or batch.manifest is None:
+            return []
+        manifest = batch.manifest
+        with manifest._lock:
+            entries = list(manifest.entries.items())
+        return [
+            manifest.resolve(key).resolve() for key, entry in entries
+            if any(manifest.resolve(item['source']).resolve() == image for item in entry.get('images', ()))
+        ]
+
+    def notify(self, path: Path) -> None:
+        """记录一个文件变化"""
+        path = path.resolve()
+        suffix = path.suffix.lower()
+        with self._cond:
+            if path == self.theme_file:
+                self._rebuild_all = True
+            elif suffix in MARKDOWN_SUFFIXES and self._watches(path):
+                self._pending.add(path)
+            elif suffix in IMAGE_SUFFIXES:
+                affected = self._files_using_image(path)
+                if not affected:
+                    return
+                self._pending.update(affected)
+            else:
+                return
+
+            now = time.monotonic()
+            if not self._first_event:
+                self._first_event = now
+            self._last_event = now
+            self._cond.notify()
+
+    def _take(self):
+        """等待事件静默后取出本轮待处理的文件"""
+        with self._cond:
+            while not (self._pending or self._rebuild_all or self._stopped):
+                self._cond.wait()
+            # 合并突发事件：静默 debounce 秒后处理，但最多等待 max_delay 秒
+            while not self._stopped:
+                deadline = min(self._last_event + self.debounce, self._first_event + self.max_delay)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            pending, rebuild_all = self._pending, self._rebuild_all
+            self._pending, self._rebuild_all = set(), False
+            self._first_event = self._last_event = 0.0
+            return pending, rebuild_all
+
+    def run_once(self, pending: Set[Path], rebuild_all: bool) -> None:
+        """执行一轮转换（清单会跳过内容未变化的文件）"""
+        batch = self.make_batch(force=False)
+        self._batch = batch
+        timestamp = time.strftime('%H:%M:%S')
+
+        if rebuild_all:
+            files = batch.find_markdown_files(str(self.input_path), self.recursive)
+            # 最近编辑过的文章优先
+            files.sort(key=lambda file: file.resolve() not in pending)
+            print(f'[{timestamp}] 🎨 主题已变化，重建全部 {len(files)} 个文件')
+        else:
+            files = sorted(file for file in pending if file.exists())
+            for removed in sorted(pending - set(files)):
+                if batch.manifest is not None:
+                    batch.manifest.forget(removed)
+                print(f'[{timestamp}] 🗑️  已删除: {removed.name}（保留已生成的HTML）')
+            if batch.manifest is not None:
+                batch.manifest.save()
+
+        if not files:
+            return
+
+        start = time.perf_counter()
+        batch.convert_batch(files, show_progress=self.show_progress, banner=False)
+        elapsed = time.perf_counter() - start
+        timestamp = time.strftime('%H:%M:%S')
+        status = '❌' if batch.failed_count else '✅'
+        print(f'[{timestamp}] {status} 转换 {batch.success_count}，未变化 {batch.skipped_count}，'
+              f'失败 {batch.failed_count}（{elapsed:.2f}s）')
+        for input_file, error in batch.failed_files:
+            print(f'   ❌ {input_file.name}: {error}')
+
+    def _loop(self) -> None:
+        while True:
+            pending, rebuild_all = self._take()
+            if self._stopped:
+                return
+            try:
+                self.run_once(pending, rebuild_all)
+            except Exception as e:
+                print(f'[{time.strftime("%H:%M:%S")}] ❌ 转换失败: {e}')
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def watch(self) -> None:
+        """先完整转换一次，然后持续监听，直到 Ctrl+C"""
+        initial = self.make_batch()
+        self._batch = initial
+        files = initial.find_markdown_files(str(self.input_path), self.recursive)
+        if files:
+            initial.convert_batch(files, show_progress=self.show_progress)
+            initial.print_summary(slowest=0)
+
+        handler = BatchWatchHandler(self)
+        observer = Observer()
+        observer.schedule(handler, path=str(self.root), recursive=self.recursive)
+        if self.theme_file.parent != self.root:
+            observer.schedule(handler, path=str(self.theme_file.parent), recursive=False)
+        observer.start()
+
+        worker = threading.Thread(target=self._loop, name='batch-watch', daemon=True)
+        worker.start()
+
+        scope = '（含子目录）' if self.recursive else ''
+        print(f'👀 正在监听: {self.root}{scope}')
+        print(f'   主题文件: {self.theme_file}')
+        print('   按 Ctrl+C 停止')
+        try:
+            while worker.is_alive():
+                worker.join(timeout=1)
+        except KeyboardInterrupt:
+            print('\n👋 停止监听')
+        finally:
+            self.stop()
+            observer.stop()
+            observer.join()
+            worker.join(timeout=5)
@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Conversion Benchmark
+Markdown→微信HTML转换的基准测试套件：生成多类文章语料，测量各阶段耗时和吞吐量（峰值RSS按整次运行报告），
+结果可保存为JSON并与之前的运行对比；另可测量后处理阶段每次重新解析/序列化的开销
+"""
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from bs4 import BeautifulSoup
+from conversion_trace import ConversionTrace
+from markdown_to_html import CONVERTER_VERSION, THEME_FILES, WeChatHTMLConverter
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 基准结果JSON格式版本
+RESULT_FORMAT = 1
+
+# 转换阶段（按执行顺序）
+STAGES = ('markdown', 'highlight', 'parse', 'code_blocks', 'images', 'inline_css',
+          'other_transforms', 'serialize', 'wrap')
+
+_CODE_SAMPLES = {
+    'python': 'def handler_{i}(request):\n    data = [x * x for x in range({i})]\n'
+              '    return {{"status": "ok", "count": len(data)}}',
+    'javascript': 'async function fetch{i}(url) {{\n  const res = await fetch(url);\n'
+                  '  return res.json().then(d => d.items.slice(0, {i}));\n}}',
+    'bash': 'for f in logs/*.log; do\n  grep -c "ERROR" "$f" | tee -a report_{i}.txt\ndone',
+    'go': 'func Sum{i}(xs []int) int {{\n    total := 0\n    for _, x := range xs {{\n'
+          '        total += x\n    }}\n    return total + {i}\n}}',
+    '': 'SELECT id, name FROM users WHERE score > {i} ORDER BY score DESC;',
+}
+
+_CJK_SENTENCES = [
+    '在信息爆炸的时代，如何高效地获取有价值的内容成为每个人都要面对的问题。',
+    '我们需要在速度与质量之间找到平衡，既不能盲目追求效率，也不能忽视细节。',
+    '技术的进步让写作和排版变得更加简单，但好的内容依然需要时间沉淀。',
+    '公众号文章的阅读体验很大程度上取决于排版是否清晰、层次是否分明。',
+    '当一个系统足够复杂时，任何微小的改动都可能带来意想不到的影响。',
+]
+
+# 序列化边界用例：解析器或序列化方式改变时，这些内容最容易与旧实现不一致
+SERIALIZATION_CASES = {
+    'leading_comment': '<!-- 作者备注 -->\n\n第一段正文',
+    'trailing_comment': '正文段落\n\n<!-- 结尾备注 -->',
+    'inline_comment': '前文 <!-- 行内注释 --> 后文',
+    'raw_html_block': '<div class="note">原始 HTML &lt;块&gt; &amp; 实体</div>\n\n之后的段落',
+    'raw_inline_html': '包含 <span style="color: red">行内 &lt;HTML&gt;</span> 的段落',
+    'entities': 'a &amp; b &lt; c，以及 `code <tag>`',
+}
+
+
+def generate_tech_article(sections: int = 40) -> str:
+    """生成一篇代码较多的长篇技术文章，用于基准测试"""
+    parts = ['# 基准测试文章\n']
+    for i in range(sections):
+        parts.append(f'## 第 {i + 1} 节：性能优化实践\n')
+        parts.append('这是一段用于测试的中文段落，包含 **加粗**、*斜体* 和 `行内代码`。' * 6 + '\n')
+        parts.append(f'```python\ndef handler_{i}(request):\n'
+                     f'    data = [x * x for x in range({i + 10})]\n'
+                     f'    return {{"status": "ok", "count": len(data)}}\n```\n')
+        parts.append('> 引用：过早优化是万恶之源。\n')
+        parts.append('- 要点一\n- 要点二\n- 要点三\n')
+        parts.append('| 指标 | 优化前 | 优化后 |\n|------|--------|--------|\n'
+                     f'| 耗时 | {i + 100}ms | {i + 20}ms |\n')
+        parts.append(f'![示意图](images/figure-{i}.png)\n')
+    return '\n'.join(parts)
+
+
+def _code_heavy_article(rng: random.Random, scale: int) -> str:
+    parts = ['# 代码密集型教程\n']
+    languages = list(_CODE_SAMPLES)
+    for i in range(30 * scale):
+        lang = rng.choice(languages)
+        parts.append(f'## 步骤 {i + 1}\n')
+        parts.append('下面的示例演示了具体实现，注意其中的 `边界条件` 处理。\n')
+        parts.append(f'```{lang}\n{_CODE_SAMPLES[lang].format(i=i + rng.randint(1, 99))}\n```\n')
+    return '\n'.join(parts)
+
+
+def _table_article(rng: random.Random, scale: int) -> str:
+    parts = ['# 数据报告\n']
+    for t in range(12 * scale):
+        parts.append(f'## 表 {t + 1}：季度指标\n')
+        parts.append('| 指标 | Q1 | Q2 | Q3 | Q4 | 同比 |\n|------|----|----|----|----|------|')
+        for r in range(20):
+            values = ' | '.join(str(rng.randint(10, 999)) for _ in range(4))
+            parts.append(f'| 指标{r} | {values} | {rng.uniform(-20, 40):.1f}% |')
+        parts.append('')
+    return '\n'.join(parts)
+
+
+def _image_article(rng: random.Random, scale: int) -> str:
+    parts = ['# 图文并茂\n']
+    for i in range(40 * scale):
+        parts.append(f'![图{i}](https://example.com/images/{rng.randint(1000, 9999)}.png)\n')
+        parts.append(f'*图{i}：{rng.choice(_CJK_SENTENCES)}*\n')
+    return '\n'.join(parts)
+
+
+def _cjk_article(rng: random.Random, scale: int) -> str:
+    parts = ['# 中文长文\n']
+    for i in range(60 * scale):
+        if i % 6 == 0:
+            parts.append(f'## 第{i // 6 + 1}部分\n')
+        paragraph = ''.join(rng.choice(_CJK_SENTENCES) for _ in range(rng.randint(4, 9)))
+        if i % 5 == 0:
+            parts.append(f'> {paragraph}\n')
+        elif i % 7 == 0:
+            parts.append('\n'.join(f'- **要点{j}**：{rng.choice(_CJK_SENTENCES)}' for j in range(4)) + '\n')
+        else:
+            parts.append(paragraph + '\n')
+    return '\n'.join(parts)
+
+
+def generate_corpus(seed: int = 42, scale: int = 1) -> Dict[str, str]:
+    """
+    生成基准语料（相同 seed 和 scale 生成完全相同的内容，保证多次运行可比）
+
+    Returns:
+        {文章类型: Markdown文本}
+    """
+    rng = random.Random(seed)
+    return {
+        'short': '# 短文\n\n' + '\n\n'.join(rng.choice(_CJK_SENTENCES) for _ in range(3))
+                 + '\n\n- 要点一\n- 要点二\n',
+        'code_heavy': _code_heavy_article(rng, scale),
+        'tables': _table_article(rng, scale),
+        'images': _image_article(rng, scale),
+        'cjk': _cjk_article(rng, scale),
+        'mixed': generate_tech_article(20 * scale),
+    }
+
+
+def convert_with_stages(converter: WeChatHTMLConverter, markdown_text: str) -> Tuple[str, Dict[str, float]]:
+    """
+    执行 convert() 并返回各阶段耗时（秒，来自转换器的追踪记录）
+
+    代码高亮是 markdown 阶段的子阶段，markdown 只统计扣除高亮后的耗时；
+    自定义后处理阶段归入 other_transforms。
+    """
+    trace = ConversionTrace()
+    html = converter.convert(markdown_text, trace)
+    timings = dict.fromkeys(STAGES, 0.0)
+    for stage, data in trace.stage_times().items():
+        timings[stage if stage in timings else 'other_transforms'] += data['wall']
+    return html, timings
+
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    进程峰值常驻内存（MB），平台不支持时返回None
+
+    ru_maxrss 是整个进程的历史峰值，无法拆分到单个主题或文章，只在整次运行结束时报告一次
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以KB为单位，macOS 以字节为单位
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def run_suite(corpus: Dict[str, str], themes: List[str], repeat: int,
+              highlight_cache_enabled: bool = False) -> Dict:
+    """
+    对每个主题、每篇文章测量各阶段耗时与吞吐量
+
+    Returns:
+        可序列化为JSON的结果字典
+    """
+    results = {}
+    for theme in themes:
+        converter = WeChatHTMLConverter(theme=theme, highlight_cache_enabled=highlight_cache_enabled)
+        documents = {}
+        stage_totals = dict.fromkeys(STAGES, 0.0)
+        convert_total = 0.0
+
+        for name, markdown_text in corpus.items():
+            convert_with_stages(converter, markdown_text)  # 预热
+
+            runs = [convert_with_stages(converter, markdown_text)[1] for _ in range(repeat)]
+            stages = {stage: statistics.mean(run[stage] for run in runs) * 1000 for stage in STAGES}
+            totals = [sum(run.values()) * 1000 for run in runs]
+            documents[name] = {
+                'size_kb': len(markdown_text.encode('utf-8')) / 1024,
+                'mean_ms': statistics.mean(totals),
+                'min_ms': min(totals),
+                'stages_ms': stages,
+            }
+            for stage in STAGES:
+                stage_totals[stage] += stages[stage]
+            convert_total += documents[name]['mean_ms']
+
+        results[theme] = {
+            'articles_per_sec': len(corpus) / (convert_total / 1000) if convert_total else 0.0,
+            'total_ms': convert_total,
+            'stages_ms': stage_totals,
+            'documents': documents,
+        }
+    return results
+
+
+def environment_info(converter_parser: str) -> Dict:
+    """运行环境信息（对比结果时用于判断是否可比）"""
+    import bs4
+    import markdown
+    import pygments
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'converter_version': CONVERTER_VERSION,
+        'parser': converter_parser,
+        'markdown': markdown.__version__,
+        'bs4': bs4.__version__,
+        'pygments': pygments.__version__,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def print_suite_results(results: Dict) -> None:
+    for theme, data in results.items():
+        print(f"🎨 主题: {theme}  吞吐量 {data['articles_per_sec']:.2f} 篇/秒  "
+              f"总耗时 {data['total_ms']:.1f} ms")
+        total = data['total_ms'] or 1
+        for stage in STAGES:
+            value = data['stages_ms'][stage]
+            print(f'   {stage:<17} {value:9.2f} ms  {value / total * 100:5.1f}%')
+        for name, doc in data['documents'].items():
+            print(f"   📄 {name:<12} {doc['size_kb']:7.1f} KB  平均 {doc['mean_ms']:8.2f} ms  "
+                  f"最快 {doc['min_ms']:8.2f} ms")
+        print('─' * 60)
+
+
+def compare_results(baseline: Dict, current: Dict, threshold: float) -> bool:
+    """
+    打印与基线结果的差异
+
+    Returns:
+        是否没有超过阈值（百分比）的性能退化
+    """
+    ok = True
+
+    def delta(old: float, new: float) -> float:
+        return (new - old) / old * 100 if old else 0.0
+
+    for key in ('converter_version', 'parser', 'python', 'pygments'):
+        old, new = baseline['environment'].get(key), current['environment'].get(key)
+        if old != new:
+            print(f'⚠️  环境不同: {key} {old} → {new}（结果可能不可比）')
+
+    for theme, data in current['results'].items():
+        old = baseline['results'].get(theme)
+        if old is None:
+            continue
+        change = delta(old['articles_per_sec'], data['articles_per_sec'])
+        print(f"🎨 {theme}: 吞吐量 {old['articles_per_sec']:.2f} → {data['articles_per_sec']:.2f} 篇/秒 "
+              f"({change:+.1f}%)")
+        for stage in STAGES:
+            before, after = old['stages_ms'].get(stage, 0.0), data['stages_ms'][stage]
+            change = delta(before, after)
+            # 忽略0.5ms以内的绝对差异（计时噪声）
+            significant = abs(after - before) > 0.5
+            regressed = significant and change > threshold
+            ok = ok and not regressed
+            mark = '❌' if regressed else ('✅' if significant and change < -threshold else '  ')
+            print(f'   {mark} {stage:<17} {before:9.2f} → {after:9.2f} ms  ({change:+6.1f}%)')
+    return ok
+
+
+def reparse_transforms(converter: WeChatHTMLConverter, html: str) -> str:
+    """
+    对照实现：执行同一组（当前版本的）变换，但每个阶段都用html.parser重新解析并序列化整篇文档，
+    即单树流水线之前的解析方式；与 _run_transforms 对比只反映解析/序列化的开销，不含各变换自身的优化
+    """
+    for transform in converter.transforms:
+        soup = BeautifulSoup(html, 'html.parser')
+        transform(soup)
+        html = str(soup)
+    return html
+
+
+def check_serialization(theme: str) -> List[str]:
+    """对比单树流水线与逐阶段重新解析在序列化边界用例上的输出，返回不一致的用例名"""
+    converter = WeChatHTMLConverter(theme=theme)
+    mismatched = []
+    for name, markdown_text in SERIALIZATION_CASES.items():
+        md_html = converter._render_markdown(markdown_text)
+        if reparse_transforms(converter, md_html) != converter._run_transforms(md_html):
+            mismatched.append(name)
+    return mismatched
+
+
+def measure(func: Callable[[], str], repeat: int) -> Tuple[float, int, str]:
+    """返回 (平均耗时秒, 峰值内存字节, 输出)"""
+    output = func()  # 预热
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        output = func()
+    elapsed = (time.perf_counter() - start) / repeat
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed, peak, output
+
+
+def run_parse_overhead_benchmark(markdown_text: str, theme: str, repeat: int) -> List[Tuple[str, float, int]]:
+    """对同一篇文章分别测量逐阶段重新解析与单树流水线（变换相同，只比较解析/序列化开销）"""
+    converter = WeChatHTMLConverter(theme=theme)
+    # 两种实现共用同一份Markdown渲染结果，只比较后处理部分
+    md_html = converter._render_markdown(markdown_text)
+
+    before = measure(lambda: reparse_transforms(converter, md_html), repeat)
+    after = measure(lambda: converter._run_transforms(md_html), repeat)
+
+    if before[2] != after[2]:
+        print('⚠️  警告: 两种方式的输出不一致', file=sys.stderr)
+    mismatched = check_serialization(theme)
+    if mismatched:
+        print(f'⚠️  警告: 序列化边界用例输出不一致: {", ".join(mismatched)}', file=sys.stderr)
+
+    return [
+        ('每阶段重新解析 (html.parser)', before[0], before[1]),
+        (f'单树流水线 ({converter.parser})', after[0], after[1]),
+    ]
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(
+        description='Markdown→微信HTML转换基准测试（各阶段耗时、峰值RSS、吞吐量）',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='''
+示例用法:
+  # 使用生成的语料测试全部主题
+  python benchmark.py
+
+  # 保存结果，修改代码后再运行并与之对比
+  python benchmark.py --save before.json
+  python benchmark.py --compare before.json --save after.json
+
+  # 使用指定文章、更大的语料
+  python benchmark.py --input article.md --repeat 10
+  python benchmark.py --scale 4 --themes tech
+
+  # 测量后处理阶段的解析/序列化开销（同一组变换：每阶段重新解析 vs 单树）
+  python benchmark.py --parse-overhead --sections 40
+
+语料类型:
+  short       短文
+  code_heavy  代码密集型教程（含未标注语言的代码块）
+  tables      表格密集型报告
+  images      图片密集型文章
+  cjk         中文长文
+  mixed       综合技术文章
+        '''
+    )
+
+    parser.add_argument('-i', '--input', help='使用指定的Markdown文件作为语料（默认：自动生成）')
+    parser.add_argument('-t', '--themes', default='all',
+                        help='测试的主题（逗号分隔，默认：all）')
+    parser.add_argument('-n', '--repeat', type=int, default=5,
+                        help='每篇文章的重复次数（默认：5）')
+    parser.add_argument('--scale', type=int, default=1,
+                        help='生成语料的规模倍数（默认：1）')
+    parser.add_argument('--seed', type=int, default=42,
+                        help='生成语料的随机种子（默认：42）')
+    parser.add_argument('--highlight-cache', action='store_true',
+                        help='启用代码高亮缓存（默认关闭，测量真实高亮开销）')
+    parser.add_argument('--save', metavar='FILE', help='保存结果为JSON')
+    parser.add_argument('--compare', metavar='FILE', help='与之前保存的JSON结果对比')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='对比时判定为退化的百分比阈值（默认：10）')
+    parser.add_argument('--parse-overhead', '--pipeline', dest='parse_overhead', action='store_true',
+                        help='只测量后处理阶段每次重新解析/序列化的开销（变换相同，不是与旧版本对比；'
+                             '--pipeline 为旧名称）')
+    parser.add_argument('--sections', type=int, default=40,
+                        help='--parse-overhead 模式下自动生成文章的章节数（默认：40）')
+
+    args = parser.parse_args()
+
+    themes = list(THEME_FILES) if args.themes == 'all' else \
+        [theme.strip() for theme in args.themes.split(',') if theme.strip()]
+    unknown = [theme for theme in themes if theme not in THEME_FILES]
+    if unknown:
+        parser.error(f"未知主题: {', '.join(unknown)}（可用: {', '.join(THEME_FILES)}）")
+
+    if args.parse_overhead:
+        if args.input:
+            markdown_text = Path(args.input).read_text(encoding='utf-8')
+        else:
+            markdown_text = generate_tech_article(args.sections)
+
+        print(f'📄 文章大小: {len(markdown_text.encode("utf-8")) / 1024:.1f} KB')
+        print(f'🎨 使用主题: {themes[0]}')
+        print('─' * 60)
+
+        results = run_parse_overhead_benchmark(markdown_text, themes[0], args.repeat)
+        baseline_time, baseline_peak = results[0][1], results[0][2]
+
+        for name, elapsed, peak in results:
+            print(f'{name:<28} {elapsed * 1000:8.1f} ms  峰值内存 {peak / 1024 / 1024:6.2f} MB  '
+                  f'(x{baseline_time / elapsed:.2f} 速度, x{baseline_peak / max(peak, 1):.2f} 内存)')
+
+        print('─' * 60)
+        return
+
+    if args.input:
+        corpus = {Path(args.input).stem: Path(args.input).read_text(encoding='utf-8')}
+    else:
+        corpus = generate_corpus(args.seed, args.scale)
+
+    print(f'📚 语料: {len(corpus)} 篇，共 {sum(len(t.encode("utf-8")) for t in corpus.values()) / 1024:.1f} KB')
+    print(f'🔁 每篇重复: {args.repeat} 次，代码高亮缓存: {"开启" if args.highlight_cache else "关闭"}')
+    print('─' * 60)
+
+    results = run_suite(corpus, themes, args.repeat, args.highlight_cache)
+    print_suite_results(results)
+    peak_rss = peak_rss_mb()
+    print(f"💾 峰值RSS（整次运行）: {f'{peak_rss:.1f} MB' if peak_rss is not None else 'N/A'}")
+
+    report = {
+        'format': RESULT_FORMAT,
+        'environment': environment_info(WeChatHTMLConverter(themes[0]).parser),
+        'peak_rss_mb': peak_rss,
+        'config': {
+            'repeat': args.repeat,
+            'scale': args.scale,
+            'seed': args.seed,
+            'input': args.input,
+            'highlight_cache': args.highlight_cache,
+        },
+        'results': results,
+    }
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+        print(f'💾 结果已保存: {args.save}')
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding='utf-8'))
+        if baseline.get('format') != RESULT_FORMAT:
+            print(f'❌ 无法对比: 结果格式版本不同（{baseline.get("format")}）', file=sys.stderr)
+            sys.exit(1)
+        if baseline.get('config') != report['config']:
+            print('⚠️  两次运行的语料或参数不同，结果可能不可比')
+        print(f'📊 与基线对比: {args.compare}')
+        if not compare_results(baseline, report, args.threshold):
+            print(f'❌ 存在超过 {args.threshold:.0f}% 的性能退化')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Code Highlight Cache
+带持久化缓存的代码高亮：与 codehilite 输出一致，按 (代码, 语言, Pygments选项) 缓存结果，
+并支持关闭或限制语言自动猜测；WeChatCodeFormatter 直接从 Pygments 词法单元输出微信兼容的代码块
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import pygments
+from pygments.formatter import Formatter
+from pygments.token import Token
+from markdown.extensions import Extension
+from markdown.extensions.attr_list import AttrListExtension
+from markdown.extensions.codehilite import CodeHilite, CodeHiliteExtension, HiliteTreeprocessor
+from markdown.extensions.fenced_code import FencedBlockPreprocessor
+
+from formatter_cache import CACHE_DIR, atomic_write_text, sha256_text
+
+# 磁盘缓存的上限：条目数和最长保留天数（超出时删除最久未使用的条目）
+DISK_MAX_ENTRIES = 20000
+DISK_MAX_AGE_DAYS = 30
+# 每写入这么多条检查一次磁盘缓存（进程内第一次写入时也会检查）
+PRUNE_EVERY_WRITES = 1000
+
+# 模拟shebang（#!python、:::python），带这种首行的缩进代码块交给CodeHilite自行识别语言
+_SHEBANG_RE = re.compile(r'^(?:::+|#!)')
+
+
+def _unescape(text: str) -> str:
+    """还原 fenced_code 的基本HTML转义（& 最后处理）"""
+    text = text.replace('&quot;', '"')
+    text = text.replace('&gt;', '>')
+    text = text.replace('&lt;', '<')
+    return text.replace('&amp;', '&')
+
+
+class HighlightCache:
+    """
+    代码高亮结果缓存
+
+    - 内存：LRU，进程内复用
+    - 磁盘：每条结果一个JSON文件，记录HTML和首次高亮耗时（用于估算节省时间）；
+      命中时更新文件的修改时间，写入时定期按条目数和保留天数删除最久未使用的条目
+    """
+
+    def __init__(self, cache_dir: Optional[Path] = None, persist: bool = True, max_memory_entries: int = 4096,
+                 max_disk_entries: int = DISK_MAX_ENTRIES, max_disk_age_days: float = DISK_MAX_AGE_DAYS):
+        self.cache_dir = Path(cache_dir) if cache_dir else CACHE_DIR / 'highlight'
+        self.persist = persist
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.max_disk_age_days = max_disk_age_days
+        self._memory: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        # 距离上次清理磁盘缓存的写入次数（初始即达到间隔：进程内第一次写入时清理）
+        self._writes_since_prune = PRUNE_EVERY_WRITES
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.highlight_time = 0.0
+        self.saved_time = 0.0
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f'{key}.json'
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+
+        if entry is None and self.persist:
+            path = self._path(key)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                entry = (data['html'], float(data.get('cost', 0.0)))
+            except (OSError, ValueError, KeyError, TypeError):
+                entry = None
+            if entry is not None:
+                self._remember(key, entry)
+                # 修改时间即最近使用时间，清理时保留常用的条目
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+
+        if entry is None:
+            return None
+
+        with self._lock:
+            self.hits += 1
+            self.saved_time += entry[1]
+        return entry[0]
+
+    def put(self, key: str, html: str, cost: float) -> None:
+        with self._lock:
+            self.misses += 1
+            self.highlight_time += cost
+        self._remember(key, (html, cost))
+
+        if self.persist:
+            try:
+                atomic_write_text(self._path(key), json.dumps({'html': html, 'cost': cost}, ensure_ascii=False))
+            except OSError:
+                # 缓存目录不可写时仅使用内存缓存
+                return
+            with self._lock:
+                self._writes_since_prune += 1
+                due = self._writes_since_prune >= PRUNE_EVERY_WRITES
+                if due:
+                    self._writes_since_prune = 0
+            if due:
+                self.prune()
+
+    def prune(self) -> int:
+        """删除超过保留天数的磁盘条目，条目数仍超过上限时再删除最久未使用的，返回删除的条目数"""
+        entries = []
+        try:
+            shards = [entry.path for entry in os.scandir(self.cache_dir) if entry.is_dir()]
+        except OSError:
+            return 0
+        for shard in shards:
+            try:
+                with os.scandir(shard) as it:
+                    for entry in it:
+                        if entry.name.endswith('.json'):
+                            entries.append((entry.stat().st_mtime, entry.path))
+            except OSError:
+                continue
+
+        entries.sort()
+        deadline = time.time() - self.max_disk_age_days * 86400
+        excess = len(entries) - self.max_disk_entries
+        removed = 0
+        for i, (mtime, path) in enumerate(entries):
+            if i >= excess and mtime >= deadline:
+                break
+            try:
+                os.unlink(path)
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def _remember(self, key: str, entry: tuple) -> None:
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中率和耗时统计"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+            'highlight_time': self.highlight_time,
+            'saved_time': self.saved_time,
+        }
+
+    def format_stats(self) -> str:
+        stats = self.stats()
+        return (f"代码高亮缓存: 命中 {stats['hits']}，未命中 {stats['misses']}，"
+                f"命中率 {stats['hit_ratio'] * 100:.1f}%，高亮耗时 {stats['highlight_time']:.3f}s，"
+                f"节省约 {stats['saved_time']:.3f}s")
+
+
+# 全局共享的高亮缓存
+highlight_cache = HighlightCache()
+
+
+# 微信代码块中的字符替换：空白必须写成 &nbsp;（换行在分行时单独处理）
+_WECHAT_ESCAPE = str.maketrans({
+    '&': '&amp;',
+    '<': '&lt;',
+    '>': '&gt;',
+    '"': '&quot;',
+    ' ': '&nbsp;',
+    '\t': '&nbsp;' * 4,
+})
+
+# (Pygments样式类, 词法单元类型) -> span 的 style（空字符串表示使用代码块默认颜色）
+_token_styles: Dict[tuple, str] = {}
+
+
+class WeChatCodeFormatter(Formatter):
+    """
+    输出微信编辑器可保留的代码块：<section> + <div>，空格写为 &nbsp;，换行写为 <br>，
+    高亮颜色写入 <span style="...">（微信会删除 <pre>/<code> 中的空白，也不保留CSS类）
+
+    与 convert-code-blocks.py 的结果等价，但直接由词法单元生成，无需再扫描整篇HTML。
+
+    额外选项：
+        container_style: 外层 <section> 的 style
+        code_style: 内层 <div> 的 style
+        lang_str / lang_prefix: 由 CodeHilite 传入，语言写入 data-lang
+    """
+
+    name = 'WeChat'
+    aliases = ['wechat']
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.container_style = options.get('container_style', '')
+        self.code_style = options.get('code_style', '')
+        lang_str = options.get('lang_str', '')
+        prefix = options.get('lang_prefix', 'language-')
+        self.lang = lang_str[len(prefix):] if lang_str.startswith(prefix) else lang_str
+
+    def _declarations(self, ttype) -> str:
+        token_style = self.style.style_for_token(ttype)
+        declarations = []
+        if token_style['color']:
+            declarations.append(f"color: #{token_style['color']}")
+        if token_style['bold']:
+            declarations.append('font-weight: bold')
+        if token_style['italic']:
+            declarations.append('font-style: italic')
+        if token_style['underline']:
+            declarations.append('text-decoration: underline')
+        return '; '.join(declarations)
+
+    def _token_style(self, ttype) -> str:
+        key = (self.style, ttype)
+        css = _token_styles.get(key)
+        if css is None:
+            css = self._declarations(ttype)
+            # 与普通文本相同的样式不输出span（颜色由外层容器继承）
+            if css == self._declarations(Token):
+                css = ''
+            _token_styles[key] = css
+        return css
+
+    def format_unencoded(self, tokensource, outfile) -> None:
+        lines: List[List[str]] = [[]]
+        current = lines[0]
+        pending_style, pending = '', []
+
+        def flush():
+            if pending:
+                text = ''.join(pending)
+                current.append(f'<span style="{pending_style}">{text}</span>' if pending_style else text)
+                pending.clear()
+
+        for ttype, value in tokensource:
+            css = self._token_style(ttype)
+            parts = value.translate(_WECHAT_ESCAPE).split('\n')
+            for index, part in enumerate(parts):
+                if index:
+                    # span 不跨行，换行时结束当前span
+                    flush()
+                    current = []
+                    lines.append(current)
+                if part:
+                    if css != pending_style:
+                        flush()
+                        pending_style = css
+                    pending.append(part)
+        flush()
+
+        # Pygments 会在末尾补一个换行
+        while len(lines) > 1 and not lines[-1]:
+            lines.pop()
+
+        lang_attr = f' data-lang="{self.lang}"' if self.lang else ''
+        body = '<br>\n'.join(''.join(line) for line in lines)
+        outfile.write(f'<section{lang_attr} style="{self.container_style}">'
+                      f'<div style="{self.code_style}">{body}</div></section>\n')
+
+
+class CodeHighlighter:
+    """
+    使用 CodeHilite 高亮代码并缓存结果
+
+    Args:
+        config: codehilite 扩展配置（linenums、guess_lang、noclasses 等）
+        cache: 高亮缓存（None 表示不缓存）
+        guess_candidates: 未标注语言时只在这些语言中猜测（None 表示使用 Pygments 全量猜测）
+    """
+
+    def __init__(self, config: Dict[str, Any], cache: Optional[HighlightCache] = highlight_cache,
+                 guess_candidates: Optional[Sequence[str]] = None):
+        self.config = CodeHiliteExtension(**config).getConfigs()
+        self.cache = cache
+        self.guess_candidates = list(guess_candidates) if guess_candidates else None
+        self._candidate_lexers = None
+
+    def _guess_from_candidates(self, src: str) -> str:
+        """在候选语言中按 analyse_text 评分选择，全部为0时按纯文本处理"""
+        if self._candidate_lexers is None:
+            from pygments.lexers import find_lexer_class_by_name
+            from pygments.util import ClassNotFound
+
+            lexers = []
+            for name in self.guess_candidates:
+                try:
+                    lexers.append(find_lexer_class_by_name(name))
+                except ClassNotFound:
+                    continue
+            self._candidate_lexers = lexers
+
+        best, best_score = 'text', 0.0
+        for lexer in self._candidate_lexers:
+            score = lexer.analyse_text(src)
+            if score > best_score:
+                best, best_score = lexer.aliases[0], score
+        return best
+
+    def _cache_key(self, src: str, lang: Optional[str], shebang: bool, options: Dict[str, Any]) -> str:
+        def encode(value):
+            return value if isinstance(value, (str, int, float, bool, type(None), list)) else \
+                f'{getattr(value, "__module__", "")}.{getattr(value, "__qualname__", repr(value))}'
+
+        payload = json.dumps({
+            'src': src,
+            'lang': lang,
+            'shebang': shebang,
+            'options': sorted((k, encode(v)) for k, v in options.items()),
+            'pygments': pygments.__version__,
+        }, ensure_ascii=False)
+        return sha256_text(payload)
+
+    def hilite(self, src: str, lang: Optional[str] = None, shebang: bool = True, **extra) -> str:
+        """返回与 CodeHilite(src, ...).hilite(shebang) 相同的HTML"""
+        options = dict(self.config)
+        options.update(extra)
+
+        if lang is None and self.guess_candidates and options.get('guess_lang', True):
+            first_line = src.strip('\n').split('\n', 1)[0]
+            if not (shebang and _SHEBANG_RE.match(first_line)):
+                lang = self._guess_from_candidates(src)
+                options['guess_lang'] = False
+
+        key = self._cache_key(src, lang, shebang, options) if self.cache is not None else None
+        if key is not None:
+            html = self.cache.get(key)
+            if html is not None:
+                return html
+
+        start = time.perf_counter()
+        style = options.pop('pygments_style', 'default')
+        html = CodeHilite(src, lang=lang, style=style, **options).hilite(shebang=shebang)
+        if key is not None:
+            self.cache.put(key, html, time.perf_counter() - start)
+        return html
+
+
+class CachedFencedBlockPreprocessor(FencedBlockPreprocessor):
+    """
+    围栏代码预处理器：由父类提取代码块并存入 htmlStash，再用 CodeHighlighter 替换为高亮结果
+
+    带 {attrs} 或 hl_lines 的代码块需要逐块配置，交给父类按 codehilite 原逻辑处理（不缓存）。
+    """
+
+    def __init__(self, md, config: Dict[str, Any], highlighter: CodeHighlighter):
+        super().__init__(md, config)
+        self.highlighter = highlighter
+        prefix = re.escape(self.config.get('lang_prefix', 'language-'))
+        self._plain_re = re.compile(rf'^<pre><code(?: class="{prefix}([^"]*)")?>(.*)</code></pre>$', re.DOTALL)
+
+    def run(self, lines: List[str]) -> List[str]:
+        if not self.checked_for_deps:
+            for ext in self.md.registeredExtensions:
+                if isinstance(ext, AttrListExtension):
+                    self.use_attr_list = True
+            self.checked_for_deps = True
+
+        text = '\n'.join(lines)
+        if any(m.group('attrs') or m.group('hl_lines') for m in self.FENCED_BLOCK_RE.finditer(text)):
+            self.codehilite_conf = self.highlighter.config
+            try:
+                return super().run(lines)
+            finally:
+                self.codehilite_conf = {}
+
+        stash = self.md.htmlStash.rawHtmlBlocks
+        start = len(stash)
+        result = super().run(lines)
+        for index in range(start, len(stash)):
+            match = self._plain_re.match(stash[index])
+            if not match:
+                continue
+            lang = _unescape(match.group(1)) if match.group(1) else None
+            stash[index] = self.highlighter.hilite(_unescape(match.group(2)), lang=lang, shebang=False)
+        return result
+
+
+class CachedHiliteTreeprocessor(HiliteTreeprocessor):
+    """缩进代码块高亮（与 HiliteTreeprocessor 相同，但经过 CodeHighlighter 缓存）"""
+
+    def __init__(self, md, highlighter: CodeHighlighter):
+        super().__init__(md)
+        self.highlighter = highlighter
+        self.config = highlighter.config
+
+    def run(self, root) -> None:
+        for block in root.iter('pre'):
+            if len(block) == 1 and block[0].tag == 'code':
+                text = block[0].text
+                if text is None:
+                    continue
+                html = self.highlighter.hilite(self.code_unescape(text), tab_length=self.md.tab_length)
+                placeholder = self.md.htmlStash.store(html)
+                # Clear code block in `etree` instance
+                block.clear()
+                # Change to `p` element which will later
+                # be removed when inserting raw html
+                block.tag = 'p'
+                block.text = placeholder
+
+
+class _TracedHighlighter:
+    """为每次高亮记录一个 highlight 阶段（trace 为 ConversionTrace）"""
+
+    def __init__(self, highlighter: CodeHighlighter, trace):
+        self.highlighter = highlighter
+        self.config = highlighter.config
+        self.trace = trace
+
+    def hilite(self, src: str, lang: Optional[str] = None, shebang: bool = True, **extra) -> str:
+        with self.trace.span('highlight', lang=lang or '', chars=len(src)):
+            return self.highlighter.hilite(src, lang=lang, shebang=shebang, **extra)
+
+
+class CachedCodeHiliteExtension(Extension):
+    """
+    替代 markdown.extensions.codehilite 的扩展（需放在 fenced_code 之后注册）
+
+    Args:
+        highlighter: 共享的 CodeHighlighter
+        trace: 追踪记录（可选），每个代码块的高亮记录为一个阶段
+    """
+
+    def __init__(self, highlighter: CodeHighlighter, trace=None, **kwargs):
+        self.highlighter = _TracedHighlighter(highlighter, trace) if trace is not None else highlighter
+        super().__init__(**kwargs)
+
+    def extendMarkdown(self, md):
+        if 'fenced_code_block' in md.preprocessors:
+            fenced_config = md.preprocessors['fenced_code_block'].config
+            md.preprocessors.register(
+                CachedFencedBlockPreprocessor(md, fenced_config, self.highlighter), 'fenced_code_block', 25)
+        md.treeprocessors.register(CachedHiliteTreeprocessor(md, self.highlighter), 'hilite', 30)
+        md.registerExtension(self)
+
+
+def parse_guess_lang(value: Union[bool, str, Sequence[str], None]):
+    """
+    解析语言猜测配置
+
+    Returns:
+        (guess_lang布尔值, 候选语言列表或None)
+    """
+    if value is None or value is True:
+        return True, None
+    if value is False:
+        return False, None
+    if isinstance(value, str):
+        value = [name.strip() for name in value.split(',') if name.strip()]
+    return True, list(value) or None
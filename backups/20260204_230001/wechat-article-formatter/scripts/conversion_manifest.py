@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Conversion Manifest
+批量转换的增量清单：记录每个输入文件的内容哈希、主题哈希、转换器版本和输出哈希，
+再次运行时跳过未变化的文件
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from formatter_cache import atomic_write_text, sha256_file
+
+
+class ConversionManifest:
+    """
+    增量转换清单（JSON文件）
+
+    整个清单在启动时载入内存、保存时整体写回，记录数与文件总数成正比（每条约几百字节）；
+    文件数达到数百万时应改用按需查询的存储（如 SQLite）
+    """
+
+    FILE_NAME = '.wechat-convert-manifest.json'
+    FORMAT_VERSION = 1
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.root = self.path.parent
+        self.entries: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.load()
+
+    def load(self) -> None:
+        """读取清单文件（不存在或损坏时视为空清单）"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if data.get('format') == self.FORMAT_VERSION:
+            self.entries = data.get('files', {})
+
+    def save(self) -> None:
+        """原子写回清单文件（无变化时不写）"""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {'format': self.FORMAT_VERSION, 'files': self.entries}
+            atomic_write_text(self.path, json.dumps(data, ensure_ascii=False, indent=2, sort_keys=True))
+            self._dirty = False
+
+    def _key(self, input_file: Path) -> str:
+        """清单中的键：相对清单所在目录的路径（便于整体移动目录）"""
+        return Path(os.path.relpath(Path(input_file).resolve(), self.root.resolve())).as_posix()
+
+    def relative_path(self, path: Path) -> str:
+        """相对清单所在目录的路径（用于在记录中保存其他文件的位置）"""
+        return self._key(path)
+
+    def resolve(self, relative: str) -> Path:
+        """将记录中的相对路径还原为实际路径"""
+        return self.root / relative
+
+    def get(self, input_file: Path) -> Optional[dict]:
+        with self._lock:
+            return self.entries.get(self._key(input_file))
+
+    def is_up_to_date(self, input_file: Path, output_file: Path, input_hash: str,
+                      theme_hash: str, converter_version: str) -> bool:
+        """判断输入、主题、转换器版本和输出文件是否都与上次转换一致"""
+        entry = self.get(input_file)
+        if not entry:
+            return False
+        if (entry.get('input_hash') != input_hash
+                or entry.get('theme_hash') != theme_hash
+                or entry.get('converter_version') != converter_version):
+            return False
+
+        output_file = Path(output_file)
+        if entry.get('output') != self._key(output_file) or not output_file.exists():
+            return False
+        try:
+            return sha256_file(output_file) == entry.get('output_hash')
+        except OSError:
+            return False
+
+    def record(self, input_file: Path, output_file: Path, input_hash: str, theme: str,
+               theme_hash: str, converter_version: str, **extra) -> None:
+        """记录一次成功转换"""
+        entry = {
+            'input_hash': input_hash,
+            'theme': theme,
+            'theme_hash': theme_hash,
+            'converter_version': converter_version,
+            'output': self._key(output_file),
+            'output_hash': sha256_file(output_file),
+        }
+        entry.update(extra)
+        with self._lock:
+            self.entries[self._key(input_file)] = entry
+            self._dirty = True
+
+    def forget(self, input_file: Path) -> None:
+        """移除某个文件的记录（例如转换失败时）"""
+        with self._lock:
+            if self.entries.pop(self._key(input_file), None) is not None:
+                self._dirty = True
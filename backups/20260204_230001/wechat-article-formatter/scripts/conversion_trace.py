@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Conversion Trace
+转换过程的分阶段追踪：记录每个阶段的墙钟/CPU耗时、元素计数和输入输出字节数，
+可通过回调以类似 OpenTelemetry span 的形式逐个输出
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+
+class Span:
+    """一个阶段的执行记录"""
+
+    __slots__ = ('span_id', 'parent_id', 'name', 'start_ns', 'end_ns', 'cpu', 'children_wall', 'attributes',
+                 '_perf_start')
+
+    def __init__(self, span_id: int, parent_id: Optional[int], name: str, attributes: dict):
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.name = name
+        # 起止时间为Unix纳秒时间戳；时长按高精度计时器计算（time_ns 在部分平台上精度较低）
+        self.start_ns = time.time_ns()
+        self.end_ns = self.start_ns
+        self._perf_start = time.perf_counter_ns()
+        self.cpu = 0.0
+        self.children_wall = 0.0
+        self.attributes = attributes
+
+    @property
+    def wall(self) -> float:
+        """墙钟耗时（秒，含子阶段）"""
+        return (self.end_ns - self.start_ns) / 1e9
+
+    @property
+    def self_wall(self) -> float:
+        """扣除子阶段后的墙钟耗时（秒）"""
+        return max(0.0, self.wall - self.children_wall)
+
+    def to_dict(self) -> dict:
+        return {
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start_ns': self.start_ns,
+            'end_ns': self.end_ns,
+            'cpu': self.cpu,
+            'attributes': dict(self.attributes),
+        }
+
+
+class ConversionTrace:
+    """
+    一次转换的追踪记录（单线程使用，每次转换一个实例）
+
+    Args:
+        on_span: 每个阶段结束时调用的回调，参数为 Span
+    """
+
+    def __init__(self, on_span: Optional[Callable[[Span], None]] = None):
+        self.on_span = on_span
+        self.spans: List[Span] = []
+        self.counts: Dict[str, int] = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._stack: List[Span] = []
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """记录一个阶段（可嵌套，嵌套阶段的耗时不计入父阶段的 self 耗时）"""
+        parent = self._stack[-1] if self._stack else None
+        span = Span(len(self.spans) + 1, parent.span_id if parent else None, name, attributes)
+        self.spans.append(span)
+        self._stack.append(span)
+        cpu_start = time.thread_time()
+        try:
+            yield span
+        finally:
+            span.cpu = time.thread_time() - cpu_start
+            span.end_ns = span.start_ns + (time.perf_counter_ns() - span._perf_start)
+            self._stack.pop()
+            if parent is not None:
+                parent.children_wall += span.wall
+            if self.on_span is not None:
+                self.on_span(span)
+
+    def count(self, name: str, value: int) -> None:
+        """累加元素计数"""
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    @property
+    def wall(self) -> float:
+        """总墙钟耗时（秒，顶层阶段之和）"""
+        return sum(span.wall for span in self.spans if span.parent_id is None)
+
+    def stage_times(self) -> Dict[str, Dict[str, float]]:
+        """
+        按阶段名汇总（self 耗时，嵌套阶段单独统计）
+
+        Returns:
+            {阶段名: {'wall': 秒, 'cpu': 秒, 'calls': 次数}}
+        """
+        stages: Dict[str, Dict[str, float]] = {}
+        children_cpu: Dict[int, float] = {}
+        for span in self.spans:
+            if span.parent_id is not None:
+                children_cpu[span.parent_id] = children_cpu.get(span.parent_id, 0.0) + span.cpu
+        for span in self.spans:
+            stage = stages.setdefault(span.name, {'wall': 0.0, 'cpu': 0.0, 'calls': 0})
+            stage['wall'] += span.self_wall
+            stage['cpu'] += max(0.0, span.cpu - children_cpu.get(span.span_id, 0.0))
+            stage['calls'] += 1
+        return stages
+
+    def summary(self) -> dict:
+        """可序列化（可跨进程传递）的汇总结果"""
+        return {
+            'wall': self.wall,
+            'stages': self.stage_times(),
+            'counts': dict(self.counts),
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+        }
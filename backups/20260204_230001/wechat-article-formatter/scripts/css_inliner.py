@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CSS Inliner
+基于选择器索引的样式内联器：遍历一次文档，为每个元素一次性合并所有匹配规则的声明；
+合并结果按（已有style, 匹配规则）驻留共享，相同的style字符串在元素和文章之间只计算一次
+"""
+
+import re
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import soupsieve
+from bs4 import BeautifulSoup, Tag
+
+from theme_compiler import CompiledTheme
+
+# 简单复合选择器：可选标签名 + 任意个 .class / #id
+_COMPOUND_RE = re.compile(r'^([a-zA-Z][a-zA-Z0-9-]*)?((?:[.#][a-zA-Z_-][a-zA-Z0-9_-]*)*)$')
+_PART_RE = re.compile(r'([.#])([a-zA-Z_-][a-zA-Z0-9_-]*)')
+
+# 复合选择器：(标签名, 类名集合, ID)
+Compound = Tuple[Optional[str], frozenset, Optional[str]]
+
+# 合并结果缓存的条目上限（超出后整体清空，内置主题下实际条目数通常只有几十个）
+MERGE_CACHE_SIZE = 4096
+
+
+def parse_selector(selector: str) -> Optional[List[Compound]]:
+    """
+    将由后代组合器连接的简单选择器解析为复合选择器列表
+
+    Returns:
+        复合选择器列表（从左到右）；无法由索引处理的选择器返回None
+    """
+    compounds = []
+    for token in selector.split():
+        match = _COMPOUND_RE.match(token)
+        if not match:
+            return None
+        tag = match.group(1).lower() if match.group(1) else None
+        classes = []
+        element_id = None
+        for kind, name in _PART_RE.findall(match.group(2)):
+            if kind == '.':
+                classes.append(name)
+            elif element_id is None or element_id == name:
+                element_id = name
+            else:
+                # 同一元素不可能有两个不同ID
+                return None
+        compounds.append((tag, frozenset(classes), element_id))
+    return compounds or None
+
+
+def parse_style(style: str) -> Dict[str, str]:
+    """解析style属性为有序字典"""
+    style_dict = {}
+    for item in style.split(';'):
+        if ':' in item:
+            key, value = item.split(':', 1)
+            style_dict[key.strip()] = value.strip()
+    return style_dict
+
+
+def serialize_style(style_dict: Dict[str, str]) -> str:
+    """将样式字典序列化为style属性值"""
+    return '; '.join(f'{k}: {v}' for k, v in style_dict.items())
+
+
+def _compound_matches(elem: Tag, compound: Compound) -> bool:
+    tag, classes, element_id = compound
+    if tag is not None and elem.name != tag:
+        return False
+    if element_id is not None and elem.get('id') != element_id:
+        return False
+    if classes:
+        elem_classes = elem.get('class') or ()
+        if not classes.issubset(elem_classes):
+            return False
+    return True
+
+
+class StyleInliner:
+    """
+    预编译的样式内联器
+
+    按最右侧复合选择器的标签、类、ID建立规则索引，遍历文档一次，
+    对每个元素找出候选规则、校验后代关系，按主题中的规则顺序合并声明，
+    结果与逐条规则调用 soup.select() 的旧实现逐字节一致。
+    """
+
+    _instances: Dict[str, 'StyleInliner'] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, theme: CompiledTheme):
+        self.theme = theme
+        # (规则序号, 复合选择器链, 声明项, 声明中是否含分号)
+        self.rules: List[Tuple[int, List[Compound], Tuple[Tuple[str, str], ...], bool]] = []
+        # 无法由索引处理、但soupsieve可以处理的规则
+        self.fallback_rules: List[Tuple[int, object]] = []
+
+        self.by_id: Dict[str, List[int]] = {}
+        self.by_class: Dict[str, List[int]] = {}
+        self.by_tag: Dict[str, List[int]] = {}
+
+        # (标签名, ID, 类名) -> 候选规则序号（只与元素自身有关，可在文章之间复用）
+        self._candidates: Dict[Tuple, Tuple[int, ...]] = {}
+        # (已有style, 匹配规则序号) -> 驻留的style字符串；元素之间共享同一个不可变字符串，
+        # 元素已有style时以其内容作为键的一部分，相当于写时复制
+        self._merged: Dict[Tuple[str, Tuple[int, ...]], str] = {}
+        self.merge_hits = 0
+        self.merge_misses = 0
+
+        for order, (selector, styles) in enumerate(theme.inline_plan):
+            items = tuple(styles.items())
+            has_semicolon = any(';' in value for _, value in items)
+            try:
+                matcher = soupsieve.compile(selector)
+            except Exception:
+                # 忽略无法处理的选择器
+                self.rules.append((order, [], (), False))
+                continue
+
+            chain = parse_selector(selector)
+            self.rules.append((order, chain or [], items, has_semicolon))
+            if chain is None:
+                self.fallback_rules.append((order, matcher))
+                continue
+
+            tag, classes, element_id = chain[-1]
+            if element_id is not None:
+                self.by_id.setdefault(element_id, []).append(order)
+            elif classes:
+                # 任选一个类名作为索引键，其余条件在匹配时校验
+                self.by_class.setdefault(min(classes), []).append(order)
+            else:
+                self.by_tag.setdefault(tag, []).append(order)
+
+    @classmethod
+    def for_theme(cls, theme: CompiledTheme) -> 'StyleInliner':
+        """获取主题对应的内联器（按主题内容哈希共享）"""
+        with cls._instances_lock:
+            inliner = cls._instances.get(theme.css_hash)
+            if inliner is None:
+                inliner = cls(theme)
+                cls._instances[theme.css_hash] = inliner
+            return inliner
+
+    def _candidate_rules(self, elem: Tag) -> Tuple[int, ...]:
+        element_id = elem.get('id')
+        classes = elem.get('class') or ()
+        key = (elem.name, element_id, tuple(classes))
+        candidates = self._candidates.get(key)
+        if candidates is not None:
+            return candidates
+
+        found = list(self.by_tag.get(elem.name, ()))
+        if element_id is not None and element_id in self.by_id:
+            found.extend(self.by_id[element_id])
+        for cls in classes:
+            if cls in self.by_class:
+                found.extend(self.by_class[cls])
+        # 去重并按主题中的规则顺序排列
+        candidates = tuple(sorted(set(found)))
+        if len(self._candidates) >= MERGE_CACHE_SIZE:
+            self._candidates.clear()
+        self._candidates[key] = candidates
+        return candidates
+
+    def merged_style(self, existing_style: str, matched: Tuple[int, ...]) -> str:
+        """
+        按规则顺序将匹配规则的声明合并到已有style中（不覆盖已有样式）
+
+        Args:
+            existing_style: 元素原有的style属性（没有时为空字符串）
+            matched: 按规则顺序排列、去重后的规则序号
+
+        Returns:
+            驻留的style字符串，相同输入返回同一个对象
+        """
+        key = (existing_style, matched)
+        style = self._merged.get(key)
+        if style is not None:
+            self.merge_hits += 1
+            return style
+
+        self.merge_misses += 1
+        style_dict = parse_style(existing_style) if existing_style else {}
+        for order in matched:
+            _, _, items, has_semicolon = self.rules[order]
+            for prop, value in items:
+                if prop not in style_dict:
+                    style_dict[prop] = value
+            if has_semicolon:
+                # 与旧实现一致：每条规则写回后都会重新解析style字符串
+                style_dict = parse_style(serialize_style(style_dict))
+
+        style = sys.intern(serialize_style(style_dict))
+        if len(self._merged) >= MERGE_CACHE_SIZE:
+            self._merged.clear()
+        self._merged[key] = style
+        return style
+
+    def cache_info(self) -> Dict[str, int]:
+        """合并缓存统计"""
+        return {
+            'hits': self.merge_hits,
+            'misses': self.merge_misses,
+            'entries': len(self._merged),
+            'candidate_keys': len(self._candidates),
+        }
+
+    def _chain_matches(self, elem: Tag, chain: List[Compound]) -> bool:
+        if not _compound_matches(elem, chain[-1]):
+            return False
+        # 后代组合器：从右向左依次寻找最近的匹配祖先
+        ancestor = elem.parent
+        for compound in reversed(chain[:-1]):
+            while ancestor is not None and not isinstance(ancestor, BeautifulSoup):
+                if _compound_matches(ancestor, compound):
+                    break
+                ancestor = ancestor.parent
+            else:
+                return False
+            ancestor = ancestor.parent
+        return True
+
+    def apply(self, soup: BeautifulSoup) -> int:
+        """
+        将主题样式内联到整棵DOM树
+
+        Returns:
+            被写入style属性的元素数量
+        """
+        assignments = self.plan(soup)
+        for elem, style in assignments:
+            elem['style'] = style
+        return len(assignments)
+
+    @contextmanager
+    def applied(self, soup: BeautifulSoup):
+        """
+        临时内联样式，退出时恢复各元素原有的style属性（用于在同一棵树上依次应用多个主题）
+
+        Yields:
+            被写入style属性的元素数量
+        """
+        assignments = self.plan(soup)
+        originals = [elem.get('style') for elem, _ in assignments]
+        for elem, style in assignments:
+            elem['style'] = style
+        try:
+            yield len(assignments)
+        finally:
+            for (elem, _), original in zip(assignments, originals):
+                if original is None:
+                    del elem['style']
+                else:
+                    elem['style'] = original
+
+    def plan(self, soup: BeautifulSoup) -> List[Tuple[Tag, str]]:
+        """
+        计算内联后每个元素的style属性（不修改DOM树）
+
+        Returns:
+            [(元素, style)]，按文档顺序排列
+        """
+        # 回退规则：每条规则对整篇文档执行一次soupsieve查询（内置主题中没有此类规则）
+        fallback_matches: Dict[int, List[int]] = {}
+        for order, matcher in self.fallback_rules:
+            try:
+                elements = matcher.select(soup)
+            except Exception:
+                continue
+            for elem in elements:
+                fallback_matches.setdefault(id(elem), []).append(order)
+
+        rules = self.rules
+        assignments = []
+        for elem in soup.find_all(True):
+            matched = tuple(
+                order for order in self._candidate_rules(elem)
+                if self._chain_matches(elem, rules[order][1])
+            )
+            if fallback_matches and id(elem) in fallback_matches:
+                matched = tuple(sorted(set(matched).union(fallback_matches[id(elem)])))
+            if not matched:
+                continue
+
+            assignments.append((elem, self.merged_style(elem.get('style', ''), matched)))
+
+        return assignments
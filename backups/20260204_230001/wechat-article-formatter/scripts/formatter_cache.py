@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Formatter Cache Helpers
+格式化工具共用的本地缓存目录与原子写入工具
+"""
+
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+# 缓存根目录（可通过环境变量覆盖）
+CACHE_DIR = Path(os.environ.get(
+    'WECHAT_FORMATTER_CACHE_DIR',
+    os.path.expanduser('~/.wechat-article-formatter/cache')
+))
+
+# 进程的 umask（只能通过设置再恢复来读取，在导入时读取一次，避免与其他线程创建文件时竞争）
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+
+
+def sha256_text(text: str) -> str:
+    """计算文本的SHA-256摘要"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def sha256_file(path) -> str:
+    """计算文件内容的SHA-256摘要"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def atomic_write_text(path: Path, text: str) -> None:
+    """
+    原子写入文本文件（先写临时文件再重命名，避免并发读到半个文件）
+
+    mkstemp 创建的临时文件权限为 0600，重命名前改为目标文件原有的权限（新文件按 umask 取 0666 & ~umask），
+    与直接 open(path, 'w') 写入的结果一致
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        mode = path.stat().st_mode & 0o7777
+    except FileNotFoundError:
+        mode = 0o666 & ~_UMASK
+    fd, tmp_path = tempfile.mkstemp(dir=str(path.parent), prefix='.tmp-', suffix=path.suffix)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Formatter Client
+格式化服务的轻量客户端：优先调用常驻的 formatter_daemon，服务未运行时在进程内转换
+
+只依赖标准库，导入开销很小；只有在回退到进程内转换时才会导入 markdown/bs4/Pygments。
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import sys
+from pathlib import Path
+from typing import Optional, Tuple
+
+# 服务地址：http://host:port 或 unix:/path/to/socket
+DEFAULT_ADDRESS = os.environ.get('WECHAT_FORMATTER_DAEMON', 'http://127.0.0.1:8731')
+
+
+def parse_address(address: str) -> Tuple[str, object]:
+    """
+    解析服务地址
+
+    Returns:
+        ('unix', socket路径) 或 ('tcp', (host, port))
+    """
+    if address.startswith('unix:'):
+        return 'unix', address[len('unix:'):]
+    if address.startswith('http://'):
+        address = address[len('http://'):]
+    host, _, port = address.rstrip('/').rpartition(':')
+    return 'tcp', (host or '127.0.0.1', int(port))
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """通过Unix套接字发送HTTP请求"""
+
+    def __init__(self, path: str, timeout: float):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class DaemonUnavailable(Exception):
+    """格式化服务未运行、无法连接、响应异常（非JSON或5xx），或转换器版本与本地不一致"""
+
+
+class FormatterClient:
+    """
+    格式化客户端
+
+    Args:
+        address: 服务地址（默认读取环境变量 WECHAT_FORMATTER_DAEMON）
+        timeout: 请求超时（秒）
+        fallback: 服务不可用时是否在进程内转换
+    """
+
+    def __init__(self, address: Optional[str] = None, timeout: float = 60.0, fallback: bool = True):
+        self.address = address or DEFAULT_ADDRESS
+        self.timeout = timeout
+        self.fallback = fallback
+        self._converters = {}
+        # 服务的转换器版本是否与本地一致（None 表示尚未确认）
+        self._version_ok: Optional[bool] = None
+        # 最近一次转换是否由常驻服务完成
+        self.last_backend = None
+
+    def _connection(self) -> http.client.HTTPConnection:
+        kind, target = parse_address(self.address)
+        if kind == 'unix':
+            return UnixHTTPConnection(target, self.timeout)
+        host, port = target
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def _request(self, method: str, path: str, payload: Optional[dict] = None) -> dict:
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8') if payload is not None else None
+        try:
+            conn = self._connection()
+            try:
+                conn.request(method, path, body=body, headers={'Content-Type': 'application/json'})
+                response = conn.getresponse()
+                raw = response.read()
+            finally:
+                conn.close()
+        except (ConnectionError, FileNotFoundError, socket.timeout, OSError, http.client.HTTPException) as e:
+            raise DaemonUnavailable(str(e)) from e
+
+        # 地址上可能是其他服务：无法解析的响应按服务不可用处理
+        try:
+            data = json.loads(raw.decode('utf-8'))
+        except ValueError as e:
+            raise DaemonUnavailable(f'{self.address} 返回的不是格式化服务的响应: {e}') from e
+        if not isinstance(data, dict):
+            raise DaemonUnavailable(f'{self.address} 返回的不是格式化服务的响应')
+
+        if response.status >= 500:
+            raise DaemonUnavailable(data.get('error', f'HTTP {response.status}'))
+        if response.status != 200:
+            raise RuntimeError(data.get('error', f'HTTP {response.status}'))
+        return data
+
+    def _check_version(self) -> None:
+        """首次使用服务前确认其转换器版本与本地一致，避免未重启的旧服务输出过时的结果"""
+        if self._version_ok:
+            return
+        if self._version_ok is False:
+            raise DaemonUnavailable('格式化服务的转换器版本与本地不一致')
+
+        # markdown_to_html 的重量级依赖按需导入，这里只读取版本号
+        from markdown_to_html import CONVERTER_VERSION
+
+        try:
+            version = self._request('GET', '/health').get('converter_version')
+        except RuntimeError as e:
+            raise DaemonUnavailable(str(e)) from e
+        self._version_ok = version == CONVERTER_VERSION
+        if not self._version_ok:
+            print(f'[WARN] 格式化服务的转换器版本（{version}）与本地（{CONVERTER_VERSION}）不一致，'
+                  f'改为进程内转换；请重启 formatter_daemon.py', file=sys.stderr)
+            raise DaemonUnavailable('格式化服务的转换器版本与本地不一致')
+
+    def ping(self) -> Optional[dict]:
+        """返回服务状态，未运行时返回None"""
+        try:
+            return self._request('GET', '/health')
+        except (DaemonUnavailable, RuntimeError, ValueError):
+            return None
+
+    def _local_convert(self, markdown_text: str, theme: str) -> str:
+        converter = self._converters.get(theme)
+        if converter is None:
+            from markdown_to_html import WeChatHTMLConverter
+
+            converter = self._converters[theme] = WeChatHTMLConverter(theme=theme)
+        return converter.convert(markdown_text)
+
+    def convert(self, markdown_text: str, theme: str = 'tech') -> str:
+        """转换Markdown为完整HTML文档"""
+        try:
+            self._check_version()
+            html = self._request('POST', '/convert', {'markdown': markdown_text, 'theme': theme})['html']
+            self.last_backend = 'daemon'
+            return html
+        except DaemonUnavailable:
+            if not self.fallback:
+                raise
+
+        self.last_backend = 'local'
+        return self._local_convert(markdown_text, theme)
+
+    def convert_file(self, input_file: str, output_file: Optional[str] = None, theme: str = 'tech') -> str:
+        """转换Markdown文件，返回输出文件路径（默认：与输入文件同名.html）"""
+        input_path = Path(input_file)
+        if not input_path.exists():
+            raise FileNotFoundError(f"Input file not found: {input_file}")
+
+        output_path = Path(output_file) if output_file else input_path.with_suffix('.html')
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+
+        with open(input_path, 'r', encoding='utf-8') as f:
+            html = self.convert(f.read(), theme)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(html)
+        return str(output_path)
+
+
+def convert_file(input_file: str, output_file: Optional[str] = None, theme: str = 'tech') -> str:
+    """便捷函数：使用默认客户端转换文件"""
+    return FormatterClient().convert_file(input_file, output_file, theme)
+
+
+def main():
+    """命令行入口（参数与 markdown_to_html.py 一致）"""
+    parser = argparse.ArgumentParser(
+        description='通过常驻格式化服务转换Markdown（服务未运行时在进程内转换）',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='''
+示例用法:
+  # 先启动常驻服务（只需一次）
+  python formatter_daemon.py &
+
+  # 转换文章（服务可用时无需加载markdown/Pygments等依赖）
+  python formatter_client.py --input article.md --theme minimal
+
+  # 查看服务状态
+  python formatter_client.py --status
+        '''
+    )
+    parser.add_argument('-i', '--input', help='输入的Markdown文件路径')
+    parser.add_argument('-o', '--output', help='输出的HTML文件路径（默认：与输入文件同名.html）')
+    parser.add_argument('-t', '--theme', default='tech',
+                        choices=['tech', 'minimal', 'business'],
+                        help='选择主题样式（默认：tech）')
+    parser.add_argument('--address', help=f'服务地址（默认：{DEFAULT_ADDRESS}）')
+    parser.add_argument('--no-fallback', action='store_true',
+                        help='服务不可用时直接失败，不在进程内转换')
+    parser.add_argument('--status', action='store_true', help='只查看服务状态')
+
+    args = parser.parse_args()
+    client = FormatterClient(args.address, fallback=not args.no_fallback)
+
+    if args.status:
+        status = client.ping()
+        if status is None:
+            print(f'[WARN] 格式化服务未运行: {client.address}')
+            sys.exit(1)
+        print(f'[OK] 格式化服务运行中: {client.address}')
+        print(json.dumps(status, ensure_ascii=False, indent=2))
+        return
+
+    if not args.input:
+        parser.error('需要指定 --input')
+
+    try:
+        output_path = client.convert_file(args.input, args.output, args.theme)
+        print(f'[OK] 转换成功！（{"常驻服务" if client.last_backend == "daemon" else "进程内转换"}）')
+        print(f'[INFO] 输出文件: {output_path}')
+    except Exception as e:
+        print(f'[FAIL] 转换失败: {e}', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
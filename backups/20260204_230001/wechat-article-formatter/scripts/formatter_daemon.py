@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Formatter Daemon
+常驻格式化服务：通过本地HTTP或Unix套接字提供 convert(markdown, theme)，
+主题编译结果、代码高亮缓存和已导入的依赖在多次调用之间保持常驻
+"""
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+
+from code_highlight import highlight_cache
+from formatter_client import DEFAULT_ADDRESS, parse_address
+from markdown_to_html import CONVERTER_VERSION, THEME_FILES, WeChatHTMLConverter, theme_css_path
+
+# 单个请求体的上限（字节）
+MAX_REQUEST_BYTES = 64 * 1024 * 1024
+
+
+class FormatterService:
+    """按主题复用转换器（主题文件修改后自动重建），统计请求数和耗时"""
+
+    def __init__(self):
+        # 主题 -> ((mtime, 大小), 转换器)
+        self._converters: Dict[str, Tuple[Tuple[int, int], WeChatHTMLConverter]] = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.requests = 0
+        self.convert_time = 0.0
+
+    def converter(self, theme: str) -> WeChatHTMLConverter:
+        stat = theme_css_path(theme).stat()
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._converters.get(theme)
+            if cached is not None and cached[0] == stat_key:
+                return cached[1]
+            if cached is not None:
+                print(f'[INFO] 主题文件已修改，重新加载: {theme}')
+            # 编译结果由 theme_cache 按文件状态缓存，重建转换器只需重新读取一次主题文件
+            converter = WeChatHTMLConverter(theme=theme)
+            self._converters[theme] = (stat_key, converter)
+            return converter
+
+    def convert(self, markdown_text: str, theme: str) -> str:
+        start = time.perf_counter()
+        html = self.converter(theme).convert(markdown_text)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.requests += 1
+            self.convert_time += elapsed
+        return html
+
+    def status(self) -> dict:
+        return {
+            'status': 'ok',
+            'pid': os.getpid(),
+            'converter_version': CONVERTER_VERSION,
+            'uptime': time.time() - self.started_at,
+            'themes_loaded': sorted(self._converters),
+            'requests': self.requests,
+            'convert_time': self.convert_time,
+            'highlight_cache': highlight_cache.stats(),
+        }
+
+
+class FormatterRequestHandler(BaseHTTPRequestHandler):
+    """
+    API:
+      GET  /health   服务状态
+      POST /convert  {"markdown": "...", "theme": "tech"} -> {"html": "..."}
+    """
+
+    service: FormatterService = None
+
+    def log_message(self, format, *args):
+        """静默处理访问日志"""
+        pass
+
+    def address_string(self):
+        # Unix套接字没有客户端地址
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def _send_json(self, status: int, data: dict) -> None:
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, self.service.status())
+        else:
+            self._send_json(404, {'error': f'Not found: {self.path}'})
+
+    def do_POST(self):
+        if self.path != '/convert':
+            self._send_json(404, {'error': f'Not found: {self.path}'})
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_REQUEST_BYTES:
+            self._send_json(413, {'error': f'Request too large: {length} bytes'})
+            return
+
+        try:
+            payload = json.loads(self.rfile.read(length).decode('utf-8'))
+            theme = payload.get('theme', 'tech')
+            if theme not in THEME_FILES:
+                raise ValueError(f"Unknown theme: {theme}. Available: {', '.join(THEME_FILES.keys())}")
+            html = self.service.convert(payload['markdown'], theme)
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {'error': str(e)})
+        except Exception as e:
+            self._send_json(500, {'error': str(e)})
+        else:
+            self._send_json(200, {'html': html})
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """基于Unix套接字的多线程HTTP服务器"""
+
+    daemon_threads = True
+
+
+def _unix_socket_in_use(path: str) -> bool:
+    """套接字文件是否有服务在监听（上次异常退出遗留的文件连接会被拒绝）"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(1.0)
+        sock.connect(path)
+        return True
+    except (ConnectionRefusedError, FileNotFoundError):
+        return False
+    finally:
+        sock.close()
+
+
+def create_server(address: str, service: FormatterService):
+    """根据地址创建HTTP或Unix套接字服务器"""
+    handler_class = type('BoundFormatterRequestHandler', (FormatterRequestHandler,), {'service': service})
+    kind, target = parse_address(address)
+
+    if kind == 'unix':
+        if os.path.exists(target):
+            if _unix_socket_in_use(target):
+                raise OSError(f'已有格式化服务在运行: {target}')
+            os.unlink(target)
+        server = ThreadingUnixHTTPServer(target, handler_class)
+        # 只允许当前用户访问
+        os.chmod(target, 0o600)
+        return server
+
+    host, port = target
+    if host not in ('127.0.0.1', 'localhost', '::1'):
+        print(f'[WARN] 服务监听在非本地地址 {host}，任何能访问该地址的人都可以调用', file=sys.stderr)
+    server = ThreadingHTTPServer((host, port), handler_class)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(
+        description='启动常驻格式化服务，避免每次转换都重新启动Python并导入依赖',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f'''
+示例用法:
+  # 默认监听 {DEFAULT_ADDRESS}
+  python formatter_daemon.py
+
+  # 使用Unix套接字
+  python formatter_daemon.py --address unix:/tmp/wechat-formatter.sock
+
+  # 客户端（或设置环境变量 WECHAT_FORMATTER_DAEMON 指定地址）
+  python formatter_client.py --input article.md --theme tech
+        '''
+    )
+    parser.add_argument('--address', default=DEFAULT_ADDRESS,
+                        help=f'监听地址：http://host:port 或 unix:/path（默认：{DEFAULT_ADDRESS}）')
+    parser.add_argument('--preload', default='tech',
+                        help='启动时预加载的主题（逗号分隔，all 表示全部；默认：tech）')
+
+    args = parser.parse_args()
+
+    service = FormatterService()
+    themes = list(THEME_FILES) if args.preload == 'all' else \
+        [theme.strip() for theme in args.preload.split(',') if theme.strip()]
+    for theme in themes:
+        service.converter(theme)
+
+    try:
+        server = create_server(args.address, service)
+    except OSError as e:
+        print(f'[FAIL] 无法监听 {args.address}: {e}', file=sys.stderr)
+        sys.exit(1)
+
+    kind, target = parse_address(args.address)
+    # 退出时只删除自己创建的套接字文件
+    socket_inode = os.stat(target).st_ino if kind == 'unix' else None
+
+    print(f'[OK] 格式化服务已启动: {args.address}')
+    print(f'[INFO] 已预加载主题: {", ".join(themes) or "无"}')
+    print('[INFO] 按Ctrl+C停止服务')
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('\n[INFO] 格式化服务已停止')
+    finally:
+        server.server_close()
+        if kind == 'unix':
+            try:
+                if os.stat(target).st_ino == socket_inode:
+                    os.unlink(target)
+            except FileNotFoundError:
+                pass
+
+
+if __name__ == '__main__':
+    main()
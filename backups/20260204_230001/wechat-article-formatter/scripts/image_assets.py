@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Image Assets
+批量转换的图片预处理：将文章引用的本地图片缩放到微信正文显示宽度，按内容选择合适的格式重新编码，
+写入按内容寻址的资源目录，并把HTML中的图片路径改写为资源文件；处理结果按 (源文件哈希, 处理参数) 缓存
+"""
+
+import html
+import importlib.util
+import io
+import json
+import os
+import re
+import shutil
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote
+
+from formatter_cache import CACHE_DIR, atomic_write_text, sha256_file, sha256_text
+
+# 处理逻辑版本：修改编码策略时递增，使旧缓存失效
+ASSET_VERSION = 1
+
+# 微信正文显示宽度约为 375~414pt，按 2.5~3 倍屏取 1080 像素即可保证清晰
+DEFAULT_MAX_WIDTH = 1080
+DEFAULT_QUALITY = 85
+# 微信图文消息内图片上传接口（uploadimg）只接受 1MB 以下的 jpg/png
+WECHAT_MAX_BYTES = 1024 * 1024
+# 超过大小限制时逐步降低 JPEG 质量的下限
+MIN_QUALITY = 60
+
+# 不做重新编码、原样复制的格式（动图重新编码会丢帧）
+_PASSTHROUGH_FORMATS = ('GIF',)
+_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+
+_IMG_SRC_RE = re.compile(r'(<img\b[^>]*?\bsrc=")([^"]+)(")', re.IGNORECASE)
+
+
+def pillow_available() -> bool:
+    """是否安装了 Pillow（图片预处理为可选功能）"""
+    return importlib.util.find_spec('PIL') is not None
+
+
+def is_local_src(src: str) -> bool:
+    """是否为本地图片路径（排除网络地址和 data URI）"""
+    return not re.match(r'^(?:[a-zA-Z][a-zA-Z0-9+.-]*:|//)', src)
+
+
+def find_image_sources(html_text: str) -> List[str]:
+    """按出现顺序返回HTML中引用的本地图片路径（已去重、已还原转义）"""
+    sources = []
+    for match in _IMG_SRC_RE.finditer(html_text):
+        src = html.unescape(match.group(2))
+        if is_local_src(src) and src not in sources:
+            sources.append(src)
+    return sources
+
+
+def rewrite_image_sources(html_text: str, mapping: Dict[str, str]) -> str:
+    """将HTML中的图片路径按 {原路径: 新路径} 改写"""
+    def replace(match):
+        new_src = mapping.get(html.unescape(match.group(2)))
+        if new_src is None:
+            return match.group(0)
+        return f'{match.group(1)}{html.escape(new_src)}{match.group(3)}'
+
+    return _IMG_SRC_RE.sub(replace, html_text)
+
+
+def _encode(image, image_format: str, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    if image_format == 'JPEG':
+        image.save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True)
+    elif image_format == 'WEBP':
+        image.save(buffer, 'WEBP', quality=quality, method=4)
+    else:
+        image.save(buffer, 'PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def _optimize_bytes(source: Path, options: dict) -> Tuple[bytes, str, int, int]:
+    """重新编码图片，返回 (数据, 格式, 宽, 高)"""
+    from PIL import Image, ImageOps
+
+    original = source.read_bytes()
+    with Image.open(io.BytesIO(original)) as image:
+        source_format = image.format
+        if source_format in _PASSTHROUGH_FORMATS or getattr(image, 'is_animated', False):
+            return original, source_format, image.width, image.height
+
+        image = ImageOps.exif_transpose(image)
+        resized = image.width > options['max_width']
+        if resized:
+            height = max(1, round(image.height * options['max_width'] / image.width))
+            image = image.resize((options['max_width'], height), Image.LANCZOS)
+
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        # 颜色很少的图片（截图、图表）用PNG无损压缩，照片类用有损格式
+        few_colors = image.getcolors(256) is not None
+        if has_alpha or few_colors:
+            image_format = 'PNG'
+            data = _encode(image, 'PNG', options['quality'])
+        else:
+            image_format = 'WEBP' if options.get('webp') else 'JPEG'
+            rgb = image.convert('RGB')
+            quality = options['quality']
+            data = _encode(rgb, image_format, quality)
+            while len(data) > WECHAT_MAX_BYTES and quality > MIN_QUALITY:
+                quality = max(MIN_QUALITY, quality - 5)
+                data = _encode(rgb, image_format, quality)
+            if source_format == 'PNG':
+                # 带抗锯齿文字的截图颜色数较多，但PNG往往仍比有损格式更小且更清晰
+                png = _encode(image, 'PNG', quality)
+                if len(png) <= len(data):
+                    image_format, data = 'PNG', png
+
+        # 未缩放且重新编码后没有变小：保留原图
+        if not resized and len(data) >= len(original) and source_format in ('JPEG', 'PNG'):
+            return original, source_format, image.width, image.height
+        return data, image_format, image.width, image.height
+
+
+def optimize_image(source: str, asset_dir: str, options: dict, cache_dir: Optional[str] = None) -> dict:
+    """
+    处理一张图片并写入资源目录（可在进程池中执行）
+
+    Args:
+        source: 源图片路径
+        asset_dir: 资源目录，文件名为处理结果的内容哈希
+        options: {'max_width', 'quality', 'webp'}
+        cache_dir: 缓存目录（默认：CACHE_DIR/images）
+
+    Returns:
+        {'source', 'source_hash', 'asset', 'format', 'width', 'height', 'bytes_in', 'bytes_out', 'cached'}
+    """
+    source_path = Path(source)
+    cache_root = Path(cache_dir) if cache_dir else CACHE_DIR / 'images'
+    source_hash = sha256_file(source_path)
+    key = sha256_text(json.dumps({'source': source_hash, 'options': options, 'version': ASSET_VERSION},
+                                 sort_keys=True))
+    meta_path = cache_root / key[:2] / f'{key}.json'
+
+    meta = None
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        data_path = meta_path.with_suffix('.' + _EXTENSIONS[meta['format']])
+        if not data_path.exists():
+            meta = None
+    except (OSError, ValueError, KeyError):
+        meta = None
+
+    cached = meta is not None
+    if meta is None:
+        data, image_format, width, height = _optimize_bytes(source_path, options)
+        data_path = meta_path.with_suffix('.' + _EXTENSIONS.get(image_format, 'bin'))
+        data_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = data_path.with_name(f'.tmp-{os.getpid()}-{data_path.name}')
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, data_path)
+        meta = {
+            'asset_hash': sha256_file(data_path),
+            'format': image_format,
+            'width': width,
+            'height': height,
+            'bytes_out': len(data),
+        }
+        atomic_write_text(meta_path, json.dumps(meta))
+
+    asset_name = f"{meta['asset_hash'][:16]}.{data_path.suffix.lstrip('.')}"
+    asset_path = Path(asset_dir) / asset_name
+    if not asset_path.exists():
+        asset_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = asset_path.with_name(f'.tmp-{os.getpid()}-{asset_name}')
+        shutil.copyfile(data_path, tmp_path)
+        os.replace(tmp_path, asset_path)
+
+    return {
+        'source': str(source_path),
+        'source_hash': source_hash,
+        'asset': str(asset_path),
+        'format': meta['format'],
+        'width': meta['width'],
+        'height': meta['height'],
+        'bytes_in': source_path.stat().st_size,
+        'bytes_out': meta['bytes_out'],
+        'cached': cached,
+    }
+
+
+class ImageAssetStage:
+    """
+    批量转换的图片阶段：收集所有输出HTML引用的本地图片，在进程池中并行处理（同一张图只处理一次），
+    再把各HTML中的图片路径改写为资源目录中的文件
+
+    Args:
+        asset_dir: 资源目录
+        workers: 并行进程数
+        max_width: 最大宽度（像素），更宽的图片等比缩小
+        quality: JPEG/WebP 质量
+        webp: 照片类图片输出WebP（微信图文消息内图片上传接口只接受jpg/png，默认关闭）
+    """
+
+    def __init__(self, asset_dir: Path, workers: int = 4, max_width: int = DEFAULT_MAX_WIDTH,
+                 quality: int = DEFAULT_QUALITY, webp: bool = False):
+        self.asset_dir = Path(asset_dir)
+        self.workers = workers
+        self.options = {'max_width': max_width, 'quality': quality, 'webp': webp}
+
+        # 统计信息
+        self.processed = 0
+        self.cache_hits = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.missing: List[Tuple[Path, str]] = []
+        self.failed: List[Tuple[Path, str]] = []
+
+    @property
+    def options_key(self) -> str:
+        """处理参数的简短标识（写入清单的转换器版本，参数变化时重新转换）"""
+        suffix = '-webp' if self.options['webp'] else ''
+        return f"img{ASSET_VERSION}-w{self.options['max_width']}-q{self.options['quality']}{suffix}"
+
+    def _record(self, results: Dict[Path, dict], source: Path, result: dict) -> None:
+        results[source] = result
+        self.processed += 1
+        self.cache_hits += result['cached']
+        self.bytes_in += result['bytes_in']
+        self.bytes_out += result['bytes_out']
+
+    def _optimize_all(self, sources: List[Path]) -> Dict[Path, dict]:
+        results: Dict[Path, dict] = {}
+        if self.workers <= 1 or len(sources) <= 1:
+            for source in sources:
+                try:
+                    result = optimize_image(str(source), str(self.asset_dir), self.options)
+                except Exception as e:
+                    self.failed.append((source, str(e)))
+                    continue
+                self._record(results, source, result)
+            return results
+
+        # 图片编码是CPU密集型任务，使用进程池
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(sources))) as executor:
+            futures = {
+                source: executor.submit(optimize_image, str(source), str(self.asset_dir), self.options)
+                for source in sources
+            }
+            for source, future in futures.items():
+                try:
+                    result = future.result()
+                except Exception as e:
+                    self.failed.append((source, str(e)))
+                    continue
+                self._record(results, source, result)
+        return results
+
+    def run(self, documents: List[Tuple[Path, Path]]) -> Dict[Path, List[dict]]:
+        """
+        处理一批文档引用的图片并改写HTML
+
+        Args:
+            documents: [(Markdown文件, 输出HTML文件)]，图片相对路径按Markdown文件所在目录解析
+
+        Returns:
+            {输出HTML文件: [{'src', 'source', 'source_hash', 'asset'}]}
+        """
+        references: Dict[Path, List[Tuple[str, Path]]] = {}
+        sources: List[Path] = []
+        for input_file, output_file in documents:
+            html_text = Path(output_file).read_text(encoding='utf-8')
+            refs = []
+            for src in find_image_sources(html_text):
+                source = (Path(input_file).parent / unquote(src)).resolve()
+                if not source.is_file():
+                    self.missing.append((Path(input_file), src))
+                    continue
+                refs.append((src, source))
+                if source not in sources:
+                    sources.append(source)
+            references[Path(output_file)] = refs
+
+        results = self._optimize_all(sources)
+
+        images: Dict[Path, List[dict]] = {}
+        for output_file, refs in references.items():
+            mapping = {}
+            entries = []
+            for src, source in refs:
+                result = results.get(source)
+                if result is None:
+                    continue
+                new_src = Path(os.path.relpath(result['asset'], output_file.parent)).as_posix()
+                mapping[src] = new_src
+                entries.append({'src': src, 'source': str(source),
+                                'source_hash': result['source_hash'], 'asset': result['asset']})
+            if mapping:
+                html_text = output_file.read_text(encoding='utf-8')
+                atomic_write_text(output_file, rewrite_image_sources(html_text, mapping))
+            images[output_file] = entries
+        return images
+
+    def format_stats(self) -> str:
+        saved = self.bytes_in - self.bytes_out
+        ratio = saved / self.bytes_in * 100 if self.bytes_in else 0.0
+        return (f'图片处理: {self.processed} 张（缓存命中 {self.cache_hits}），'
+                f'{self.bytes_in / 1024 / 1024:.2f} MB → {self.bytes_out / 1024 / 1024:.2f} MB，'
+                f'减少 {ratio:.1f}%')
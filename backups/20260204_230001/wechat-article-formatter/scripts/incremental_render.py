@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Incremental Renderer
+按顶层块增量渲染Markdown：只重新转换内容发生变化的块，其余块复用上次结果
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+from formatter_cache import sha256_text
+from markdown_blocks import collect_references, iter_blocks
+
+
+class IncrementalRenderer:
+    """
+    增量渲染器
+
+    每个块以内容哈希标识（相同内容出现多次时追加序号），update() 返回与上一版本相比的差异：
+    新的块顺序，以及此前不存在的块的HTML。拼接所有块得到的文档与 convert() 的结果一致。
+    """
+
+    def __init__(self, converter):
+        self.converter = converter
+        self.version = 0
+        # 当前版本的 (块标识, HTML) 列表，按文档顺序排列
+        self.blocks: List[Tuple[str, str]] = []
+        self._cache: Dict[str, str] = {}
+        self._suffix = ''
+
+    def update(self, markdown_text: str) -> Optional[dict]:
+        """
+        渲染新版本的Markdown
+
+        Returns:
+            无变化时返回None，否则返回差异：
+            {'version', 'order': 块标识列表, 'blocks': {新块标识: HTML}, 'rendered': 重新转换的块数, 'total': 总块数}
+        """
+        lines = markdown_text.splitlines(keepends=True)
+
+        # 引用式链接定义附加到每个块；定义变化时所有块都需要重新转换
+        references = collect_references(lines)
+        suffix = '\n\n' + '\n'.join(references) + '\n' if references else ''
+        if suffix != self._suffix:
+            self._cache.clear()
+            self._suffix = suffix
+
+        cache: Dict[str, str] = {}
+        counts: Dict[str, int] = {}
+        blocks: List[Tuple[str, str]] = []
+        rendered = 0
+
+        for block in iter_blocks(lines):
+            digest = sha256_text(block)[:16]
+            if digest in cache:
+                html = cache[digest]
+            elif digest in self._cache:
+                html = self._cache[digest]
+            else:
+                html = self.converter.convert_fragment(block + suffix)
+                rendered += 1
+            cache[digest] = html
+
+            index = counts.get(digest, 0)
+            counts[digest] = index + 1
+            if html:
+                blocks.append((f'{digest}-{index}', html))
+
+        # 只保留当前文档中的块，避免缓存无限增长
+        self._cache = cache
+
+        order = [key for key, _ in blocks]
+        if order == [key for key, _ in self.blocks]:
+            return None
+
+        previous = {key for key, _ in self.blocks}
+        self.blocks = blocks
+        self.version += 1
+        return {
+            'version': self.version,
+            'order': order,
+            'blocks': {key: html for key, html in blocks if key not in previous},
+            'rendered': rendered,
+            'total': len(blocks),
+        }
+
+    def snapshot(self) -> dict:
+        """返回当前版本的完整内容（格式与 update() 的差异相同）"""
+        return {
+            'version': self.version,
+            'order': [key for key, _ in self.blocks],
+            'blocks': dict(self.blocks),
+            'rendered': 0,
+            'total': len(self.blocks),
+        }
+
+    def body_html(self) -> str:
+        """当前版本的正文HTML"""
+        return '\n'.join(html for _, html in self.blocks)
+
+    def document(self) -> str:
+        """当前版本的完整HTML文档（与 converter.convert() 输出一致）"""
+        return self.converter._wrap_html(self.body_html())
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Markdown Block Splitter
+按顶层块（标题、段落、围栏代码、表格等）切分Markdown，用于流式转换和增量预览
+"""
+
+import re
+from typing import Iterable, Iterator, List
+
+# 围栏代码起止行（与 python-markdown 的 fenced_code 一致：行首三个以上 ` 或 ~）
+FENCE_RE = re.compile(r'^(`{3,}|~{3,})')
+# 引用式链接定义：[id]: url
+REFERENCE_RE = re.compile(r'^ {0,3}\[[^\]]+\]:\s*\S')
+# 可能是上一个块延续的行（缩进、列表项、引用、表格），不能在其前面切分
+CONTINUATION_RE = re.compile(r'^(\s|[-*+]\s|\d+[.)]\s|>|\|)')
+# 原始HTML块的起始标签
+HTML_BLOCK_RE = re.compile(r'^<([a-zA-Z][a-zA-Z0-9]*)')
+# 无需闭合的HTML标签
+VOID_TAGS = {'area', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'wbr'}
+
+
+def iter_blocks(lines: Iterable[str]) -> Iterator[str]:
+    """
+    将Markdown行切分为可独立转换的顶层块
+
+    只在围栏代码和原始HTML块之外的空行处切分，且下一行必须是标题、围栏代码
+    或普通段落（列表、引用、表格、缩进内容可能属于上一个块，不在其前面切分）。
+    每个块保留原始换行符，块与块按顺序拼接即为原文。
+    """
+    block: List[str] = []
+    fence = None
+    html_tag = None
+    pending_blank = False
+
+    for line in lines:
+        stripped = line.rstrip('\r\n')
+
+        if fence is not None:
+            block.append(line)
+            if stripped.rstrip(' ') == fence:
+                fence = None
+            continue
+
+        if not stripped.strip():
+            block.append(line)
+            if html_tag is None:
+                pending_blank = True
+            continue
+
+        if pending_blank and html_tag is None and not CONTINUATION_RE.match(stripped):
+            if any(item.strip() for item in block):
+                yield ''.join(block)
+                block = []
+        pending_blank = False
+        block.append(line)
+
+        fence_match = FENCE_RE.match(stripped)
+        if fence_match:
+            fence = fence_match.group(1)
+            continue
+
+        if html_tag is None:
+            html_match = HTML_BLOCK_RE.match(stripped)
+            if html_match and len(block) - sum(1 for item in block if not item.strip()) == 1:
+                tag = html_match.group(1).lower()
+                if tag not in VOID_TAGS and f'</{tag}>' not in stripped.lower():
+                    html_tag = tag
+        elif f'</{html_tag}>' in stripped.lower():
+            html_tag = None
+
+    if block:
+        yield ''.join(block)
+
+
+def iter_chunks(lines: Iterable[str], chunk_chars: int = 64 * 1024) -> Iterator[str]:
+    """将顶层块合并为不小于 chunk_chars 的片段（单个超大块单独成片）"""
+    chunk: List[str] = []
+    size = 0
+    for block in iter_blocks(lines):
+        chunk.append(block)
+        size += len(block)
+        if size >= chunk_chars:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def collect_references(lines: Iterable[str]) -> List[str]:
+    """收集引用式链接定义（分块转换时需要附加到每个片段）"""
+    references = []
+    fence = None
+    for line in lines:
+        stripped = line.rstrip('\r\n')
+        if fence is not None:
+            if stripped.rstrip(' ') == fence:
+                fence = None
+            continue
+        fence_match = FENCE_RE.match(stripped)
+        if fence_match:
+            fence = fence_match.group(1)
+        elif REFERENCE_RE.match(stripped):
+            references.append(stripped)
+    return references
@@ -6,129 +6,290 @@ Markdown to HTML Converter for WeChat Public Accounts
 """
 
 import argparse
+import importlib.util
 import os
 import sys
 import re
+from contextlib import ExitStack
 from pathlib import Path
-from typing import Optional, Dict
-import markdown
-from markdown.extensions import codehilite, fenced_code, tables, nl2br
-from bs4 import BeautifulSoup
-import cssutils
-import logging
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, TextIO, Union
+from conversion_trace import ConversionTrace, Span
+from markdown_blocks import collect_references, iter_chunks
+from theme_compiler import theme_cache
+
+# markdown、bs4、Pygments 等重量级依赖在首次使用时才导入（见 startup_profile.py 的启动预算）
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
+
+# 转换器版本：输出格式发生变化时递增（批量转换的增量清单据此判断是否需要重建）
+CONVERTER_VERSION = '1.1.0'
+
+# 流式转换时每个片段的目标大小（字符数），内存占用约为片段大小与最大单块之间的较大者
+STREAM_CHUNK_CHARS = 4 * 1024
+
+# 已安装lxml时使用更快的lxml解析器，否则退回标准库html.parser
+DEFAULT_PARSER = 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
+
+# 内置后处理阶段：函数名 → (追踪中的阶段名, 返回值对应的计数名)
+TRANSFORM_STAGES = {
+    '_enhance_code_blocks': ('code_blocks', 'code_blocks'),
+    '_process_images': ('images', 'images'),
+    '_apply_inline_styles': ('inline_css', 'styled_elements'),
+}
+
+# 代码块渲染方式：
+#   pre    - <pre><code> + CSS类名（浏览器预览用，发布前需 convert-code-blocks.py 转换）
+#   wechat - 直接输出微信兼容的 <section><div> + &nbsp; + <br>，颜色内联（可直接粘贴到微信编辑器）
+CODE_RENDER_MODES = ('pre', 'wechat')
+
+# wechat 渲染方式下各主题使用的 Pygments 配色（与主题代码块背景色相配）
+CODE_PYGMENTS_STYLES = {
+    'tech': 'one-dark',
+    'minimal': 'default',
+    'business': 'monokai',
+}
+
+# WeChatCodeFormatter 输出的代码块（内容已转义，不含嵌套标签以外的 </div>）及其占位元素
+_WECHAT_CODE_RE = re.compile(r'<section data-lang="[^"]*" style="[^"]*"><div style="[^"]*">.*?</div></section>',
+                             re.DOTALL)
+_WECHAT_CODE_PLACEHOLDER_RE = re.compile(r'<section data-wechat-code="(\d+)"[^>]*></section>')
+
+THEME_FILES = {
+    'tech': 'tech-theme.css',
+    'minimal': 'minimal-theme.css',
+    'business': 'business-theme.css'
+}
+
+
+def parse_themes(themes: Union[str, List[str], None]) -> List[str]:
+    """解析主题列表：None 或 'all' 表示全部主题，字符串按逗号分隔"""
+    if themes is None or themes == 'all':
+        return list(THEME_FILES)
+    if isinstance(themes, str):
+        themes = [name.strip() for name in themes.split(',') if name.strip()]
+    unknown = [name for name in themes if name not in THEME_FILES]
+    if unknown or not themes:
+        raise ValueError(f"Unknown theme: {', '.join(unknown)}. Available: {', '.join(THEME_FILES.keys())}")
+    # 去重并保持顺序
+    return list(dict.fromkeys(themes))
+
+
+def theme_css_path(theme: str) -> Path:
+    """返回主题CSS文件路径"""
+    if theme not in THEME_FILES:
+        raise ValueError(f"Unknown theme: {theme}. Available: {', '.join(THEME_FILES.keys())}")
+
+    css_file = Path(__file__).parent.parent / 'templates' / THEME_FILES[theme]
+
+    if not css_file.exists():
+        raise FileNotFoundError(f"Theme CSS file not found: {css_file}")
+
+    return css_file
 
-# 禁用cssutils的警告日志
-cssutils.log.setLevel(logging.CRITICAL)
 
 
 class WeChatHTMLConverter:
     """微信公众号HTML转换器"""
 
-    def __init__(self, theme: str = 'tech'):
+    def __init__(self, theme: str = 'tech', parser: Optional[str] = None,
+                 guess_lang: Union[bool, str, List[str]] = True, highlight_cache_enabled: bool = True,
+                 on_span: Optional[Callable[[Span], None]] = None, code_render: str = 'pre',
+                 pygments_style: Optional[str] = None):
+        """
+        Args:
+            theme: 主题名称
+            parser: BeautifulSoup解析器（默认：已安装lxml时使用lxml）
+            guess_lang: 未标注语言的代码块是否自动猜测语言；
+                        传入语言列表（或逗号分隔字符串）时只在这些语言中猜测
+            highlight_cache_enabled: 是否缓存代码高亮结果（内存+磁盘）
+            on_span: 每个转换阶段结束时的回调（未传入 trace 的转换也会调用）
+            code_render: 代码块渲染方式（见 CODE_RENDER_MODES）
+            pygments_style: wechat 渲染方式使用的 Pygments 配色（默认按主题选择）
+        """
+        if code_render not in CODE_RENDER_MODES:
+            raise ValueError(f"Unknown code render mode: {code_render}. Available: {', '.join(CODE_RENDER_MODES)}")
         self.theme = theme
+        self.parser = parser or DEFAULT_PARSER
         self.theme_css = self._load_theme_css()
+        # 编译后的主题在所有转换器之间共享，并持久化到磁盘缓存
+        self.compiled_theme = theme_cache.load(self._theme_css_path(), self.theme_css)
+        self.guess_lang = guess_lang
+        self.highlight_cache_enabled = highlight_cache_enabled
+        self.code_render = code_render
+        self._pygments_style_option = pygments_style
+        self.pygments_style = pygments_style or CODE_PYGMENTS_STYLES.get(theme, 'default')
+        # 多主题转换时按主题复用的转换器
+        self._theme_converters: Dict[str, 'WeChatHTMLConverter'] = {theme: self}
+        self._inliner = None
+        self._highlighter = None
+        self.on_span = on_span
+
+        # 后处理流水线：所有阶段在同一棵DOM树上执行，最后只序列化一次
+        # 返回整数的阶段会将其记录为元素计数
+        self.transforms: List[Callable[['BeautifulSoup'], Optional[int]]] = [
+            self._enhance_code_blocks,
+            self._process_images,
+            self._apply_inline_styles,
+        ]
 
-    def _load_theme_css(self) -> str:
-        """加载主题CSS"""
-        theme_map = {
-            'tech': 'tech-theme.css',
-            'minimal': 'minimal-theme.css',
-            'business': 'business-theme.css'
+    @property
+    def inliner(self):
+        """样式内联器（按主题共享，首次使用时创建）"""
+        if self._inliner is None:
+            from css_inliner import StyleInliner
+
+            self._inliner = StyleInliner.for_theme(self.compiled_theme)
+        return self._inliner
+
+    @property
+    def highlighter(self):
+        """代码高亮器（首次渲染时创建）"""
+        if self._highlighter is None:
+            from code_highlight import CodeHighlighter, highlight_cache, parse_guess_lang
+
+            # 代码高亮：结果按 (代码, 语言, Pygments选项) 缓存，跨转换和跨进程复用
+            # 注意：旧版以 'codehilite' 为键传入的配置从未生效（扩展名为完整模块路径），
+            # 实际一直使用 codehilite 默认配置（CSS类名输出），这里保持该输出不变
+            guess, candidates = parse_guess_lang(self.guess_lang)
+            config = {'guess_lang': guess}
+            if self.code_render == 'wechat':
+                config.update(self._wechat_code_config())
+            self._highlighter = CodeHighlighter(
+                config,
+                cache=highlight_cache if self.highlight_cache_enabled else None,
+                guess_candidates=candidates,
+            )
+        return self._highlighter
+
+    def _wechat_code_config(self) -> Dict[str, object]:
+        """wechat 渲染方式的 codehilite 配置：容器样式取自主题的 pre / code 规则"""
+        from code_highlight import WeChatCodeFormatter
+
+        rules = self.compiled_theme.css_rules
+        pre = rules.get('pre', {})
+        code = rules.get('code', {})
+        pre_code = rules.get('pre code', {})
+
+        # 微信忽略 white-space，定位相关属性对 section 无意义
+        container = {k: v for k, v in pre.items() if k not in ('white-space', 'position')}
+        inner = {'margin': '0'}
+        for prop, source in (('font-family', code), ('font-size', pre_code), ('line-height', pre)):
+            if prop in source:
+                inner[prop] = source[prop]
+
+        def to_style(declarations: Dict[str, str]) -> str:
+            # 字体名中的双引号改为单引号，保证可以直接放入 style="..."
+            return '; '.join(f'{k}: {v}' for k, v in declarations.items()).replace('"', "'")
+
+        return {
+            'pygments_formatter': WeChatCodeFormatter,
+            'pygments_style': self.pygments_style,
+            'container_style': to_style(container),
+            'code_style': to_style(inner),
         }
 
-        if self.theme not in theme_map:
-            raise ValueError(f"Unknown theme: {self.theme}. Available: {', '.join(theme_map.keys())}")
+    def add_transform(self, transform: Callable[['BeautifulSoup'], Optional[int]],
+                      index: Optional[int] = None) -> None:
+        """
+        注册后处理阶段
 
-        css_file = Path(__file__).parent.parent / 'templates' / theme_map[self.theme]
+        Args:
+            transform: 接收BeautifulSoup树并原地修改的函数
+            index: 插入位置（默认追加到末尾）
+        """
+        if index is None:
+            self.transforms.append(transform)
+        else:
+            self.transforms.insert(index, transform)
 
-        if not css_file.exists():
-            raise FileNotFoundError(f"Theme CSS file not found: {css_file}")
+    def _theme_css_path(self) -> Path:
+        """返回主题CSS文件路径"""
+        return theme_css_path(self.theme)
 
-        with open(css_file, 'r', encoding='utf-8') as f:
+    def _load_theme_css(self) -> str:
+        """加载主题CSS"""
+        with open(self._theme_css_path(), 'r', encoding='utf-8') as f:
             return f.read()
 
     def _parse_css_to_dict(self) -> Dict[str, Dict[str, str]]:
-        """解析CSS为字典格式，用于内联样式"""
-        css_rules = {}
-
-        # 解析CSS变量
-        css_vars = {}
-        var_pattern = r'--([a-zA-Z0-9-]+):\s*([^;]+);'
-        for match in re.finditer(var_pattern, self.theme_css):
-            var_name = f'--{match.group(1)}'
-            var_value = match.group(2).strip()
-            css_vars[var_name] = var_value
-
-        # 使用cssutils解析CSS规则
-        sheet = cssutils.parseString(self.theme_css)
-
-        for rule in sheet:
-            if rule.type == rule.STYLE_RULE:
-                selector = rule.selectorText
-                styles = {}
-
-                for prop in rule.style:
-                    value = prop.value
-                    # 替换CSS变量
-                    for var_name, var_value in css_vars.items():
-                        value = value.replace(f'var({var_name})', var_value)
-                    styles[prop.name] = value
-
-                # 处理多个选择器
-                for sel in selector.split(','):
-                    sel = sel.strip()
-                    if sel not in css_rules:
-                        css_rules[sel] = {}
-                    css_rules[sel].update(styles)
-
-        return css_rules
-
-    def _apply_inline_styles(self, html: str, css_rules: Dict[str, Dict[str, str]]) -> str:
-        """将CSS样式内联到HTML标签中"""
-        soup = BeautifulSoup(html, 'html.parser')
-
-        # 处理简单选择器（标签、类、ID）
-        for selector, styles in css_rules.items():
-            # 跳过伪类、伪元素、媒体查询等复杂选择器
-            if any(x in selector for x in [':', '@', '>', '+', '~', '[', '*']):
-                continue
-
-            try:
-                elements = soup.select(selector)
-                for elem in elements:
-                    # 合并现有style属性
-                    existing_style = elem.get('style', '')
-                    style_dict = {}
-
-                    # 解析现有style
-                    if existing_style:
-                        for item in existing_style.split(';'):
-                            if ':' in item:
-                                key, value = item.split(':', 1)
-                                style_dict[key.strip()] = value.strip()
-
-                    # 添加新样式（不覆盖现有样式）
-                    for prop, value in styles.items():
-                        if prop not in style_dict:
-                            style_dict[prop] = value
-
-                    # 生成新的style字符串
-                    new_style = '; '.join(f'{k}: {v}' for k, v in style_dict.items())
-                    elem['style'] = new_style
-            except Exception as e:
-                # 忽略无法处理的选择器
-                continue
-
-        return str(soup)
-
-    def _enhance_code_blocks(self, html: str) -> str:
-        """增强代码块显示效果"""
-        soup = BeautifulSoup(html, 'html.parser')
-
+        """解析CSS为字典格式，用于内联样式（返回编译缓存中的结果）"""
+        return self.compiled_theme.css_rules
+
+    def _parse_html(self, html: str) -> 'BeautifulSoup':
+        """解析HTML片段为DOM树"""
+        from bs4 import BeautifulSoup
+
+        if self.parser == 'html.parser':
+            return BeautifulSoup(html, self.parser)
+        # lxml会补全<html>/<head>/<body>，并把 <body> 之前的注释和空白移到文档外：
+        # 显式放进 <body>，片段开头的注释和换行与 html.parser 的结果一致
+        return BeautifulSoup('<body>' + html, self.parser)
+
+    def _serialize(self, soup: 'BeautifulSoup') -> str:
+        """序列化DOM树为HTML片段"""
+        if self.parser == 'html.parser':
+            return str(soup)
+
+        # 片段在 <body> 中解析（见 _parse_html），只输出 body 的内容；
+        # 用 decode_contents 而不是逐个节点 str()：str() 对注释和文本节点只返回裸文本，会丢失 <!-- --> 和转义
+        return soup.body.decode_contents()
+
+    def _new_trace(self) -> ConversionTrace:
+        return ConversionTrace(on_span=self.on_span)
+
+    def _run_transforms(self, html: str, trace: Optional[ConversionTrace] = None) -> str:
+        """解析一次、依次执行所有后处理阶段、序列化一次"""
+        trace = trace or self._new_trace()
+        code_blocks: List[str] = []
+        if self.code_render == 'wechat':
+            # 微信代码块已是最终格式：替换为占位元素，不参与解析和序列化
+            # （序列化会把 &nbsp; 还原为 U+00A0，而微信会删除该字符）
+            def stash(match):
+                code_blocks.append(match.group(0))
+                return f'<section data-wechat-code="{len(code_blocks) - 1}"></section>'
+
+            html = _WECHAT_CODE_RE.sub(stash, html)
+
+        with trace.span('parse', parser=self.parser):
+            soup = self._parse_html(html)
+        self._apply_transforms(soup, self.transforms, trace)
+        with trace.span('serialize'):
+            html = self._serialize(soup)
+            if code_blocks:
+                html = _WECHAT_CODE_PLACEHOLDER_RE.sub(lambda m: code_blocks[int(m.group(1))], html)
+            return html
+
+    def _apply_transforms(self, soup: 'BeautifulSoup', transforms: List[Callable[['BeautifulSoup'], Optional[int]]],
+                          trace: ConversionTrace, **attributes) -> None:
+        """依次执行后处理阶段，每个阶段记录为一个追踪阶段"""
+        for transform in transforms:
+            name = getattr(transform, '__name__', 'transform')
+            stage, count_name = TRANSFORM_STAGES.get(name, (name.lstrip('_'), None))
+            with trace.span(stage, **attributes) as span:
+                result = transform(soup)
+                if isinstance(result, int):
+                    span.attributes['count'] = result
+                    trace.count(count_name or stage, result)
+
+    def _theme_stage_index(self) -> int:
+        """后处理流水线中第一个与主题相关的阶段（样式内联）的位置"""
+        for index, transform in enumerate(self.transforms):
+            if getattr(transform, '__name__', None) == '_apply_inline_styles':
+                return index
+        return len(self.transforms)
+
+    def _apply_inline_styles(self, soup: 'BeautifulSoup') -> int:
+        """将CSS样式内联到HTML标签中（选择器索引，一次遍历文档），返回添加了样式的元素数"""
+        return self.inliner.apply(soup)
+
+    def _enhance_code_blocks(self, soup: 'BeautifulSoup') -> int:
+        """增强代码块显示效果，返回代码块数"""
+        count = 0
         # 处理代码块
         for pre in soup.find_all('pre'):
             code = pre.find('code')
             if code:
+                count += 1
                 # 提取语言信息
                 classes = code.get('class', [])
                 language = None
@@ -140,24 +301,29 @@ class WeChatHTMLConverter:
                 # 添加语言标签
                 if language:
                     pre['data-lang'] = language
-
-        return str(soup)
-
-    def _process_images(self, html: str) -> str:
-        """处理图片标签，确保适合微信显示"""
-        soup = BeautifulSoup(html, 'html.parser')
-
-        for img in soup.find_all('img'):
+        if self.code_render == 'wechat':
+            # 微信代码块由 WeChatCodeFormatter 直接生成，此时只是占位元素
+            count += len(soup.find_all('section', attrs={'data-wechat-code': True}))
+        return count
+
+    def _process_images(self, soup: 'BeautifulSoup') -> int:
+        """处理图片标签，确保适合微信显示，返回图片数"""
+        images = soup.find_all('img')
+        for img in images:
             # 确保图片有必要的样式
             existing_style = img.get('style', '')
             if 'max-width' not in existing_style:
                 style_additions = 'max-width: 100%; height: auto; display: block; margin: 24px auto;'
                 img['style'] = f'{existing_style}; {style_additions}' if existing_style else style_additions
+        return len(images)
 
-        return str(soup)
+    def _render_markdown(self, markdown_text: str, trace: Optional[ConversionTrace] = None) -> str:
+        """渲染Markdown为HTML片段（尚未执行后处理；代码高亮记录为 markdown 的子阶段）"""
+        trace = trace or self._new_trace()
+        with trace.span('markdown'):
+            return self._render_markdown_traced(markdown_text, trace)
 
-    def convert(self, markdown_text: str) -> str:
-        """转换Markdown为HTML"""
+    def _render_markdown_traced(self, markdown_text: str, trace: ConversionTrace) -> str:
         # ⚠️ 移除 H1 标题（微信公众号有独立的标题输入框）
         # 删除以 "# " 开头的行（注意：## 和更多 # 的不删除）
         lines = markdown_text.split('\n')
@@ -170,47 +336,146 @@ class WeChatHTMLConverter:
 
         markdown_text = '\n'.join(filtered_lines)
 
-        # 配置Markdown扩展
+        import markdown
+        from code_highlight import CachedCodeHiliteExtension
+
+        # 配置Markdown扩展（代码高亮由带缓存的扩展完成，输出与codehilite一致）
         extensions = [
             'markdown.extensions.fenced_code',
             'markdown.extensions.tables',
             'markdown.extensions.nl2br',
             'markdown.extensions.sane_lists',
-            'markdown.extensions.codehilite',
+            CachedCodeHiliteExtension(self.highlighter, trace=trace),
         ]
 
-        extension_configs = {
-            'codehilite': {
-                'linenums': False,
-                'guess_lang': True,
-                'noclasses': True,
-            }
-        }
-
         # 转换Markdown为HTML
-        md = markdown.Markdown(extensions=extensions, extension_configs=extension_configs)
-        html_content = md.convert(markdown_text)
+        md = markdown.Markdown(extensions=extensions)
+        return md.convert(markdown_text)
+
+    def convert_fragment(self, markdown_text: str, trace: Optional[ConversionTrace] = None) -> str:
+        """转换Markdown片段为已内联样式的HTML片段（不包装为完整文档）"""
+        trace = trace or self._new_trace()
+        html_content = self._render_markdown(markdown_text, trace)
+        if not html_content:
+            return ''
+        return self._run_transforms(html_content, trace)
 
-        # 增强代码块
-        html_content = self._enhance_code_blocks(html_content)
+    def convert(self, markdown_text: str, trace: Optional[ConversionTrace] = None) -> str:
+        """
+        转换Markdown为HTML
 
-        # 处理图片
-        html_content = self._process_images(html_content)
+        Args:
+            markdown_text: Markdown文本
+            trace: 追踪记录（可选），转换后可从中读取各阶段耗时、元素计数和字节数
+        """
+        trace = trace or self._new_trace()
+        trace.bytes_in += len(markdown_text.encode('utf-8'))
 
-        # 解析CSS并内联样式
-        css_rules = self._parse_css_to_dict()
-        html_content = self._apply_inline_styles(html_content, css_rules)
+        html_content = self._render_markdown(markdown_text, trace)
+
+        # 后处理：增强代码块、处理图片、内联样式（共用一棵DOM树）
+        html_content = self._run_transforms(html_content, trace)
 
         # 包装为完整HTML文档
-        full_html = self._wrap_html(html_content)
+        with trace.span('wrap'):
+            full_html = self._wrap_html(html_content)
 
+        trace.bytes_out += len(full_html.encode('utf-8'))
         return full_html
 
+    def for_theme(self, theme: str) -> 'WeChatHTMLConverter':
+        """返回使用相同选项、但主题不同的转换器（缓存复用，高亮器共享）"""
+        converter = self._theme_converters.get(theme)
+        if converter is None:
+            converter = WeChatHTMLConverter(
+                theme=theme, parser=self.parser, guess_lang=self.guess_lang,
+                highlight_cache_enabled=self.highlight_cache_enabled, on_span=self.on_span,
+                code_render=self.code_render, pygments_style=self._pygments_style_option,
+            )
+            if self.code_render == 'pre':
+                # pre 渲染方式的高亮结果与主题无关
+                converter._highlighter = self.highlighter
+            self._theme_converters[theme] = converter
+        return converter
+
+    def convert_many(self, markdown_text: str, themes: Union[str, List[str], None] = None,
+                     trace: Optional[ConversionTrace] = None) -> Dict[str, str]:
+        """
+        用多个主题转换同一篇文章：Markdown渲染、代码高亮、解析和与主题无关的后处理只执行一次，
+        再在树的副本上分别应用各主题的样式
+
+        结果与对每个主题分别调用 convert() 逐字节一致。wechat 渲染方式下代码块样式取自主题，
+        Markdown 按主题分别渲染（代码高亮仍由高亮缓存复用）。
+
+        Args:
+            markdown_text: Markdown文本
+            themes: 主题列表、逗号分隔字符串或 'all'（默认：全部主题）
+            trace: 追踪记录（可选），各主题的阶段带有 theme 属性
+
+        Returns:
+            {主题: 完整HTML文档}，按 themes 的顺序排列
+        """
+        themes = parse_themes(themes)
+        trace = trace or self._new_trace()
+        if self.code_render != 'pre':
+            return {theme: self.for_theme(theme).convert(markdown_text, trace) for theme in themes}
+
+        trace.bytes_in += len(markdown_text.encode('utf-8'))
+        html_content = self._render_markdown(markdown_text, trace)
+        with trace.span('parse', parser=self.parser):
+            soup = self._parse_html(html_content)
+
+        # 样式内联之前的阶段与主题无关，在共享的树上执行一次
+        self._apply_transforms(soup, self.transforms[:self._theme_stage_index()], trace)
+
+        converters = [self.for_theme(theme) for theme in themes]
+        if all(converter.transforms[converter._theme_stage_index():] == [converter._apply_inline_styles]
+               for converter in converters):
+            return self._convert_many_inline_only(soup, converters, trace)
+
+        # 存在其他与主题相关的后处理阶段：每个主题使用树的副本（最后一个主题直接使用原树）
+        import copy
+
+        results = {}
+        for index, converter in enumerate(converters):
+            theme = converter.theme
+            if index < len(converters) - 1:
+                with trace.span('copy_tree', theme=theme):
+                    theme_soup = copy.copy(soup)
+            else:
+                theme_soup = soup
+            converter._apply_transforms(theme_soup, converter.transforms[converter._theme_stage_index():],
+                                        trace, theme=theme)
+            with trace.span('serialize', theme=theme):
+                body = converter._serialize(theme_soup)
+            with trace.span('wrap', theme=theme):
+                results[theme] = converter._wrap_html(body)
+            trace.bytes_out += len(results[theme].encode('utf-8'))
+        return results
+
+    def _convert_many_inline_only(self, soup: 'BeautifulSoup', converters: List['WeChatHTMLConverter'],
+                                  trace: ConversionTrace) -> Dict[str, str]:
+        """只有样式内联与主题相关时：在同一棵树上依次临时内联各主题样式并序列化，无需复制树"""
+        stage, count_name = TRANSFORM_STAGES['_apply_inline_styles']
+        results = {}
+        for converter in converters:
+            theme = converter.theme
+            with ExitStack() as restore_styles:
+                with trace.span(stage, theme=theme) as span:
+                    count = restore_styles.enter_context(converter.inliner.applied(soup))
+                    span.attributes['count'] = count
+                    trace.count(count_name, count)
+                with trace.span('serialize', theme=theme):
+                    body = converter._serialize(soup)
+            with trace.span('wrap', theme=theme):
+                results[theme] = converter._wrap_html(body)
+            trace.bytes_out += len(results[theme].encode('utf-8'))
+        return results
+
     def _wrap_html(self, body_content: str) -> str:
         """包装为完整的HTML文档"""
-        # 提取CSS变量以在head中定义
-        css_vars_match = re.search(r':root\s*\{([^}]+)\}', self.theme_css)
-        css_vars = css_vars_match.group(1) if css_vars_match else ''
+        # CSS变量已在编译主题时提取
+        css_vars = self.compiled_theme.root_block
 
         html_template = f'''<!DOCTYPE html>
 <html lang="zh-CN">
@@ -244,20 +509,68 @@ class WeChatHTMLConverter:
 
         return html_template
 
-    def convert_file(self, input_file: str, output_file: Optional[str] = None) -> str:
-        """转换Markdown文件为HTML文件"""
+    def _wrap_html_parts(self) -> tuple:
+        """返回文档包装的 (正文之前, 正文之后) 两部分，用于流式输出"""
+        placeholder = '\x00BODY\x00'
+        head, tail = self._wrap_html(placeholder).split(placeholder, 1)
+        return head, tail
+
+    def convert_stream(self, input_stream: TextIO, output_stream: TextIO,
+                       chunk_chars: int = STREAM_CHUNK_CHARS,
+                       references: Optional[List[str]] = None,
+                       trace: Optional[ConversionTrace] = None) -> None:
+        """
+        流式转换：按顶层块切分Markdown，逐片段转换并写出
+
+        内存占用取决于片段大小和最大的单个块，而不是整篇文档。
+
+        Args:
+            input_stream: Markdown文本流（逐行读取）
+            output_stream: HTML输出流
+            chunk_chars: 每个片段的目标字符数
+            references: 全文的引用式链接定义（附加到每个片段，保证跨片段引用可解析）
+            trace: 追踪记录（可选），各片段的阶段耗时累加到同一条记录中
+        """
+        trace = trace or self._new_trace()
+        suffix = '\n\n' + '\n'.join(references) + '\n' if references else ''
+        with trace.span('wrap'):
+            head, tail = self._wrap_html_parts()
+        output_stream.write(head)
+        trace.bytes_out += len(head.encode('utf-8'))
+
+        first = True
+        for chunk in iter_chunks(input_stream, chunk_chars):
+            trace.bytes_in += len(chunk.encode('utf-8'))
+            html_content = self.convert_fragment(chunk + suffix, trace)
+            if not html_content:
+                continue
+            if not first:
+                output_stream.write('\n')
+                trace.bytes_out += 1
+            output_stream.write(html_content)
+            trace.bytes_out += len(html_content.encode('utf-8'))
+            first = False
+
+        output_stream.write(tail)
+        trace.bytes_out += len(tail.encode('utf-8'))
+
+    def convert_file(self, input_file: str, output_file: Optional[str] = None,
+                     stream: bool = False, trace: Optional[ConversionTrace] = None) -> str:
+        """
+        转换Markdown文件为HTML文件
+
+        Args:
+            input_file: 输入的Markdown文件路径
+            output_file: 输出的HTML文件路径（默认：与输入文件同名.html）
+            stream: 是否使用流式转换（适合超大文档，内存占用与文档大小无关）
+            trace: 追踪记录（可选），包含读写文件的耗时
+        """
+        trace = trace or self._new_trace()
         input_path = Path(input_file)
 
         if not input_path.exists():
             raise FileNotFoundError(f"Input file not found: {input_file}")
 
-        # 读取Markdown文件
-        with open(input_path, 'r', encoding='utf-8') as f:
-            markdown_text = f.read()
-
-        # 转换为HTML
-        html_content = self.convert(markdown_text)
-
         # 确定输出文件路径
         if output_file is None:
             output_file = input_path.with_suffix('.html')
@@ -267,12 +580,68 @@ class WeChatHTMLConverter:
         # 确保输出目录存在
         output_path.parent.mkdir(parents=True, exist_ok=True)
 
+        if stream:
+            # 第一遍只收集引用式链接定义，第二遍逐片段转换并写出
+            with open(input_path, 'r', encoding='utf-8') as f:
+                references = collect_references(f)
+            with open(input_path, 'r', encoding='utf-8') as f_in, \
+                    open(output_path, 'w', encoding='utf-8') as f_out:
+                self.convert_stream(f_in, f_out, references=references, trace=trace)
+            return str(output_path)
+
+        # 读取Markdown文件
+        with trace.span('read'):
+            with open(input_path, 'r', encoding='utf-8') as f:
+                markdown_text = f.read()
+
+        # 转换为HTML
+        html_content = self.convert(markdown_text, trace)
+
         # 写入HTML文件
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(html_content)
+        with trace.span('write'):
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(html_content)
 
         return str(output_path)
 
+    def convert_file_many(self, input_file: str, themes: Union[str, List[str], None] = None,
+                          output_dir: Optional[str] = None,
+                          trace: Optional[ConversionTrace] = None) -> Dict[str, str]:
+        """
+        用多个主题转换Markdown文件，输出为 <文件名>-<主题>.html
+
+        Args:
+            input_file: 输入的Markdown文件路径
+            themes: 主题列表、逗号分隔字符串或 'all'（默认：全部主题）
+            output_dir: 输出目录（默认：与输入文件相同目录）
+            trace: 追踪记录（可选）
+
+        Returns:
+            {主题: 输出文件路径}
+        """
+        trace = trace or self._new_trace()
+        input_path = Path(input_file)
+        if not input_path.exists():
+            raise FileNotFoundError(f"Input file not found: {input_file}")
+
+        output_root = Path(output_dir) if output_dir else input_path.parent
+        output_root.mkdir(parents=True, exist_ok=True)
+
+        with trace.span('read'):
+            with open(input_path, 'r', encoding='utf-8') as f:
+                markdown_text = f.read()
+
+        results = self.convert_many(markdown_text, themes, trace)
+
+        output_paths = {}
+        with trace.span('write'):
+            for theme, html_content in results.items():
+                output_path = output_root / f'{input_path.stem}-{theme}.html'
+                with open(output_path, 'w', encoding='utf-8') as f:
+                    f.write(html_content)
+                output_paths[theme] = str(output_path)
+        return output_paths
+
 
 def main():
     """命令行入口"""
@@ -293,6 +662,21 @@ def main():
   # 转换后在浏览器预览
   python markdown_to_html.py --input article.md --preview
 
+  # 一次生成全部主题供对比（只解析和高亮一次，输出 article-tech.html 等）
+  python markdown_to_html.py --input article.md --themes all --preview
+
+  # 超大文档使用流式转换（逐块转换并写出，内存占用与文档大小无关）
+  python markdown_to_html.py --input book.md --stream
+
+  # 查看启动耗时分析（导入耗时明细、是否超出启动预算）
+  python markdown_to_html.py --profile-startup
+
+  # 直接输出微信兼容的代码块（无需再运行 convert-code-blocks.py）
+  python markdown_to_html.py --input article.md --code-render wechat
+
+  # 代码块语言只在指定范围内猜测，并显示高亮缓存命中情况
+  python markdown_to_html.py --input article.md --guess-langs python,bash,javascript --cache-stats
+
 可用主题:
   tech      - 科技风主题（蓝紫渐变，现代科技感）
   minimal   - 简约风主题（黑白灰，极简设计）
@@ -300,32 +684,69 @@ def main():
         '''
     )
 
-    parser.add_argument('-i', '--input', required=True, help='输入的Markdown文件路径')
+    parser.add_argument('-i', '--input', help='输入的Markdown文件路径')
     parser.add_argument('-o', '--output', help='输出的HTML文件路径（默认：与输入文件同名.html）')
     parser.add_argument('-t', '--theme', default='tech',
                         choices=['tech', 'minimal', 'business'],
                         help='选择主题样式（默认：tech）')
+    parser.add_argument('--themes', metavar='THEMES',
+                        help='同时输出多个主题（逗号分隔或 all），输出为 <文件名>-<主题>.html，'
+                             '此时 --output 为输出目录')
     parser.add_argument('-p', '--preview', action='store_true',
                         help='转换后在浏览器中打开预览')
+    parser.add_argument('-s', '--stream', action='store_true',
+                        help='流式转换：按块转换并增量写出（适合数MB的超大文档）')
+    parser.add_argument('--code-render', default='pre', choices=CODE_RENDER_MODES,
+                        help='代码块渲染方式：pre（浏览器预览）或 wechat（微信兼容格式，可直接粘贴）（默认：pre）')
+    parser.add_argument('--no-guess-lang', action='store_true',
+                        help='未标注语言的代码块不猜测语言（按纯文本处理，速度最快）')
+    parser.add_argument('--guess-langs', metavar='LANGS',
+                        help='只在这些语言中猜测（逗号分隔，如 python,bash,javascript）')
+    parser.add_argument('--no-highlight-cache', action='store_true',
+                        help='禁用代码高亮缓存')
+    parser.add_argument('--cache-stats', action='store_true',
+                        help='输出代码高亮缓存的命中率和节省时间')
+
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='输出启动耗时分析（各阶段耗时、预算检查、导入耗时明细）后退出')
 
     args = parser.parse_args()
 
+    if args.profile_startup:
+        from startup_profile import print_startup_profile, profile_startup
+        sys.exit(0 if print_startup_profile(profile_startup('markdown_to_html', args.theme)) else 1)
+    if not args.input:
+        parser.error('需要指定 --input')
+    if args.themes and args.stream:
+        parser.error('--themes 不能与 --stream 同时使用')
+
     try:
         # 创建转换器
-        converter = WeChatHTMLConverter(theme=args.theme)
+        guess_lang = False if args.no_guess_lang else (args.guess_langs or True)
+        converter = WeChatHTMLConverter(theme=args.theme, guess_lang=guess_lang,
+                                        highlight_cache_enabled=not args.no_highlight_cache,
+                                        code_render=args.code_render)
 
         # 转换文件
-        output_path = converter.convert_file(args.input, args.output)
+        if args.themes:
+            output_paths = converter.convert_file_many(args.input, args.themes, args.output)
+        else:
+            output_paths = {args.theme: converter.convert_file(args.input, args.output, stream=args.stream)}
 
         print(f'[OK] 转换成功！')
         print(f'[INFO] 输入文件: {args.input}')
-        print(f'[INFO] 输出文件: {output_path}')
-        print(f'[OK] 使用主题: {args.theme}')
+        for theme, output_path in output_paths.items():
+            print(f'[INFO] 输出文件（{theme}）: {output_path}')
+        print(f'[OK] 使用主题: {", ".join(output_paths)}')
+        if args.cache_stats:
+            from code_highlight import highlight_cache
+            print(f'[INFO] {highlight_cache.format_stats()}')
 
         # 预览
         if args.preview:
             import webbrowser
-            webbrowser.open(f'file://{Path(output_path).absolute()}')
+            for output_path in output_paths.values():
+                webbrowser.open(f'file://{Path(output_path).absolute()}')
             print(f'[INFO] 已在浏览器中打开预览')
 
         print('\n[HINT] 提示：')
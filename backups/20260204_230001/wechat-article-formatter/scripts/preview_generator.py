@@ -6,56 +6,191 @@ Live Preview Generator for WeChat Articles
 """
 
 import argparse
+import json
+import queue
 import sys
 import time
 from pathlib import Path
+from urllib.parse import parse_qs, urlparse
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
+from formatter_cache import atomic_write_text, sha256_text
+from incremental_render import IncrementalRenderer
 from markdown_to_html import WeChatHTMLConverter
 import webbrowser
 import threading
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
 import os
 
+# 推送更新的SSE路径
+EVENTS_PATH = '/__preview/events'
+
+# 注入预览页面的客户端脚本：接收服务器推送的差异，按块标识替换、移动或删除DOM节点
+LIVE_CLIENT_SCRIPT = '''<script>
+(function () {
+    var version = %(version)d;
+    var root = document.getElementById('wechat-preview-root');
+
+    function apply(msg) {
+        if (msg.version <= version) return;
+        var existing = {};
+        Array.prototype.forEach.call(root.children, function (el) {
+            existing[el.getAttribute('data-block')] = el;
+        });
+        var cursor = root.firstElementChild;
+        for (var i = 0; i < msg.order.length; i++) {
+            var key = msg.order[i];
+            var el = existing[key];
+            if (el) {
+                delete existing[key];
+            } else if (key in msg.blocks) {
+                el = document.createElement('div');
+                el.setAttribute('data-block', key);
+                el.style.display = 'contents';
+                el.innerHTML = msg.blocks[key];
+            } else {
+                // 本地版本落后太多，无法增量更新
+                location.reload();
+                return;
+            }
+            if (el === cursor) {
+                cursor = cursor.nextElementSibling;
+            } else {
+                root.insertBefore(el, cursor);
+            }
+        }
+        Object.keys(existing).forEach(function (key) {
+            root.removeChild(existing[key]);
+        });
+        version = msg.version;
+    }
+
+    var source = new EventSource('%(events)s?v=' + version);
+    source.onmessage = function (event) {
+        apply(JSON.parse(event.data));
+    };
+})();
+</script>
+'''
+
+
+class PreviewBroadcaster:
+    """向所有已连接的预览页面推送消息"""
+
+    def __init__(self):
+        self._clients = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self) -> queue.Queue:
+        client = queue.Queue()
+        with self._lock:
+            self._clients.add(client)
+        return client
+
+    def unsubscribe(self, client: queue.Queue) -> None:
+        with self._lock:
+            self._clients.discard(client)
+
+    def publish(self, message: dict) -> None:
+        data = json.dumps(message, ensure_ascii=False)
+        with self._lock:
+            for client in self._clients:
+                client.put(data)
+
 
 class MarkdownChangeHandler(FileSystemEventHandler):
-    """监听Markdown文件变化的处理器"""
+    """监听Markdown文件变化的处理器（防抖 + 按块增量渲染 + 推送更新）"""
 
-    def __init__(self, input_file: str, output_file: str, theme: str, auto_refresh: bool = True):
+    def __init__(self, input_file: str, output_file: str, theme: str, auto_refresh: bool = True,
+                 debounce: float = 0.05):
         self.input_file = Path(input_file).absolute()
         self.output_file = Path(output_file).absolute()
         self.theme = theme
         self.auto_refresh = auto_refresh
+        self.debounce = debounce
         self.converter = WeChatHTMLConverter(theme=theme)
-        self.last_modified = 0
+        self.renderer = IncrementalRenderer(self.converter)
+        self.broadcaster = PreviewBroadcaster()
+        self.last_digest = None
+        self._lock = threading.Lock()
+        self._timer = None
 
         # 初次转换
         self._convert()
 
     def _convert(self):
-        """执行转换"""
+        """执行转换（只重新渲染发生变化的块）"""
         try:
-            # 检查文件修改时间，避免重复转换
-            current_modified = self.input_file.stat().st_mtime
-            if current_modified == self.last_modified:
-                return
-
-            self.last_modified = current_modified
-
-            # 转换文件
-            self.converter.convert_file(str(self.input_file), str(self.output_file))
-
+            with open(self.input_file, 'r', encoding='utf-8') as f:
+                markdown_text = f.read()
+
+            start = time.perf_counter()
+            with self._lock:
+                # 按内容判断是否变化，避免编辑器多次保存触发重复转换
+                digest = sha256_text(markdown_text)
+                if digest == self.last_digest:
+                    return
+
+                diff = self.renderer.update(markdown_text)
+                # 上次写入失败时渲染器已是新内容（diff 为 None），同样需要写入
+                atomic_write_text(self.output_file, self.renderer.document())
+                # 写入成功后才记录：渲染或写入失败时，同样的内容在下次文件事件时重试
+                self.last_digest = digest
+                if diff is None:
+                    return
+                # 在锁内推送，保证各页面按版本顺序收到差异
+                if self.auto_refresh:
+                    self.broadcaster.publish(diff)
+
+            elapsed = (time.perf_counter() - start) * 1000
             timestamp = time.strftime('%H:%M:%S')
-            print(f'[{timestamp}] ✅ 已更新预览: {self.output_file.name}')
+            print(f'[{timestamp}] ✅ 已更新预览: {self.output_file.name}'
+                  f'（重新渲染 {diff["rendered"]}/{diff["total"]} 个块，{elapsed:.0f} ms）')
 
         except Exception as e:
             timestamp = time.strftime('%H:%M:%S')
             print(f'[{timestamp}] ❌ 转换失败: {e}')
 
+    def _schedule(self):
+        """防抖：连续的文件事件只在最后一次之后触发一次转换"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.debounce, self._convert)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def live_page(self) -> str:
+        """带增量更新脚本的预览页面（块包装在 display: contents 容器中，不影响排版）"""
+        with self._lock:
+            head, tail = self.converter._wrap_html_parts()
+            blocks = '\n'.join(
+                f'<div data-block="{key}" style="display: contents">{html}</div>'
+                for key, html in self.renderer.blocks
+            )
+            script = LIVE_CLIENT_SCRIPT % {'version': self.renderer.version, 'events': EVENTS_PATH}
+        return f'{head}<div id="wechat-preview-root">{blocks}</div>\n{script}{tail}'
+
+    def snapshot(self, client_version: int):
+        """客户端版本落后时返回完整内容，否则返回None"""
+        with self._lock:
+            if client_version == self.renderer.version:
+                return None
+            return self.renderer.snapshot()
+
     def on_modified(self, event):
         """文件修改时触发"""
         if event.src_path == str(self.input_file):
-            self._convert()
+            self._schedule()
+
+    def on_created(self, event):
+        """部分编辑器保存时先删除再创建文件"""
+        self.on_modified(event)
+
+    def on_moved(self, event):
+        """部分编辑器保存时写入临时文件再重命名"""
+        if getattr(event, 'dest_path', None) == str(self.input_file):
+            self._schedule()
 
 
 class QuietHTTPRequestHandler(SimpleHTTPRequestHandler):
@@ -66,10 +201,68 @@ class QuietHTTPRequestHandler(SimpleHTTPRequestHandler):
         pass
 
 
-def start_http_server(directory: Path, port: int = 8000):
-    """启动HTTP服务器"""
+class LivePreviewRequestHandler(QuietHTTPRequestHandler):
+    """预览页面由内存中的增量渲染结果生成，并通过SSE推送更新；其他文件按静态文件处理"""
+
+    change_handler: MarkdownChangeHandler = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == EVENTS_PATH:
+            self._serve_events(url)
+        elif url.path == '/' + self.change_handler.output_file.name:
+            body = self.change_handler.live_page().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            super().do_GET()
+
+    def _serve_events(self, url):
+        """SSE长连接：先补发落后的版本，再持续推送差异"""
+        try:
+            client_version = int(parse_qs(url.query).get('v', ['-1'])[0])
+        except ValueError:
+            client_version = -1
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'keep-alive')
+        self.end_headers()
+
+        broadcaster = self.change_handler.broadcaster
+        client = broadcaster.subscribe()
+        try:
+            snapshot = self.change_handler.snapshot(client_version)
+            if snapshot is not None:
+                client.put(json.dumps(snapshot, ensure_ascii=False))
+            while True:
+                try:
+                    data = client.get(timeout=15)
+                    self.wfile.write(f'data: {data}\n\n'.encode('utf-8'))
+                except queue.Empty:
+                    # 心跳，及时发现已断开的连接
+                    self.wfile.write(b': ping\n\n')
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            broadcaster.unsubscribe(client)
+
+
+def start_http_server(directory: Path, port: int = 8000, change_handler: MarkdownChangeHandler = None):
+    """启动HTTP服务器（提供 change_handler 时启用实时推送）"""
     os.chdir(directory)
-    server = HTTPServer(('localhost', port), QuietHTTPRequestHandler)
+    handler_class = QuietHTTPRequestHandler
+    if change_handler is not None:
+        handler_class = type('BoundLivePreviewRequestHandler', (LivePreviewRequestHandler,),
+                             {'change_handler': change_handler})
+    server = ThreadingHTTPServer(('localhost', port), handler_class)
+    server.daemon_threads = True
     print(f'🌐 本地服务器已启动: http://localhost:{port}')
     server.serve_forever()
 
@@ -90,15 +283,17 @@ def main():
   # 指定输出目录和端口
   python preview_generator.py --input article.md --output preview/ --port 8080
 
+  # 调整防抖时间（毫秒）
+  python preview_generator.py --input article.md --debounce 100
+
 工作原理:
   1. 首次运行时转换Markdown为HTML
   2. 在浏览器中打开预览
-  3. 启动文件监听，当Markdown文件修改时自动重新转换
-  4. 刷新浏览器即可看到最新效果
+  3. 启动文件监听，文件修改后（防抖）只重新渲染发生变化的块
+  4. 通过SSE把变化的块推送到页面，无需手动刷新
 
 使用技巧:
-  - 使用支持自动刷新的浏览器扩展（如Live Server）
-  - 或手动刷新浏览器查看最新效果
+  - 输出目录中的HTML文件始终是完整的转换结果，可直接复制使用
   - 按Ctrl+C停止预览服务
         '''
     )
@@ -112,6 +307,10 @@ def main():
                         help='HTTP服务器端口（默认：8000）')
     parser.add_argument('--no-browser', action='store_true',
                         help='不自动打开浏览器')
+    parser.add_argument('--debounce', type=int, default=50,
+                        help='文件变化后等待多少毫秒再转换（默认：50）')
+    parser.add_argument('--no-live', action='store_true',
+                        help='不向页面推送更新（需手动刷新浏览器）')
 
     args = parser.parse_args()
 
@@ -136,13 +335,15 @@ def main():
         event_handler = MarkdownChangeHandler(
             input_file=str(input_path),
             output_file=str(output_file),
-            theme=args.theme
+            theme=args.theme,
+            auto_refresh=not args.no_live,
+            debounce=args.debounce / 1000
         )
 
         # 启动HTTP服务器（在后台线程）
         server_thread = threading.Thread(
             target=start_http_server,
-            args=(output_dir, args.port),
+            args=(output_dir, args.port, None if args.no_live else event_handler),
             daemon=True
         )
         server_thread.start()
@@ -156,7 +357,10 @@ def main():
 
         print()
         print('👀 正在监听文件变化...')
-        print('💡 提示：修改Markdown文件后，刷新浏览器即可看到最新效果')
+        if args.no_live:
+            print('💡 提示：修改Markdown文件后，刷新浏览器即可看到最新效果')
+        else:
+            print('💡 提示：修改Markdown文件后，页面会自动更新变化的部分')
         print('⏹️  按Ctrl+C停止服务')
         print()
 
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Startup Profile
+测量CLI启动耗时：在新的Python进程中用 -X importtime 导入脚本模块、创建转换器并执行一次转换，
+输出各阶段耗时、启动预算检查和导入耗时明细
+"""
+
+import json
+import re
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+# 启动预算（毫秒）：导入脚本模块并创建转换器（主题编译缓存已存在时不导入cssutils）
+STARTUP_BUDGET_MS = 80
+# 首次转换预算（毫秒）：包含按需导入 markdown、bs4、Pygments
+FIRST_CONVERT_BUDGET_MS = 600
+
+SAMPLE_MARKDOWN = '''## 示例标题
+
+这是一段**示例**文字。
+
+```python
+print("hello")
+```
+
+| 列1 | 列2 |
+|-----|-----|
+| a   | b   |
+
+![图片](image.png)
+'''
+
+_PROFILE_CODE = '''
+import json, sys, time
+interpreter_modules = sorted(sys.modules)
+sys.path.insert(0, {scripts!r})
+t0 = time.perf_counter()
+import {module}
+from markdown_to_html import WeChatHTMLConverter
+converter = WeChatHTMLConverter(theme={theme!r})
+t1 = time.perf_counter()
+startup_modules = sorted(sys.modules)
+converter.convert({sample!r})
+t2 = time.perf_counter()
+print(json.dumps({{
+    'startup_ms': (t1 - t0) * 1000,
+    'first_convert_ms': (t2 - t1) * 1000,
+    'interpreter_modules': interpreter_modules,
+    'startup_modules': startup_modules,
+    'cssutils_loaded': 'cssutils' in sys.modules,
+}}))
+'''
+
+_IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)')
+
+
+def profile_startup(module: str = 'markdown_to_html', theme: str = 'tech') -> Dict:
+    """
+    在子进程中测量启动耗时
+
+    Returns:
+        {'startup_ms', 'first_convert_ms', 'cssutils_loaded',
+         'imports': [{'name', 'self_ms', 'cumulative_ms', 'depth', 'phase'}]}
+        （imports 不含解释器自身启动时导入的模块）
+    """
+    code = _PROFILE_CODE.format(scripts=str(Path(__file__).parent), module=module,
+                                theme=theme, sample=SAMPLE_MARKDOWN)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            capture_output=True, text=True, encoding='utf-8')
+    if result.returncode != 0:
+        raise RuntimeError(f'启动测量失败: {result.stderr.strip().splitlines()[-1:]}')
+
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    interpreter_modules = set(report.pop('interpreter_modules'))
+    startup_modules = set(report.pop('startup_modules'))
+
+    imports: List[Dict] = []
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        name = match.group(4)
+        if name in interpreter_modules:
+            # 解释器自身启动时导入的模块（site、encodings等），与脚本无关
+            continue
+        imports.append({
+            'name': name,
+            'self_ms': int(match.group(1)) / 1000,
+            'cumulative_ms': int(match.group(2)) / 1000,
+            'depth': (len(match.group(3)) - 1) // 2,
+            'phase': 'startup' if name in startup_modules else 'first_convert',
+        })
+    report['imports'] = imports
+    return report
+
+
+def print_startup_profile(report: Dict, top: int = 15) -> bool:
+    """打印启动耗时明细，返回是否在预算之内"""
+    within_budget = True
+    print('⏱️  启动耗时分析')
+    for label, key, budget in (('启动（导入+创建转换器）', 'startup_ms', STARTUP_BUDGET_MS),
+                               ('首次转换（含按需导入）', 'first_convert_ms', FIRST_CONVERT_BUDGET_MS)):
+        value = report[key]
+        ok = value <= budget
+        within_budget = within_budget and ok
+        print(f'   {"[OK]" if ok else "[WARN]"} {label}: {value:.1f} ms（预算 {budget} ms）')
+    print(f'   cssutils 已加载: {"是（主题缓存未命中）" if report["cssutils_loaded"] else "否"}')
+
+    for phase, title in (('startup', '启动阶段'), ('first_convert', '首次转换时按需')):
+        entries = [item for item in report['imports'] if item['phase'] == phase and item['depth'] <= 1]
+        # 顶层导入的累计耗时已包含其依赖
+        total = sum(item['cumulative_ms'] for item in entries if item['depth'] == 0)
+        entries.sort(key=lambda item: item['cumulative_ms'], reverse=True)
+        print(f'\n   {title}导入（共 {total:.1f} ms，列出耗时最多的{top}项）:')
+        for item in entries[:top]:
+            indent = '  ' * item['depth']
+            print(f'     {item["cumulative_ms"]:8.1f} ms  {indent}{item["name"]}')
+
+    return within_budget
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Theme Compiler
+将主题CSS编译为可复用的CompiledTheme对象，并在进程内和磁盘上缓存
+"""
+
+import json
+import re
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from formatter_cache import CACHE_DIR, atomic_write_text, sha256_text
+
+# 内联时跳过的复杂选择器标记（伪类、伪元素、媒体查询、组合器、属性选择器、通配符）
+UNSUPPORTED_SELECTOR_MARKERS = (':', '@', '>', '+', '~', '[', '*')
+
+
+class CompiledTheme:
+    """编译后的主题：选择器、已解析变量的声明、内联计划"""
+
+    # 磁盘缓存格式版本，修改编译逻辑时需递增
+    FORMAT_VERSION = 1
+
+    def __init__(self, css_hash: str, rules: List[Tuple[str, Dict[str, str]]], root_block: str):
+        self.css_hash = css_hash
+        # 按CSS出现顺序排列的 (选择器, 声明) 列表，同一选择器已合并
+        self.rules = rules
+        # :root { ... } 中的变量定义，用于输出文档的<head>
+        self.root_block = root_block
+        # 可内联的简单选择器（标签、类、ID及其后代组合），按优先顺序排列
+        self.inline_plan = [
+            (selector, styles) for selector, styles in rules
+            if not any(x in selector for x in UNSUPPORTED_SELECTOR_MARKERS)
+        ]
+        self._css_rules = None
+
+    @property
+    def css_rules(self) -> Dict[str, Dict[str, str]]:
+        """以字典形式返回全部规则（兼容旧的 _parse_css_to_dict 结果）"""
+        if self._css_rules is None:
+            self._css_rules = {selector: dict(styles) for selector, styles in self.rules}
+        return self._css_rules
+
+    def to_dict(self) -> dict:
+        return {
+            'format': self.FORMAT_VERSION,
+            'css_hash': self.css_hash,
+            'rules': [[selector, list(styles.items())] for selector, styles in self.rules],
+            'root_block': self.root_block,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'CompiledTheme':
+        if data.get('format') != cls.FORMAT_VERSION:
+            raise ValueError(f"Unsupported compiled theme format: {data.get('format')}")
+        rules = [(selector, dict(items)) for selector, items in data['rules']]
+        return cls(data['css_hash'], rules, data['root_block'])
+
+
+def compile_css(css_text: str, css_hash: Optional[str] = None) -> CompiledTheme:
+    """使用cssutils解析主题CSS，替换CSS变量，生成CompiledTheme（只在主题缓存未命中时导入cssutils）"""
+    import logging
+
+    import cssutils
+
+    # 禁用cssutils的警告日志
+    cssutils.log.setLevel(logging.CRITICAL)
+
+    # 解析CSS变量
+    css_vars = {}
+    var_pattern = r'--([a-zA-Z0-9-]+):\s*([^;]+);'
+    for match in re.finditer(var_pattern, css_text):
+        var_name = f'--{match.group(1)}'
+        var_value = match.group(2).strip()
+        css_vars[var_name] = var_value
+
+    # 使用cssutils解析CSS规则
+    sheet = cssutils.parseString(css_text)
+    css_rules = {}
+
+    for rule in sheet:
+        if rule.type == rule.STYLE_RULE:
+            selector = rule.selectorText
+            styles = {}
+
+            for prop in rule.style:
+                value = prop.value
+                # 替换CSS变量
+                for var_name, var_value in css_vars.items():
+                    value = value.replace(f'var({var_name})', var_value)
+                styles[prop.name] = value
+
+            # 处理多个选择器
+            for sel in selector.split(','):
+                sel = sel.strip()
+                if sel not in css_rules:
+                    css_rules[sel] = {}
+                css_rules[sel].update(styles)
+
+    # 提取CSS变量以在head中定义
+    root_match = re.search(r':root\s*\{([^}]+)\}', css_text)
+    root_block = root_match.group(1) if root_match else ''
+
+    return CompiledTheme(css_hash or sha256_text(css_text), list(css_rules.items()), root_block)
+
+
+class ThemeCache:
+    """
+    主题编译缓存
+
+    - 进程内：按 (路径, mtime, 大小) 命中，无需重新读取文件
+    - 进程内/跨路径：按内容哈希共享同一个CompiledTheme
+    - 磁盘：按内容哈希持久化为JSON，新进程无需再调用cssutils
+    """
+
+    def __init__(self, cache_dir: Optional[Path] = None, persist: bool = True):
+        self.cache_dir = Path(cache_dir) if cache_dir else CACHE_DIR / 'themes'
+        self.persist = persist
+        self._by_stat: Dict[Tuple[str, int, int], CompiledTheme] = {}
+        self._by_hash: Dict[str, CompiledTheme] = {}
+        self._lock = threading.Lock()
+
+    def load(self, css_file: Path, css_text: Optional[str] = None) -> CompiledTheme:
+        """获取主题文件对应的CompiledTheme（必要时编译）"""
+        css_file = Path(css_file)
+        stat = css_file.stat()
+        stat_key = (str(css_file.resolve()), stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            theme = self._by_stat.get(stat_key)
+            if theme is not None:
+                return theme
+
+        if css_text is None:
+            with open(css_file, 'r', encoding='utf-8') as f:
+                css_text = f.read()
+        css_hash = sha256_text(css_text)
+
+        with self._lock:
+            theme = self._by_hash.get(css_hash)
+            if theme is None:
+                theme = self._load_from_disk(css_hash)
+            if theme is None:
+                theme = compile_css(css_text, css_hash)
+                self._save_to_disk(theme)
+            self._by_hash[css_hash] = theme
+            self._by_stat[stat_key] = theme
+            return theme
+
+    def clear(self) -> None:
+        """清空进程内缓存（磁盘缓存保留）"""
+        with self._lock:
+            self._by_stat.clear()
+            self._by_hash.clear()
+
+    def _cache_path(self, css_hash: str) -> Path:
+        return self.cache_dir / f'{css_hash}.v{CompiledTheme.FORMAT_VERSION}.json'
+
+    def _load_from_disk(self, css_hash: str) -> Optional[CompiledTheme]:
+        if not self.persist:
+            return None
+        try:
+            with open(self._cache_path(css_hash), 'r', encoding='utf-8') as f:
+                theme = CompiledTheme.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return theme if theme.css_hash == css_hash else None
+
+    def _save_to_disk(self, theme: CompiledTheme) -> None:
+        if not self.persist:
+            return
+        try:
+            atomic_write_text(self._cache_path(theme.css_hash),
+                              json.dumps(theme.to_dict(), ensure_ascii=False))
+        except OSError:
+            # 缓存目录不可写时仅使用进程内缓存
+            pass
+
+
+# 全局共享的主题缓存，所有转换器实例共用
+theme_cache = ThemeCache()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量发布
+从清单（JSONL 文件或 HTML 目录）读取多篇文章，并发准备（上传封面和内容图片、修复HTML），
+再按顺序每 N 篇合并为一个多图文草稿，减少 draft/add 的调用次数
+"""
+
+import json
+import re
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from html import unescape
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+# 一个草稿最多包含 8 篇文章（多图文消息上限）
+MAX_ARTICLES_PER_DRAFT = 8
+COVER_SUFFIXES = ('.png', '.jpg', '.jpeg')
+
+_H1_RE = re.compile(r'<h1[^>]*>(.*?)</h1>', re.IGNORECASE | re.DOTALL)
+_TAG_RE = re.compile(r'<[^>]+>')
+_MD_H1_RE = re.compile(r'^#\s+(.+?)\s*#*\s*$', re.MULTILINE)
+
+
+class ArticleSpec(NamedTuple):
+    """清单中的一篇文章"""
+    title: str
+    content_file: Path
+    author: str = ""
+    cover: Optional[Path] = None
+    digest: str = ""
+
+
+class BatchResult(NamedTuple):
+    """批量发布结果"""
+    # [(草稿media_id, [文章标题])]
+    drafts: List[Tuple[str, List[str]]]
+    # [(文章标题, 错误信息)]
+    failed: List[Tuple[str, str]]
+
+
+def _article_stem(path: Path) -> str:
+    stem = path.stem
+    for suffix in ('_formatted', '.md', '.markdown'):
+        if stem.endswith(suffix):
+            stem = stem[:-len(suffix)]
+    return stem
+
+
+def guess_title(content_file: Path) -> str:
+    """推断文章标题：HTML中的 <h1>，其次同名Markdown的一级标题，最后使用文件名"""
+    html = content_file.read_text(encoding='utf-8')
+    match = _H1_RE.search(html)
+    if match:
+        title = unescape(_TAG_RE.sub('', match.group(1))).strip()
+        if title:
+            return title
+
+    stem = _article_stem(content_file)
+    for suffix in ('.md', '.markdown'):
+        markdown_file = content_file.with_name(stem + suffix)
+        if markdown_file.exists():
+            match = _MD_H1_RE.search(markdown_file.read_text(encoding='utf-8'))
+            if match:
+                return match.group(1)
+    return stem
+
+
+def guess_cover(content_file: Path) -> Optional[Path]:
+    """查找文章封面：<文章名>_cover.png、<文章名>-cover.png，其次同目录的 cover.png"""
+    stem = _article_stem(content_file)
+    for name in (f'{stem}_cover', f'{stem}-cover', 'cover'):
+        for suffix in COVER_SUFFIXES:
+            candidate = content_file.with_name(name + suffix)
+            if candidate.exists():
+                return candidate
+    return None
+
+
+def _natural_key(path: Path) -> List[Any]:
+    """按自然顺序排序（第2篇排在第10篇之前）"""
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', path.name)]
+
+
+def _find_html_files(directory: Path) -> List[Path]:
+    """目录中的HTML文件（同一篇文章同时有 X.html 和 X_formatted.html 时只取后者）"""
+    files = sorted(directory.glob('*.html'), key=_natural_key)
+    formatted = {file.name[:-len('_formatted.html')] for file in files if file.name.endswith('_formatted.html')}
+    return [file for file in files if file.stem not in formatted]
+
+
+def load_manifest(path: str, default_author: str = "",
+                  default_cover: Optional[str] = None) -> List[ArticleSpec]:
+    """
+    读取批量发布清单
+
+    Args:
+        path: JSONL 文件（每行 {"content", "title", "author", "cover", "digest"}，只有 content 必填，
+              相对路径按清单所在目录解析）或 HTML 文件目录
+        default_author: 未指定作者时使用的作者
+        default_cover: 未指定且找不到文章封面时使用的封面
+
+    Returns:
+        按清单顺序排列的文章（清单指定的封面不存在或没有封面的文章在发布时单独报告失败）
+    """
+    manifest = Path(path)
+    fallback_cover = Path(default_cover) if default_cover and Path(default_cover).exists() else None
+
+    if manifest.is_dir():
+        entries = [{'content': str(file)} for file in _find_html_files(manifest)]
+        base_dir = manifest
+    else:
+        entries = []
+        base_dir = manifest.parent
+        with open(manifest, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError as e:
+                    raise ValueError(f"清单第 {line_no} 行不是有效的JSON: {e}")
+                if not entry.get('content'):
+                    raise ValueError(f"清单第 {line_no} 行缺少 content 字段")
+                entries.append(entry)
+
+    specs = []
+    for entry in entries:
+        content_file = base_dir / entry['content']
+        if not content_file.exists():
+            raise FileNotFoundError(f"内容文件不存在: {content_file}")
+        cover = base_dir / entry['cover'] if entry.get('cover') else guess_cover(content_file)
+        if cover is not None and not cover.exists():
+            print(f"[WARN] 封面图片不存在，该文章将不会发布: {cover}")
+        specs.append(ArticleSpec(
+            title=entry.get('title') or guess_title(content_file),
+            content_file=content_file,
+            author=entry.get('author', default_author),
+            cover=cover or fallback_cover,
+            digest=entry.get('digest', ''),
+        ))
+    return specs
+
+
+def _prepare(publisher, spec: ArticleSpec, cover: Optional[Future]) -> Dict[str, Any]:
+    # draft/add 要求每篇文章都有封面，缺封面会导致同一草稿中的其他文章一起失败：只让这一篇失败
+    if spec.cover is None:
+        raise ValueError("缺少封面图片（清单中未指定 cover，也没有找到 <文章名>_cover.png 或 cover.png）")
+    if cover is None:
+        raise FileNotFoundError(f"封面图片不存在: {spec.cover}")
+    # 封面上传任务先于所有文章提交，线程池按提交顺序执行，这里等待不会死锁
+    thumb_media_id = cover.result()
+    content = spec.content_file.read_text(encoding='utf-8')
+    return publisher.prepare_article(
+        title=spec.title,
+        content=content,
+        author=spec.author,
+        thumb_media_id=thumb_media_id,
+        digest=spec.digest,
+        content_base_dir=str(spec.content_file.parent),
+    )
+
+
+def publish_batch(publisher, specs: List[ArticleSpec], per_draft: int = MAX_ARTICLES_PER_DRAFT,
+                  workers: int = 2) -> BatchResult:
+    """
+    并发准备全部文章，再按清单顺序每 per_draft 篇创建一个草稿
+
+    图片上传的总并发数和速率仍由 publisher 的 upload_workers、upload_rate 限制
+
+    Args:
+        publisher: WeChatPublisher
+        specs: 文章列表
+        per_draft: 每个草稿包含的文章数（1~8）
+        workers: 同时准备的文章数
+
+    Returns:
+        BatchResult（准备失败的文章不会加入草稿，其余文章照常发布）
+    """
+    per_draft = max(1, min(per_draft, MAX_ARTICLES_PER_DRAFT))
+    failed: List[Tuple[str, str]] = []
+    prepared: List[Dict[str, Any]] = []
+
+    start = time.perf_counter()
+    print(f"→ 正在准备 {len(specs)} 篇文章（{workers} 篇并行）...")
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        # 多篇文章常共用同一张封面：每张封面只上传一次
+        covers = {spec.cover for spec in specs if spec.cover is not None and spec.cover.exists()}
+        cover_futures = {cover: executor.submit(publisher.upload_image, str(cover)) for cover in covers}
+
+        futures = [executor.submit(_prepare, publisher, spec, cover_futures.get(spec.cover)) for spec in specs]
+        for spec, future in zip(specs, futures):
+            try:
+                prepared.append(future.result())
+            except Exception as e:
+                print(f"  [WARN] 准备文章失败 {spec.title}: {e}")
+                failed.append((spec.title, str(e)))
+    print(f"[OK] 已准备 {len(prepared)} 篇文章（{time.perf_counter() - start:.1f}秒）")
+
+    drafts: List[Tuple[str, List[str]]] = []
+    for i in range(0, len(prepared), per_draft):
+        group = prepared[i:i + per_draft]
+        titles = [article['title'] for article in group]
+        try:
+            result = publisher.add_draft(group)
+        except Exception as e:
+            print(f"  [WARN] 创建草稿失败: {e}")
+            failed.extend((title, str(e)) for title in titles)
+            continue
+        drafts.append((result.get('media_id'), titles))
+
+    return BatchResult(drafts, failed)
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+微信编辑器兼容性修复规则
+发布前对HTML的修复分三步：带背景色的 div/section 转为 table（按嵌套层级配对结束标签）、压缩空白、
+逐个开始标签改写样式。
+样式改写只访问标签：把 style 解析为声明列表，按属性规则（加 !important、删除、统一取值）处理后重新输出，
+正文文本不会被误改；相同的 style 只解析一次
+"""
+
+import re
+from typing import Callable, Dict, List, NamedTuple, Optional, Pattern, Tuple, Union
+
+
+class Rule(NamedTuple):
+    """一条正则替换规则"""
+    name: str
+    pattern: Pattern
+    repl: Union[str, Callable]
+    # 匹配结果中必然包含的字面量：内容中没有时跳过这一趟扫描
+    requires: Optional[str] = None
+    count: int = 0
+
+    def apply(self, content: str) -> str:
+        if self.requires is not None and self.requires not in content:
+            return content
+        return self.pattern.sub(self.repl, content, count=self.count)
+
+
+class StripWhitespace(NamedTuple):
+    """
+    删除分隔符一侧紧邻的全部空白，等价于 `>\\s+` → `>`（after=True）或 `\\s+<` → `<`（after=False），
+    但用 split/strip 代替逐字符尝试匹配（str.strip 与正则 \\s 的空白字符定义相同）
+    """
+    name: str
+    delimiter: str
+    after: bool
+
+    def apply(self, content: str) -> str:
+        parts = content.split(self.delimiter)
+        if self.after:
+            stripped = [parts[0]] + [part.lstrip() for part in parts[1:]]
+        else:
+            stripped = [part.rstrip() for part in parts[:-1]] + [parts[-1]]
+        return self.delimiter.join(stripped)
+
+
+class Declaration(NamedTuple):
+    """一条CSS声明"""
+    prop: str
+    value: str
+    important: bool = False
+
+    def __str__(self) -> str:
+        return f'{self.prop}:{self.value}!important' if self.important else f'{self.prop}:{self.value}'
+
+
+# === 属性规则 ===
+# 微信编辑器不支持、直接删除的属性
+DROPPED_PROPERTIES = frozenset({'box-shadow', 'text-shadow'})
+# 加 !important 的属性（防止圆角、背景色、对齐、行高、字号、内边距被微信编辑器重置）
+IMPORTANT_PROPERTIES = frozenset({
+    'border-radius', 'background-color', 'vertical-align', 'text-align', 'line-height', 'font-size', 'padding',
+})
+# 统一取值并加 !important 的属性：{属性: (需要改写的取值, 改写后的取值)}，None 表示任意取值
+NORMALIZED_PROPERTIES = {
+    # 彻底禁用缩进（微信编辑器默认添加 text-indent: 2em）
+    'text-indent': (None, '0'),
+    # 段落、section/卡片之间统一为舒适的 18px
+    'margin': (re.compile(r'\d+px\s+0\s+\d+px\s+0|0\s+0\s+\d+px\s+0|\d+px\s+0'), '0 0 18px 0'),
+    'margin-bottom': (re.compile(r'\d+px'), '18px'),
+    # 防止圆形序号等行内块布局被打乱
+    'display': (re.compile(r'inline-block'), 'inline-block'),
+}
+_HEX_COLOR_RE = re.compile(r'[#a-fA-F0-9]+')
+# 相关资源部分的虚线分隔（去掉让结尾更简洁）
+_DASHED_SEPARATOR_RE = re.compile(r'1px\s+dashed\s+#ccc')
+
+
+def rewrite_declaration(declaration: Declaration) -> Optional[Declaration]:
+    """按属性规则改写一条声明，返回 None 表示删除"""
+    prop, value, important = declaration
+    if prop in DROPPED_PROPERTIES:
+        return None
+    if prop == 'background':
+        # 移除渐变背景（微信不支持 linear-gradient），纯色背景统一为 background-color
+        if value.startswith('linear-gradient'):
+            return None
+        if not important and _HEX_COLOR_RE.fullmatch(value):
+            return Declaration('background-color', value, True)
+        return declaration
+    if prop == 'border-top' and _DASHED_SEPARATOR_RE.fullmatch(value):
+        return None
+    if important:
+        return declaration
+    if prop in NORMALIZED_PROPERTIES:
+        pattern, normalized = NORMALIZED_PROPERTIES[prop]
+        if pattern is None or pattern.fullmatch(value):
+            return Declaration(prop, normalized, True)
+        return declaration
+    if prop in IMPORTANT_PROPERTIES:
+        return Declaration(prop, value, True)
+    return declaration
+
+
+_DECLARATION_RE = re.compile(r'''([^:;]+):((?:[^;("']|\([^)]*\)|"[^"]*"|'[^']*')*)''')
+_IMPORTANT_RE = re.compile(r'\s*!\s*important\s*$', re.IGNORECASE)
+
+
+def parse_style(style: str) -> List[Declaration]:
+    """解析 style 属性为声明列表（括号和引号内的分号不作为分隔符）"""
+    declarations = []
+    for match in _DECLARATION_RE.finditer(style):
+        prop = match.group(1).strip().lower()
+        value = match.group(2).strip()
+        if not prop or not value:
+            continue
+        stripped = _IMPORTANT_RE.sub('', value)
+        # 输出时统一用双引号包裹 style，值中的双引号改为单引号
+        declarations.append(Declaration(prop, stripped.replace('"', "'"), stripped != value))
+    return declarations
+
+
+def format_style(declarations: List[Declaration]) -> str:
+    return ''.join(f'{declaration};' for declaration in declarations)
+
+
+def _set_declaration(declarations: List[Declaration], prop: str, value: str, prepend: bool = False) -> None:
+    """设置带 !important 的声明；prepend=True 时放在最前面，且已有同名声明时不覆盖"""
+    if prepend:
+        if all(declaration.prop != prop for declaration in declarations):
+            declarations.insert(0, Declaration(prop, value, True))
+        return
+    declarations[:] = [declaration for declaration in declarations if declaration.prop != prop]
+    declarations.append(Declaration(prop, value, True))
+
+
+# 开始标签和 </section>（注释原样跳过）；属性值中的 > 不会被当作标签结束
+_TAG_RE = re.compile(
+    r'''<!--.*?-->|</section\s*>|<([a-zA-Z][a-zA-Z0-9-]*)([^>"']*(?:(?:"[^"]*"|'[^']*')[^>"']*)*)>''',
+    re.DOTALL | re.IGNORECASE
+)
+# 逐个切分属性：属性名，可选的 = 和带引号或不带引号的取值（取值中的 style= 不会被当作属性）
+_ATTR_RE = re.compile(r'''(\s+)([^\s"'>/=]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+)))?''')
+
+
+def find_style_attr(attrs: str):
+    """在标签的属性串中查找 style 属性，返回其匹配结果（值为 group 3/4/5 之一），没有时返回 None"""
+    if 'style' not in attrs.lower():
+        return None
+    for match in _ATTR_RE.finditer(attrs):
+        if match.group(2).lower() == 'style':
+            return match
+    return None
+
+
+def attr_value(match) -> str:
+    """属性匹配结果的取值（没有取值时为空字符串）"""
+    return next((value for value in match.group(3, 4, 5) if value is not None), '')
+
+_TABLE_END_RE = re.compile(r'</table>', re.IGNORECASE)
+
+
+class _TagRewrite:
+    """一次样式改写的状态（StyleRewriter 本身无状态，可以在多个线程中同时使用）"""
+
+    def __init__(self):
+        # style 原文 → 改写后的声明；与上下文无关的标签原文 → 改写结果（文章中重复的标签很多）
+        self.styles: Dict[str, Tuple[Declaration, ...]] = {}
+        self.tags: Dict[str, str] = {}
+        self.outer_done = False
+        # 当前表格的结束位置，以及是否为卡片表格
+        self.table_end = -1
+        self.card_table = False
+
+    def rewrite_style(self, style: str) -> List[Declaration]:
+        declarations = self.styles.get(style)
+        if declarations is None:
+            rewritten = [rewrite_declaration(declaration) for declaration in parse_style(style)]
+            rewritten = [declaration for declaration in rewritten if declaration is not None]
+            if all(declaration.prop != 'text-indent' for declaration in rewritten):
+                rewritten.append(Declaration('text-indent', '0', True))
+            declarations = self.styles[style] = tuple(rewritten)
+        return list(declarations)
+
+    def __call__(self, match) -> str:
+        text = match.group(0)
+        rewritten = self.tags.get(text)
+        if rewritten is None:
+            rewritten = self.rewrite_tag(match)
+        return rewritten
+
+    def rewrite_tag(self, match) -> str:
+        text, name, attrs = match.group(0, 1, 2)
+        if name is None:
+            return '</div>' if text[1] == '/' else text
+        tag = name.lower()
+        if tag == 'section':
+            name = tag = 'div'
+
+        content = match.string
+        if tag == 'table' and match.start() >= self.table_end:
+            # 表格范围到第一个 </table> 为止；含 <th>（包括 <thead>）的是数据表格
+            end = _TABLE_END_RE.search(content, match.end())
+            self.table_end = end.end() if end else len(content)
+            self.card_table = end is not None and '<th' not in content[match.end():end.start()].lower()
+        in_card_table = self.card_table and match.start() < self.table_end
+
+        style_match = find_style_attr(attrs)
+        if style_match is None:
+            if tag == 'img':
+                # 没有 style 的图片：只加圆角
+                head, closing = (attrs[:-1].rstrip(), ' /') if attrs.endswith('/') else (attrs, '')
+                rewritten = f'<{name}{head} style="border-radius:8px!important;"{closing}>'
+            else:
+                rewritten = text if name == match.group(1) else f'<{name}{attrs}>'
+            if tag != 'table':
+                self.tags[text] = rewritten
+            return rewritten
+
+        style = attr_value(style_match)
+        declarations = self.rewrite_style(style)
+        # 表格、卡片表格中的单元格和最外层容器的改写结果与位置有关，不缓存
+        cacheable = tag not in ('table', 'td')
+        if tag == 'div' and not self.outer_done:
+            # 最外层容器
+            cacheable = False
+            self.outer_done = True
+            _set_declaration(declarations, 'text-indent', '0')
+            _set_declaration(declarations, 'font-size', '15px')
+        elif tag == 'img':
+            _set_declaration(declarations, 'border-radius', '8px')
+        elif in_card_table and tag == 'table':
+            for i in reversed(range(len(declarations))):
+                if declarations[i][:2] == ('border-collapse', 'collapse'):
+                    # border-collapse:separate 才能让圆角生效
+                    declarations[i:i + 1] = [Declaration('border-collapse', 'separate'),
+                                             Declaration('border-spacing', '0'),
+                                             Declaration('overflow', 'hidden', True)]
+            _set_declaration(declarations, 'border-radius', '10px', prepend=True)
+        elif in_card_table and tag == 'td':
+            _set_declaration(declarations, 'border-radius', '10px')
+
+        rewritten = (f'<{name}{attrs[:style_match.start()]}{style_match.group(1)}'
+                     f'style="{format_style(declarations)}"{attrs[style_match.end():]}>')
+        if cacheable:
+            self.tags[text] = rewritten
+        return rewritten
+
+
+class StyleRewriter(NamedTuple):
+    """
+    逐个访问开始标签，改写 style 属性：
+
+    - 每条声明按属性规则改写（见 rewrite_declaration），没有 text-indent 的元素补上 text-indent: 0
+    - <section> 改为 <div>（避免额外空行）
+    - 最外层容器（第一个带样式的 div）强制禁用缩进并设置字体大小
+    - 卡片表格（不含 <th> 的表格）及其单元格加圆角，数据表格保持 collapse 不变
+    - 图片加圆角
+    """
+    name: str
+
+    def apply(self, content: str) -> str:
+        return _TAG_RE.sub(_TagRewrite(), content)
+
+
+# === 核心修复：将带背景色的 div/section 转换为 table（微信编辑器会保留 table 的背景色）===
+# div/section 的开始和结束标签（注释原样跳过）
+_BLOCK_TAG_RE = re.compile(
+    r'''<!--.*?-->|<(/?)(div|section)(?=[\s/>])([^>"']*(?:(?:"[^"]*"|'[^']*')[^>"']*)*)>''',
+    re.DOTALL | re.IGNORECASE
+)
+_BACKGROUND_BLOCK_END = '</td></tr></table>'
+_MARGIN_VALUE_RE = re.compile(r'margin[^:]*:\s*([^;!]+)')
+
+
+def add_important_to_style(style: str) -> str:
+    """给style中的所有CSS属性添加 !important"""
+    important_declarations = []
+    for decl in style.split(';'):
+        decl = decl.strip()
+        if not decl:
+            continue
+        # 如果已经有 !important，保持不变
+        if '!important' in decl:
+            important_declarations.append(decl)
+        else:
+            important_declarations.append(decl + '!important')
+    return ';'.join(important_declarations) + ';'
+
+
+def _background_block_start(style: str, stats: Dict[str, int]) -> Optional[str]:
+    """带背景色的 div/section 转换后的开始部分（table 到 td），不转换时返回 None"""
+    # 排除不应该转换的情况：
+    # 1. 排除最外层容器（background-color: #ffffff 且包含 font-family）
+    if 'font-family' in style and 'ffffff' in style.lower():
+        stats['excluded'] += 1
+        return None
+
+    # 2. 排除纯白色背景且没有边框的元素（可能是容器）
+    style_no_space = style.replace(' ', '')
+    if ('background:#ffffff' in style_no_space or 'background-color:#ffffff' in style_no_space) \
+            and 'border' not in style:
+        stats['excluded'] += 1
+        return None
+
+    # 给所有CSS属性添加 !important（关键：确保微信编辑器不会覆盖样式）
+    style_important = add_important_to_style(style)
+
+    # 提取 margin 值（如果有）
+    margin_match = _MARGIN_VALUE_RE.search(style)
+    margin = margin_match.group(1).strip() if margin_match else '0'
+
+    # border-collapse:separate 才能让圆角生效，overflow:hidden 确保内容不会超出圆角
+    stats['converted'] += 1
+    return (f'<table style="width:100%!important;border-collapse:separate!important;border-spacing:0!important;'
+            f'border-radius:10px!important;overflow:hidden!important;margin:{margin}!important;">'
+            f'<tr><td style="{style_important}">')
+
+
+def convert_background_blocks(content: str, stats: Dict[str, int]) -> str:
+    """
+    将带背景色的 div/section 转换为 table 结构
+
+    逐个访问 div/section 标签并跟踪嵌套层级，每个区块与它自己的结束标签配对：
+    嵌套的区块各自转换，没有结束标签的区块保持不变
+    """
+    if 'background' not in content.lower():
+        return content
+
+    # 未闭合的 (标签名, 开始标签)；需要替换的 (起始位置, 结束位置, 替换文本)
+    stack: List[Tuple[str, object]] = []
+    replacements: List[Tuple[int, int, str]] = []
+    for match in _BLOCK_TAG_RE.finditer(content):
+        name = match.group(2)
+        if name is None:
+            continue
+        name = name.lower()
+        if not match.group(1):
+            stack.append((name, match))
+            continue
+
+        # 结束标签：与最近的同名开始标签配对，其间未闭合的标签一并出栈；没有对应开始标签时忽略
+        depth = next((i for i in range(len(stack) - 1, -1, -1) if stack[i][0] == name), None)
+        if depth is None:
+            continue
+        start_tag = stack[depth][1]
+        del stack[depth:]
+
+        style_match = find_style_attr(start_tag.group(3))
+        style = attr_value(style_match) if style_match is not None else ''
+        if 'background' not in style.lower():
+            continue
+        block_start = _background_block_start(style, stats)
+        if block_start is not None:
+            replacements.append((start_tag.start(), start_tag.end(), block_start))
+            replacements.append((match.start(), match.end(), _BACKGROUND_BLOCK_END))
+
+    if not replacements:
+        return content
+    # 内层区块先配对完成，按位置排序后拼接
+    replacements.sort()
+    parts, pos = [], 0
+    for start, end, text in replacements:
+        parts.append(content[pos:start])
+        parts.append(text)
+        pos = end
+    parts.append(content[pos:])
+    return ''.join(parts)
+
+
+# 背景色区块转换之后依次执行的规则
+RULES = (
+    # === 超级压缩：彻底删除所有空白 ===
+    # 删除标签后、标签前的空白（包括标签间的换行符）
+    StripWhitespace('strip-after-tag', '>', after=True),
+    StripWhitespace('strip-before-tag', '<', after=False),
+    # 压缩多个连续空格为一个（保留正常文本中的空格）
+    Rule('collapse-spaces', re.compile(r'  +'), ' ', requires='  '),
+
+    # === 样式修复：一趟访问所有开始标签，只改写 style 属性 ===
+    StyleRewriter('styles'),
+)
+
+
+def fix_wechat_editor_issues(content: str, rules: Tuple = RULES) -> Tuple[str, Dict[str, int]]:
+    """
+    修复微信编辑器的样式破坏问题
+
+    Args:
+        content: HTML内容
+        rules: 背景色区块转换之后执行的规则（默认：RULES）
+
+    Returns:
+        (修复后的HTML内容, 背景色区块转换统计 {'converted', 'excluded'})
+    """
+    stats = {'converted': 0, 'excluded': 0}
+    content = convert_background_blocks(content, stats)
+    for rule in rules:
+        content = rule.apply(content)
+    return content, stats
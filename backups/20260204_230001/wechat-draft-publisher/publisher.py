@@ -6,26 +6,56 @@
 """
 
 import os
+import re
+import sqlite3
 import sys
 import json
 import time
-import requests
+import threading
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
+
+from editor_fixes import fix_wechat_editor_issues
+from upload_cache import UploadCache, sha256_file
+from wechat_api import WeChatAPIError, WeChatClient
+from token_provider import TOKEN_CACHE_FILE, TokenProvider
+from batch_publish import MAX_ARTICLES_PER_DRAFT, load_manifest, publish_batch
+
+
+class RateLimiter:
+    """限制请求发起速率：相邻两次请求之间至少间隔 1/rate 秒（可在多个线程中共用）"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_time)
+            self._next_time = start + self.interval
+        if start > now:
+            time.sleep(start - now)
 
 
 class WeChatPublisher:
     """微信公众号草稿发布器"""
 
-    BASE_URL = "https://api.weixin.qq.com/cgi-bin"
-    TOKEN_CACHE_FILE = os.path.expanduser("~/.wechat-publisher/token_cache.json")
+    TOKEN_CACHE_FILE = TOKEN_CACHE_FILE
     CONFIG_FILE = os.path.expanduser("~/.wechat-publisher/config.json")
 
+    # 内容图片并发上传：线程数和每秒最多发起的上传请求数
+    UPLOAD_WORKERS = 4
+    UPLOAD_RATE = 10.0
+
     # 微信API错误码映射
     ERROR_CODES = {
         40001: "AppSecret错误或者AppSecret不属于这个AppID",
         40002: "请确保grant_type字段值为client_credential",
+        40007: "无效的media_id（素材可能已在公众号后台被删除）",
         40013: "不合法的AppID，请检查AppID是否正确",
         40125: "无效的appsecret，请检查AppSecret是否正确",
         40164: "调用接口的IP地址不在白名单中",
@@ -38,12 +68,37 @@ class WeChatPublisher:
         -1: "系统繁忙，请稍后重试"
     }
 
-    def __init__(self):
-        """初始化发布器"""
+    def __init__(self, upload_workers: int = UPLOAD_WORKERS, upload_rate: float = UPLOAD_RATE,
+                 use_cache: bool = True):
+        """
+        初始化发布器
+
+        Args:
+            upload_workers: 内容图片并发上传的线程数
+            upload_rate: 每秒最多发起的图片上传请求数（0 表示不限制）
+            use_cache: 上传前是否查询图片上传缓存（关闭时仍记录新的上传结果）
+        """
         self.appid = None
         self.appsecret = None
         self.access_token = None
+        self.upload_workers = max(1, upload_workers)
+        self.upload_limiter = RateLimiter(upload_rate)
+        # 同时进行的上传请求数（批量发布时多篇文章共用）
+        self.upload_slots = threading.BoundedSemaphore(self.upload_workers)
+        # 所有接口共用的客户端（连接池大小与上传线程数一致）
+        self.client = WeChatClient(self.get_access_token, pool_size=self.upload_workers)
         self.load_config()
+        self.token_provider = TokenProvider(self.appid, self.appsecret, cache_file=self.TOKEN_CACHE_FILE,
+                                            fetch=self._fetch_access_token)
+
+        self.use_cache = use_cache
+        try:
+            self.upload_cache = UploadCache(self.appid)
+        except sqlite3.Error as e:
+            print(f"[WARN] 无法打开图片上传缓存，本次不使用缓存: {e}")
+            self.upload_cache = None
+        # 本次运行中从上传缓存复用的素材：media_id → (图片路径, 内容哈希)，素材失效时据此重新上传
+        self._cached_media: Dict[str, Tuple[str, str]] = {}
 
     def load_config(self):
         """加载配置文件，首次运行时启动配置向导"""
@@ -136,6 +191,11 @@ class WeChatPublisher:
             error_detail += f"\n  2. 配置文件位置: {self.CONFIG_FILE}"
             error_detail += "\n  3. AppID应该以wx开头，长度18位"
 
+        elif errcode == 40007:
+            error_detail += "\n\n💡 解决方法："
+            error_detail += "\n  素材可能已在公众号后台被删除，使用 --invalidate <图片> 删除该图片的上传缓存"
+            error_detail += "\n  或使用 --clear-cache 清空全部缓存后重新发布"
+
         elif errcode == 45009:
             error_detail += "\n\n💡 解决方法："
             error_detail += "\n  API调用次数已达上限，请明天再试"
@@ -143,65 +203,35 @@ class WeChatPublisher:
 
         return error_detail
 
+    def _api(self, method: str, endpoint: str, context: str, **kwargs) -> Dict[str, Any]:
+        """调用微信接口，错误码转换为中文提示"""
+        try:
+            return self.client.request(method, endpoint, context=context, **kwargs)
+        except WeChatAPIError as e:
+            raise Exception(self._handle_api_error(e.errcode, e.errmsg, context=context)) from e
+
     def get_access_token(self, force_refresh: bool = False) -> str:
         """
         获取access_token，优先使用缓存
 
         Args:
-            force_refresh: 是否强制刷新token
+            force_refresh: 当前token已失效，需要刷新（其他进程已刷新过时直接使用新token）
 
         Returns:
             access_token字符串
         """
-        # 尝试从缓存读取
-        if not force_refresh and os.path.exists(self.TOKEN_CACHE_FILE):
-            try:
-                with open(self.TOKEN_CACHE_FILE, 'r') as f:
-                    cache = json.load(f)
-
-                # 检查token是否过期（提前5分钟刷新）
-                if time.time() < cache.get('expires_at', 0) - 300:
-                    print("[OK] 使用缓存的access_token")
-                    return cache['access_token']
-            except Exception as e:
-                print(f"[WARN] 读取token缓存失败: {e}")
-
-        # 请求新的token
-        print("→ 正在获取新的access_token...")
-        url = f"{self.BASE_URL}/token"
+        # 与草稿验证脚本共用缓存：进程内复用，刷新时加文件锁，多个进程不会同时请求新token
+        return self.token_provider.get(force_refresh=force_refresh)
+
+    def _fetch_access_token(self):
+        """请求新的access_token，返回 (access_token, 有效期秒数)"""
         params = {
             'grant_type': 'client_credential',
             'appid': self.appid,
             'secret': self.appsecret
         }
-
-        response = requests.get(url, params=params)
-        result = response.json()
-
-        if 'errcode' in result:
-            error_msg = self._handle_api_error(
-                result['errcode'],
-                result.get('errmsg', 'Unknown error'),
-                context="获取access_token"
-            )
-            raise Exception(error_msg)
-
-        access_token = result['access_token']
-        expires_in = result.get('expires_in', 7200)
-
-        # 缓存token
-        os.makedirs(os.path.dirname(self.TOKEN_CACHE_FILE), exist_ok=True)
-        cache_data = {
-            'access_token': access_token,
-            'expires_at': time.time() + expires_in,
-            'updated_at': time.strftime('%Y-%m-%d %H:%M:%S')
-        }
-
-        with open(self.TOKEN_CACHE_FILE, 'w') as f:
-            json.dump(cache_data, f, indent=2)
-
-        print(f"[OK] 获取access_token成功 (有效期: {expires_in}秒)")
-        return access_token
+        result = self._api('GET', 'token', context="获取access_token", auth=False, params=params)
+        return result['access_token'], result.get('expires_in', 7200)
 
     def upload_image(self, image_path: str, return_url: bool = False):
         """
@@ -217,37 +247,47 @@ class WeChatPublisher:
         if not os.path.exists(image_path):
             raise FileNotFoundError(f"图片文件不存在: {image_path}")
 
-        print(f"→ 正在上传图片: {os.path.basename(image_path)}")
+        # 相同内容的图片已上传过：直接复用
+        image_hash = sha256_file(image_path) if self.upload_cache is not None else None
+        cached = self._cached_upload(image_path, image_hash, need_url=return_url)
+        if cached is not None:
+            return (cached.media_id, cached.url) if return_url else cached.media_id
 
-        token = self.get_access_token()
-        url = f"{self.BASE_URL}/material/add_material"
+        media_id, image_url = self._upload_file(image_path, image_hash)
+        if return_url:
+            return media_id, image_url
+        return media_id
 
-        params = {
-            'access_token': token,
-            'type': 'image'
-        }
+    def _cached_upload(self, image_path: str, image_hash: Optional[str], need_url: bool):
+        """查找上传缓存，返回可以复用的 CachedUpload（需要URL时缓存记录必须带URL）"""
+        if image_hash is None or self.upload_cache is None or not self.use_cache:
+            return None
+        cached = self.upload_cache.get(image_hash)
+        if cached is None or (need_url and not cached.url):
+            return None
+        print(f"[OK] 使用已上传的图片: {os.path.basename(image_path)} (media_id: {cached.media_id})")
+        self._cached_media[cached.media_id] = (image_path, image_hash)
+        return cached
+
+    def _upload_file(self, image_path: str, image_hash: Optional[str]) -> Tuple[str, str]:
+        """上传图片（不查缓存），返回 (media_id, url) 并写入上传缓存"""
+        print(f"→ 正在上传图片: {os.path.basename(image_path)}")
 
+        # 读入内存，重试时可以重新发送
         with open(image_path, 'rb') as f:
-            files = {'media': (os.path.basename(image_path), f, 'image/jpeg')}
-            response = requests.post(url, params=params, files=files)
-
-        result = response.json()
-
-        if 'errcode' in result and result['errcode'] != 0:
-            error_msg = self._handle_api_error(
-                result['errcode'],
-                result.get('errmsg', 'Unknown error'),
-                context="上传图片"
-            )
-            raise Exception(error_msg)
+            files = {'media': (os.path.basename(image_path), f.read(), 'image/jpeg')}
+        with self.upload_slots:
+            # 重复上传只会多一个素材，可以安全重试
+            result = self._api('POST', 'material/add_material', context="上传图片",
+                               params={'type': 'image'}, files=files, idempotent=True)
 
         media_id = result.get('media_id')
         image_url = result.get('url', '')
         print(f"[OK] 图片上传成功 (media_id: {media_id})")
 
-        if return_url:
-            return media_id, image_url
-        return media_id
+        if image_hash is not None and self.upload_cache is not None and media_id:
+            self.upload_cache.put(image_hash, media_id, image_url, os.path.basename(image_path))
+        return media_id, image_url
 
     def _remove_cover_image(self, content: str) -> str:
         """
@@ -288,67 +328,108 @@ class WeChatPublisher:
 
         return content
 
-    def _upload_content_images(self, content: str, base_dir: str = ".") -> str:
-        """
-        扫描HTML中的本地图片并上传到微信，替换为微信URL
+    # 匹配所有 <img src="..."> 标签
+    _IMG_PATTERN = re.compile(r'<img([^>]*?)src=["\']([^"\']+)["\']([^>]*?)>')
 
-        Args:
-            content: HTML内容
-            base_dir: 图片所在的基础目录
-
-        Returns:
-            替换后的HTML内容
-        """
-        import re
-        from pathlib import Path
-
-        # 正则匹配所有 <img src="本地路径"> 标签
-        img_pattern = r'<img([^>]*?)src=["\']([^"\']+)["\']([^>]*?)>'
-
-        uploaded_count = 0
-
-        def replace_image(match):
-            nonlocal uploaded_count
-            before_src = match.group(1)
+    def _find_content_images(self, content: str, base_dir: str) -> Dict[str, Path]:
+        """收集HTML中需要上传的本地图片 {src: 图片路径}（跳过网络图片和封面图）"""
+        images = {}
+        for match in self._IMG_PATTERN.finditer(content):
             src = match.group(2)
-            after_src = match.group(3)
-
+            if src in images:
+                continue
             # 跳过已经是HTTP/HTTPS的图片
             if src.startswith(('http://', 'https://')):
-                return match.group(0)
-
+                continue
             # 跳过封面图（已单独处理）
             if 'cover' in src.lower():
-                return match.group(0)
+                continue
 
-            # 构建完整路径
             image_path = Path(base_dir) / src
-
             if not image_path.exists():
                 print(f"  [WARN] 图片不存在，跳过: {src}")
-                return match.group(0)
+                continue
+            images[src] = image_path
+        return images
+
+    def _upload_one_content_image(self, image_path: Path, image_hash: str) -> Tuple[str, bool]:
+        """上传一张内容图片，返回 (微信URL, 是否复用了上传缓存)"""
+        # 哈希已在分组时算好，每张图片只读取和查询缓存一次；缓存命中时不占用上传限速
+        cached = self._cached_upload(str(image_path), image_hash, need_url=True)
+        if cached is not None:
+            return cached.url, True
+        self.upload_limiter.wait()
+        _, wechat_url = self._upload_file(str(image_path), image_hash)
+        return wechat_url, False
 
-            try:
-                # 上传图片并获取URL
-                _, wechat_url = self.upload_image(str(image_path), return_url=True)
+    def _upload_content_images(self, content: str, base_dir: str = ".") -> str:
+        """
+        扫描HTML中的本地图片并上传到微信，替换为微信URL
 
-                if wechat_url:
-                    uploaded_count += 1
-                    # 替换为微信URL
-                    return f'<img{before_src}src="{wechat_url}"{after_src}>'
+        分两步：先收集所有不同的本地图片路径，在线程池中并发上传（受 upload_rate 限速），
+        再一次性替换HTML中的图片地址；内容相同的图片只上传一次
+
+        Args:
+            content: HTML内容
+            base_dir: 图片所在的基础目录
+
+        Returns:
+            替换后的HTML内容
+        """
+        images = self._find_content_images(content, base_dir)
+        if not images:
+            return content
+
+        # 按内容分组：不同路径可能是同一张图（如 a.png 和 ./a.png，或复制到多处的图片）
+        groups: Dict[str, List[str]] = {}
+        path_hashes: Dict[Path, str] = {}
+        for src, image_path in images.items():
+            image_hash = path_hashes.get(image_path)
+            if image_hash is None:
+                image_hash = path_hashes[image_path] = sha256_file(str(image_path))
+            groups.setdefault(image_hash, []).append(src)
+
+        start = time.perf_counter()
+        urls: Dict[str, str] = {}
+        uploaded_count = reused_count = 0
+        workers = min(self.upload_workers, len(groups))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                image_hash: executor.submit(self._upload_one_content_image, images[srcs[0]], image_hash)
+                for image_hash, srcs in groups.items()
+            }
+            for image_hash, future in futures.items():
+                srcs = groups[image_hash]
+                try:
+                    wechat_url, from_cache = future.result()
+                except Exception as e:
+                    print(f"  [WARN] 上传图片失败 {srcs[0]}: {e}")
+                    continue
+                if not wechat_url:
+                    print(f"  [WARN] 未获取到URL，保持原路径: {srcs[0]}")
+                    continue
+                for src in srcs:
+                    urls[src] = wechat_url
+                if from_cache:
+                    reused_count += 1
                 else:
-                    print(f"  [WARN] 未获取到URL，保持原路径: {src}")
-                    return match.group(0)
+                    uploaded_count += 1
 
-            except Exception as e:
-                print(f"  [WARN] 上传图片失败 {src}: {e}")
+        def replace_image(match):
+            wechat_url = urls.get(match.group(2))
+            if wechat_url is None:
                 return match.group(0)
+            return f'<img{match.group(1)}src="{wechat_url}"{match.group(3)}>'
 
-        # 执行替换
-        content = re.sub(img_pattern, replace_image, content)
+        # 一次性替换为微信URL
+        content = self._IMG_PATTERN.sub(replace_image, content)
 
         if uploaded_count > 0:
-            print(f"  [OK] 成功上传 {uploaded_count} 张内容图片")
+            elapsed = time.perf_counter() - start
+            print(f"  [OK] 成功上传 {uploaded_count} 张内容图片"
+                  f"（{workers} 个线程，{elapsed:.1f}秒）")
+        if reused_count > 0:
+            print(f"  [OK] 复用已上传的内容图片 {reused_count} 张（未重新上传）")
 
         return content
 
@@ -363,270 +444,16 @@ class WeChatPublisher:
         4. 字体变大（font-size被重置）
         5. 段落缩进（微信默认添加text-indent: 2em）
 
+        具体规则见 editor_fixes.RULES
+
         Args:
             content: HTML内容
 
         Returns:
             修复后的HTML内容
         """
-        import re
-
-        # === 核心修复：将带背景色的 div/section 转换为 table（微信编辑器会保留 table 的背景色）===
-        def add_important_to_style(style):
-            """给style中的所有CSS属性添加 !important"""
-            declarations = style.split(';')
-            important_declarations = []
-
-            for decl in declarations:
-                decl = decl.strip()
-                if not decl:
-                    continue
-
-                # 如果已经有 !important，保持不变
-                if '!important' in decl:
-                    important_declarations.append(decl)
-                else:
-                    # 否则添加 !important
-                    important_declarations.append(decl + '!important')
-
-            return ';'.join(important_declarations) + ';'
-
-        # 转换计数器
-        conversion_count = {'converted': 0, 'excluded': 0}
-
-        def convert_bg_div_to_table(match):
-            """将带背景色的 div/section 转换为 table 结构"""
-            tag = match.group(1)  # div 或 section
-            style = match.group(2)  # style 属性内容
-            content = match.group(3)  # 内部内容
-
-            # 排除不应该转换的情况：
-            # 1. 排除最外层容器（background-color: #ffffff 且包含 font-family）
-            if 'font-family' in style and 'ffffff' in style.lower():
-                conversion_count['excluded'] += 1
-                return match.group(0)
-
-            # 2. 排除纯白色背景且没有边框的元素（可能是容器）
-            # 去除空格后检查
-            style_no_space = style.replace(' ', '')
-            if ('background:#ffffff' in style_no_space or 'background-color:#ffffff' in style_no_space) and 'border' not in style:
-                conversion_count['excluded'] += 1
-                return match.group(0)
-
-            # 只转换真正需要的背景色区块
-            if 'background' not in style.lower():
-                return match.group(0)
-
-            # 给所有CSS属性添加 !important（关键：确保微信编辑器不会覆盖样式）
-            style_important = add_important_to_style(style)
-
-            # 提取 margin 值（如果有）
-            margin_match = re.search(r'margin[^:]*:\s*([^;!]+)', style)
-            margin = margin_match.group(1).strip() if margin_match else '0'
-
-            # 构建 table 结构（添加圆角）
-            # border-collapse:separate 才能让圆角生效，overflow:hidden 确保内容不会超出圆角
-            table_html = f'<table style="width:100%!important;border-collapse:separate!important;border-spacing:0!important;border-radius:10px!important;overflow:hidden!important;margin:{margin}!important;"><tr><td style="{style_important}">{content}</td></tr></table>'
-            conversion_count['converted'] += 1
-            return table_html
-
-        # 转换所有带 style 且包含 background 的 div/section（但排除 span 等行内元素）
-        content = re.sub(
-            r'<(div|section)\s+style="([^"]*background[^"]*)"[^>]*>(.*?)</\1>',
-            convert_bg_div_to_table,
-            content,
-            flags=re.DOTALL | re.IGNORECASE
-        )
-
-        # 打印转换统计
-        print(f"  → 背景色区块转换: 成功转换 {conversion_count['converted']} 个, 排除 {conversion_count['excluded']} 个")
-
-        # === 超级压缩：彻底删除所有空白（这是关键！）===
-        # 1. 删除所有标签间的空白和换行符
-        content = re.sub(r'>\s+<', '><', content)
-
-        # 2. 删除标签后的空白（包括标签内的换行）
-        content = re.sub(r'>\s+', '>', content)
-        content = re.sub(r'\s+<', '<', content)
-
-        # 3. 压缩多个连续空格为一个（保留正常文本中的空格）
-        content = re.sub(r'  +', ' ', content)
-
-        # === 微信编辑器兼容性修复：CSS属性处理 ===
-        # 1. 保留 border-radius 但添加 !important（尝试保留圆角效果）
-        content = re.sub(r'border-radius:\s*([^;!]+);', r'border-radius:\1!important;', content)
-
-        # 2. 移除 box-shadow（阴影，微信编辑器确实不支持）
-        content = re.sub(r'box-shadow:\s*[^;]+;\s*', '', content)
-
-        # 3. 移除 text-shadow
-        content = re.sub(r'text-shadow:\s*[^;]+;\s*', '', content)
-
-        # 4. 处理背景样式（微信编辑器对背景的限制）
-        # 4.1 移除渐变背景（微信不支持 linear-gradient）
-        content = re.sub(r'background:\s*linear-gradient[^;]+;', '', content)
-
-        # 4.2 统一 background 为 background-color 并添加 !important
-        content = re.sub(r'\bbackground:\s*([#a-fA-F0-9]+);', r'background-color:\1!important;', content)
-
-        # 4.3 确保所有 background-color 都有 !important
-        content = re.sub(r'background-color:\s*([^;!]+);', r'background-color:\1!important;', content)
-
-        # 5. 将所有 <section> 改为 <div>（避免额外空行）
-        content = content.replace('<section', '<div')
-        content = content.replace('</section>', '</div>')
-
-        # 6. 优化 margin（保持舒适间距，避免过于紧凑）
-        # 保留卡片间的间距（18px），只压缩过大的margin
-        content = re.sub(r'margin-bottom:\s*([3-9]\d+|[1-9]\d{2,})px;', 'margin-bottom:18px;', content)  # 只压缩>=30px的
-        content = re.sub(r'margin:\s*\d+px\s+0\s+\d+px\s+0;', 'margin:0 0 18px 0;', content)
-
-        # === 核心修复2：在最外层容器强制禁用缩进和设置字体大小 ===
-        # 修复微信编辑器默认添加的 text-indent: 2em
-        content = re.sub(
-            r'(<div[^>]*style="[^"]*)(">)',
-            lambda m: m.group(1) + ' text-indent: 0 !important; font-size: 15px !important;' + m.group(2),
-            content,
-            count=1  # 只修改第一个div（外层容器）
-        )
-
-        # === 样式修复：确保所有关键样式不被微信编辑器破坏 ===
-
-        # 1. text-indent 强制为 0 且使用 !important（彻底禁用缩进）
-        content = re.sub(r'text-indent:\s*[^;!]+;', 'text-indent: 0 !important;', content)
-        content = re.sub(r'text-indent:\s*0;', 'text-indent: 0 !important;', content)
-
-        # 给所有没有 text-indent 的 style 属性添加
-        content = re.sub(
-            r'style="(?![^"]*text-indent)([^"]*)"',
-            r'style="\1 text-indent: 0 !important;"',
-            content
-        )
-
-        # 2. margin 统一处理（保持舒适的段落间距和呼吸感）
-        # 段落的 margin 设置为舒适值
-        content = re.sub(
-            r'margin:\s*0\s+0\s+\d+px\s+0;',
-            'margin: 0 0 18px 0 !important;',
-            content
-        )
-        content = re.sub(
-            r'margin-bottom:\s*\d+px;',
-            'margin-bottom: 18px !important;',
-            content
-        )
-        # section/卡片 之间的间距（调整为18px，更自然）
-        content = re.sub(
-            r'margin:\s*\d+px\s+0;',
-            'margin: 0 0 18px 0 !important;',
-            content
-        )
-
-        # 3. 添加 !important 到关键对齐属性
-        # vertical-align（防止圆形序号错位）
-        content = re.sub(
-            r'vertical-align:\s*([^;!]+);',
-            r'vertical-align: \1 !important;',
-            content
-        )
-
-        # text-align（防止对齐错位）
-        content = re.sub(
-            r'text-align:\s*([^;!]+);',
-            r'text-align: \1 !important;',
-            content
-        )
-
-        # 4. display 属性加 !important（防止布局打乱）
-        content = re.sub(
-            r'display:\s*inline-block;',
-            'display: inline-block !important;',
-            content
-        )
-
-        # 5. line-height 加 !important（防止行高被重置）
-        content = re.sub(
-            r'line-height:\s*([^;!]+);',
-            r'line-height: \1 !important;',
-            content
-        )
-
-        # 6. font-size 加 !important（防止字体变大）
-        content = re.sub(
-            r'font-size:\s*([^;!]+);',
-            r'font-size: \1 !important;',
-            content
-        )
-
-        # 7. padding 加 !important（防止内边距变化）
-        content = re.sub(
-            r'padding:\s*([^;!]+);',
-            r'padding: \1 !important;',
-            content
-        )
-
-        # === 圆角优化：只给卡片表格（单行无<th>的表格）添加圆角 ===
-        # 1. 将 border-collapse: collapse 改为 separate（允许圆角）- 只对卡片表格
-        # 数据表格（含<th>）保持 collapse 不变
-
-        def add_rounded_corners_to_card_tables(match):
-            """只给卡片表格（不含<th>的表格）添加圆角"""
-            table_html = match.group(0)
-            # 如果表格包含 <th>（数据表格），不添加圆角
-            if '<th' in table_html.lower():
-                return table_html
-            # 卡片表格：添加圆角
-            table_html = table_html.replace(
-                'border-collapse: collapse;',
-                'border-collapse:separate;border-spacing:0;overflow:hidden!important;'
-            ).replace(
-                'border-collapse:collapse;',
-                'border-collapse:separate;border-spacing:0;overflow:hidden!important;'
-            )
-            # 给table添加圆角
-            table_html = re.sub(
-                r'<table\s+style="',
-                '<table style="border-radius:10px!important;',
-                table_html
-            )
-            # 给td添加圆角
-            table_html = re.sub(
-                r'(<td\s+style="[^"]*)(">)',
-                r'\1border-radius:10px!important;\2',
-                table_html
-            )
-            return table_html
-
-        # 匹配完整的表格并处理
-        content = re.sub(
-            r'<table[^>]*>.*?</table>',
-            add_rounded_corners_to_card_tables,
-            content,
-            flags=re.DOTALL | re.IGNORECASE
-        )
-
-        # 4. 去除相关资源部分的边框（让结尾更简洁）
-        content = re.sub(
-            r'border-top:\s*1px\s+dashed\s+#ccc;',
-            '',
-            content
-        )
-
-        # === 图片圆角优化：让所有图片都圆润 ===
-        # 给所有 img 标签添加圆角（修复后的正则）
-        content = re.sub(
-            r'<img([^>]*style="[^"]*)"',
-            r'<img\1;border-radius:8px!important;"',
-            content
-        )
-
-        # 给没有 style 属性的 img 添加圆角
-        content = re.sub(
-            r'<img(?![^>]*style)([^>]*)>',
-            r'<img\1 style="border-radius:8px!important;">',
-            content
-        )
-
+        content, stats = fix_wechat_editor_issues(content)
+        print(f"  → 背景色区块转换: 成功转换 {stats['converted']} 个, 排除 {stats['excluded']} 个")
         return content
 
     def create_draft(self,
@@ -652,6 +479,24 @@ class WeChatPublisher:
         Returns:
             创建结果
         """
+        article = self.prepare_article(title, content, author, thumb_media_id, digest,
+                                       show_cover_pic, content_base_dir)
+        return self.add_draft([article])
+
+    def prepare_article(self,
+                        title: str,
+                        content: str,
+                        author: str = "",
+                        thumb_media_id: str = "",
+                        digest: str = "",
+                        show_cover_pic: int = 1,
+                        content_base_dir: str = ".") -> Dict[str, Any]:
+        """
+        准备一篇草稿文章：上传内容图片、修复HTML、截断超长字段（参数同 create_draft）
+
+        Returns:
+            draft/add 接口的单篇文章数据
+        """
         # 1. 自动移除封面图片（封面已通过API单独上传）
         content = self._remove_cover_image(content)
 
@@ -707,7 +552,6 @@ class WeChatPublisher:
             print(f"已截断为: {title}")
             print(f"\n提示: 您可以在微信编辑器中手动修改为完整标题\n")
 
-        print(f"→ 正在创建草稿: {title}")
 
         if author:
             original_author = author
@@ -723,55 +567,66 @@ class WeChatPublisher:
         if digest != original_digest:
             print(f"[WARN] 摘要超长，已自动截断")
 
-        token = self.get_access_token()
-        url = f"{self.BASE_URL}/draft/add?access_token={token}"
-
         # 构建文章数据
-        articles = {
-            "articles": [{
-                "title": title,
-                "author": author,
-                "digest": digest,
-                "content": content,
-                "content_source_url": "",
-                "thumb_media_id": thumb_media_id,
-                "show_cover_pic": show_cover_pic,
-                "need_open_comment": 0,
-                "only_fans_can_comment": 0
-            }]
+        return {
+            "title": title,
+            "author": author,
+            "digest": digest,
+            "content": content,
+            "content_source_url": "",
+            "thumb_media_id": thumb_media_id,
+            "show_cover_pic": show_cover_pic,
+            "need_open_comment": 0,
+            "only_fans_can_comment": 0
         }
 
+    def _reupload_cached_covers(self, articles: List[Dict[str, Any]]) -> bool:
+        """
+        删除文章封面的上传缓存记录并重新上传（只处理本次从缓存复用的封面）
+
+        Returns:
+            是否有封面被替换
+        """
+        replaced: Dict[str, str] = {}
+        for article in articles:
+            media_id = article.get('thumb_media_id')
+            if media_id not in replaced:
+                cached = self._cached_media.pop(media_id, None)
+                if cached is None:
+                    continue
+                image_path, image_hash = cached
+                self.upload_cache.invalidate(image_hash)
+                print(f"[WARN] 缓存的封面素材已失效，重新上传: {os.path.basename(image_path)}")
+                replaced[media_id], _ = self._upload_file(image_path, image_hash)
+            article['thumb_media_id'] = replaced[media_id]
+        return bool(replaced)
+
+    def add_draft(self, articles: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        创建草稿（一个草稿可以包含多篇文章，第一篇为头条）
+
+        Args:
+            articles: prepare_article 返回的文章数据列表
+
+        Returns:
+            创建结果
+        """
+        print(f"→ 正在创建草稿: {' | '.join(article['title'] for article in articles)}")
+
         headers = {'Content-Type': 'application/json; charset=utf-8'}
         # 手动序列化JSON，确保中文不被转义
-        data = json.dumps(articles, ensure_ascii=False).encode('utf-8')
-        response = requests.post(url, data=data, headers=headers)
-        result = response.json()
-
-        if 'errcode' in result and result['errcode'] != 0:
-            # 如果是token过期，尝试刷新token后重试
-            if result['errcode'] in [40001, 42001]:
-                print("[WARN] access_token已过期，正在刷新...")
-                self.access_token = self.get_access_token(force_refresh=True)
-                token = self.access_token
-                url = f"{self.BASE_URL}/draft/add?access_token={token}"
-                data = json.dumps(articles, ensure_ascii=False).encode('utf-8')
-                response = requests.post(url, data=data, headers=headers)
-                result = response.json()
-
-                if 'errcode' in result and result['errcode'] != 0:
-                    error_msg = self._handle_api_error(
-                        result['errcode'],
-                        result.get('errmsg', 'Unknown error'),
-                        context="创建草稿"
-                    )
-                    raise Exception(error_msg)
-            else:
-                error_msg = self._handle_api_error(
-                    result['errcode'],
-                    result.get('errmsg', 'Unknown error'),
-                    context="创建草稿"
-                )
-                raise Exception(error_msg)
+        data = json.dumps({"articles": articles}, ensure_ascii=False).encode('utf-8')
+        # access_token 过期时由客户端自动刷新后重试
+        try:
+            result = self._api('POST', 'draft/add', context="创建草稿", data=data, headers=headers)
+        except Exception as e:
+            # 缓存的封面素材已在后台被删除（40007）：草稿没有创建，换成重新上传的封面后重试一次
+            cause = e.__cause__
+            if not (isinstance(cause, WeChatAPIError) and cause.errcode == 40007) \
+                    or not self._reupload_cached_covers(articles):
+                raise
+            data = json.dumps({"articles": articles}, ensure_ascii=False).encode('utf-8')
+            result = self._api('POST', 'draft/add', context="创建草稿", data=data, headers=headers)
 
         print(f"[OK] 草稿创建成功!")
         print(f"  media_id: {result.get('media_id')}")
@@ -781,12 +636,13 @@ class WeChatPublisher:
             log_dir.mkdir(parents=True, exist_ok=True)
             log_file = log_dir / "verify.log"
             with open(log_file, "a", encoding="utf-8") as f:
-                f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} Created Draft\n")
-                f.write(f"Title:   {title}\n")
-                f.write(f"Author:  {author}\n")
-                f.write(f"CoverID: {thumb_media_id}\n")
-                f.write(f"media_id: {result.get('media_id')}\n")
-                f.write("-" * 50 + "\n")
+                for article in articles:
+                    f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} Created Draft\n")
+                    f.write(f"Title:   {article['title']}\n")
+                    f.write(f"Author:  {article['author']}\n")
+                    f.write(f"CoverID: {article['thumb_media_id']}\n")
+                    f.write(f"media_id: {result.get('media_id')}\n")
+                    f.write("-" * 50 + "\n")
         except Exception:
             pass
 
@@ -803,6 +659,7 @@ def main():
   %(prog)s --title "文章标题" --content article.html
   %(prog)s --title "文章标题" --content article.html --cover cover.png --author "作者名"
   %(prog)s --interactive  # 交互式模式
+  %(prog)s --batch articles.jsonl  # 批量发布（也可以是HTML目录），每8篇合并为一个草稿
         """
     )
 
@@ -812,11 +669,64 @@ def main():
     parser.add_argument('--cover', default='cover.png', help='封面图片路径（默认: cover.png）')
     parser.add_argument('-d', '--digest', help='文章摘要')
     parser.add_argument('--interactive', action='store_true', help='交互式模式')
+    parser.add_argument('--batch', metavar='MANIFEST',
+                        help='批量发布：JSONL清单（每行 {"content", "title", "author", "cover", "digest"}）或HTML目录')
+    parser.add_argument('--per-draft', type=int, default=MAX_ARTICLES_PER_DRAFT,
+                        help=f'批量发布时每个草稿包含的文章数（默认: {MAX_ARTICLES_PER_DRAFT}）')
+    parser.add_argument('--article-workers', type=int, default=2,
+                        help='批量发布时同时准备的文章数（默认: 2）')
+    parser.add_argument('--upload-workers', type=int, default=WeChatPublisher.UPLOAD_WORKERS,
+                        help=f'内容图片并发上传的线程数（默认: {WeChatPublisher.UPLOAD_WORKERS}）')
+    parser.add_argument('--upload-rate', type=float, default=WeChatPublisher.UPLOAD_RATE,
+                        help=f'每秒最多发起的图片上传请求数，0 表示不限制（默认: {WeChatPublisher.UPLOAD_RATE:g}）')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='不使用图片上传缓存，强制重新上传（新的上传结果仍会记录）')
+    parser.add_argument('--clear-cache', action='store_true',
+                        help='清空当前公众号的图片上传缓存（素材在后台被删除后使用）')
+    parser.add_argument('--invalidate', metavar='IMAGE', action='append', default=[],
+                        help='删除指定图片的上传缓存记录，下次使用时重新上传（可多次使用）')
 
     args = parser.parse_args()
 
     try:
-        publisher = WeChatPublisher()
+        publisher = WeChatPublisher(upload_workers=args.upload_workers, upload_rate=args.upload_rate,
+                                    use_cache=not args.no_cache)
+
+        if args.clear_cache and publisher.upload_cache is not None:
+            removed = publisher.upload_cache.clear()
+            print(f"[OK] 已清空图片上传缓存（{removed} 条记录）")
+            if not args.interactive and not args.batch and not args.title and not args.content:
+                return
+
+        if args.invalidate and publisher.upload_cache is not None:
+            for image in args.invalidate:
+                if not os.path.exists(image):
+                    print(f"[WARN] 图片不存在，跳过: {image}")
+                elif publisher.upload_cache.invalidate(sha256_file(image)):
+                    print(f"[OK] 已删除图片的上传缓存: {image}")
+                else:
+                    print(f"[WARN] 图片不在上传缓存中: {image}")
+            if not args.interactive and not args.batch and not args.title and not args.content:
+                return
+
+        # 批量模式
+        if args.batch:
+            specs = load_manifest(args.batch, default_author=args.author, default_cover=args.cover)
+            if not specs:
+                print(f"错误: 清单中没有文章: {args.batch}")
+                sys.exit(1)
+            batch = publish_batch(publisher, specs, per_draft=args.per_draft, workers=args.article_workers)
+
+            print(f"\n{'='*50}")
+            print(f"[OK] 创建 {len(batch.drafts)} 个草稿，共 {sum(len(titles) for _, titles in batch.drafts)} 篇文章")
+            for media_id, titles in batch.drafts:
+                print(f"  {media_id}: {' | '.join(titles)}")
+            if batch.failed:
+                print(f"[WARN] {len(batch.failed)} 篇文章发布失败:")
+                for title, error in batch.failed:
+                    print(f"  ✗ {title}: {error}")
+            print(f"{'='*50}")
+            sys.exit(1 if batch.failed else 0)
 
         # 交互式模式
         if args.interactive:
@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Editor Fixes Benchmark
+检查 editor_fixes 的样式改写只改动 style 属性（正文文本、标签和其他属性保持不变）、
+背景色区块转换不破坏标签嵌套，并与原先逐条 re.sub 的实现对比大文档上的耗时
+
+用法：
+  python scripts/benchmark-editor-fixes.py                    # 默认语料 + 边界用例，再测 500KB 文档
+  python scripts/benchmark-editor-fixes.py ../../../articles  # 追加目录/文件作为语料
+  python scripts/benchmark-editor-fixes.py --size 2000 -n 10
+"""
+
+import argparse
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+SKILL_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SKILL_DIR))
+
+from editor_fixes import RULES, StyleRewriter, fix_wechat_editor_issues  # noqa: E402
+
+# 默认语料：本技能和排版技能的示例HTML
+DEFAULT_CORPUS = (SKILL_DIR / 'examples', SKILL_DIR.parent / 'wechat-article-formatter' / 'examples')
+
+# 边界用例：style 末尾缺分号（属性值延伸到后面的声明）、正文中的CSS文本、大小写混合的标签、
+# 其他属性的取值中出现 style=、嵌套的背景色区块等
+EDGE_CASES = (
+    '<section style="background: #f5f5f5; padding: 10px; margin: 20px 0">卡片</section>',
+    '<div style="line-height: 1.4">标题</div><p style="font-size:14px; text-align:center">正文</p>',
+    '<p style="padding: 3px">font-size: 14px; text-align:left; display: inline-block;</p>',
+    '<p>CSS 示例：padding: big font-size:  3px; margin: 10px 0 20px 0; margin-bottom: 40px;</p>',
+    '<DIV STYLE="background-color: #eee">大写标签</DIV><Table style="border-collapse: collapse;"><tr>'
+    '<td style="padding: 4px">x</td></tr></Table>',
+    '<div style="text-indent: 2em margin-bottom: 40px; background: linear-gradient(#fff, #000);">x</div>',
+    '<span style="box-shadow: 0 1px 2px #000;  text-shadow: 1px 1px #ccc; border-radius: 4px">  a  \n  b  </span>',
+    '<p style="xbackground: #fff; background:#abc; border-top: 1px dashed #ccc;">'
+    '<img src="a.png"><img style="width:100%" src="b.png"></p>',
+    '<table><tr><th>表头</th></tr></table><table style="border-collapse:collapse;"><tr>'
+    '<td style="color:red">卡片</td></tr></table>',
+    '<p title="x style=q">无样式</p><p data-note=\'style="a"\' style="padding:2px">有样式</p>'
+    '<img alt="style=x" src="c.png">',
+    '<section style="background:#f5f5f5"><div>inner</div>tail</section>'
+    '<div style="background: #eee; padding: 8px"><div style="background:#ddd">内层</div><p>外层</p></div>',
+)
+
+
+def legacy_fix_wechat_editor_issues(content: str) -> Tuple[str, Dict[str, int]]:
+    """
+    修复微信编辑器的样式破坏问题（publisher.py 改用 editor_fixes 之前的实现，冻结保留作为对照，不要修改）
+
+    解决的问题：
+    1. 编辑模式下莫名空行（HTML换行符被渲染）
+    2. 样式错位（text-indent、margin被重置）
+    3. 布局打乱（vertical-align失效）
+    4. 字体变大（font-size被重置）
+    5. 段落缩进（微信默认添加text-indent: 2em）
+
+    Args:
+        content: HTML内容
+
+    Returns:
+        (修复后的HTML内容, 背景色区块转换统计)
+    """
+    import re
+
+    # === 核心修复：将带背景色的 div/section 转换为 table（微信编辑器会保留 table 的背景色）===
+    def add_important_to_style(style):
+        """给style中的所有CSS属性添加 !important"""
+        declarations = style.split(';')
+        important_declarations = []
+
+        for decl in declarations:
+            decl = decl.strip()
+            if not decl:
+                continue
+
+            # 如果已经有 !important，保持不变
+            if '!important' in decl:
+                important_declarations.append(decl)
+            else:
+                # 否则添加 !important
+                important_declarations.append(decl + '!important')
+
+        return ';'.join(important_declarations) + ';'
+
+    # 转换计数器
+    conversion_count = {'converted': 0, 'excluded': 0}
+
+    def convert_bg_div_to_table(match):
+        """将带背景色的 div/section 转换为 table 结构"""
+        tag = match.group(1)  # div 或 section
+        style = match.group(2)  # style 属性内容
+        content = match.group(3)  # 内部内容
+
+        # 排除不应该转换的情况：
+        # 1. 排除最外层容器（background-color: #ffffff 且包含 font-family）
+        if 'font-family' in style and 'ffffff' in style.lower():
+            conversion_count['excluded'] += 1
+            return match.group(0)
+
+        # 2. 排除纯白色背景且没有边框的元素（可能是容器）
+        # 去除空格后检查
+        style_no_space = style.replace(' ', '')
+        if ('background:#ffffff' in style_no_space or 'background-color:#ffffff' in style_no_space) and 'border' not in style:
+            conversion_count['excluded'] += 1
+            return match.group(0)
+
+        # 只转换真正需要的背景色区块
+        if 'background' not in style.lower():
+            return match.group(0)
+
+        # 给所有CSS属性添加 !important（关键：确保微信编辑器不会覆盖样式）
+        style_important = add_important_to_style(style)
+
+        # 提取 margin 值（如果有）
+        margin_match = re.search(r'margin[^:]*:\s*([^;!]+)', style)
+        margin = margin_match.group(1).strip() if margin_match else '0'
+
+        # 构建 table 结构（添加圆角）
+        # border-collapse:separate 才能让圆角生效，overflow:hidden 确保内容不会超出圆角
+        table_html = f'<table style="width:100%!important;border-collapse:separate!important;border-spacing:0!important;border-radius:10px!important;overflow:hidden!important;margin:{margin}!important;"><tr><td style="{style_important}">{content}</td></tr></table>'
+        conversion_count['converted'] += 1
+        return table_html
+
+    # 转换所有带 style 且包含 background 的 div/section（但排除 span 等行内元素）
+    content = re.sub(
+        r'<(div|section)\s+style="([^"]*background[^"]*)"[^>]*>(.*?)</\1>',
+        convert_bg_div_to_table,
+        content,
+        flags=re.DOTALL | re.IGNORECASE
+    )
+
+
+    # === 超级压缩：彻底删除所有空白（这是关键！）===
+    # 1. 删除所有标签间的空白和换行符
+    content = re.sub(r'>\s+<', '><', content)
+
+    # 2. 删除标签后的空白（包括标签内的换行）
+    content = re.sub(r'>\s+', '>', content)
+    content = re.sub(r'\s+<', '<', content)
+
+    # 3. 压缩多个连续空格为一个（保留正常文本中的空格）
+    content = re.sub(r'  +', ' ', content)
+
+    # === 微信编辑器兼容性修复：CSS属性处理 ===
+    # 1. 保留 border-radius 但添加 !important（尝试保留圆角效果）
+    content = re.sub(r'border-radius:\s*([^;!]+);', r'border-radius:\1!important;', content)
+
+    # 2. 移除 box-shadow（阴影，微信编辑器确实不支持）
+    content = re.sub(r'box-shadow:\s*[^;]+;\s*', '', content)
+
+    # 3. 移除 text-shadow
+    content = re.sub(r'text-shadow:\s*[^;]+;\s*', '', content)
+
+    # 4. 处理背景样式（微信编辑器对背景的限制）
+    # 4.1 移除渐变背景（微信不支持 linear-gradient）
+    content = re.sub(r'background:\s*linear-gradient[^;]+;', '', content)
+
+    # 4.2 统一 background 为 background-color 并添加 !important
+    content = re.sub(r'\bbackground:\s*([#a-fA-F0-9]+);', r'background-color:\1!important;', content)
+
+    # 4.3 确保所有 background-color 都有 !important
+    content = re.sub(r'background-color:\s*([^;!]+);', r'background-color:\1!important;', content)
+
+    # 5. 将所有 <section> 改为 <div>（避免额外空行）
+    content = content.replace('<section', '<div')
+    content = content.replace('</section>', '</div>')
+
+    # 6. 优化 margin（保持舒适间距，避免过于紧凑）
+    # 保留卡片间的间距（18px），只压缩过大的margin
+    content = re.sub(r'margin-bottom:\s*([3-9]\d+|[1-9]\d{2,})px;', 'margin-bottom:18px;', content)  # 只压缩>=30px的
+    content = re.sub(r'margin:\s*\d+px\s+0\s+\d+px\s+0;', 'margin:0 0 18px 0;', content)
+
+    # === 核心修复2：在最外层容器强制禁用缩进和设置字体大小 ===
+    # 修复微信编辑器默认添加的 text-indent: 2em
+    content = re.sub(
+        r'(<div[^>]*style="[^"]*)(">)',
+        lambda m: m.group(1) + ' text-indent: 0 !important; font-size: 15px !important;' + m.group(2),
+        content,
+        count=1  # 只修改第一个div（外层容器）
+    )
+
+    # === 样式修复：确保所有关键样式不被微信编辑器破坏 ===
+
+    # 1. text-indent 强制为 0 且使用 !important（彻底禁用缩进）
+    content = re.sub(r'text-indent:\s*[^;!]+;', 'text-indent: 0 !important;', content)
+    content = re.sub(r'text-indent:\s*0;', 'text-indent: 0 !important;', content)
+
+    # 给所有没有 text-indent 的 style 属性添加
+    content = re.sub(
+        r'style="(?![^"]*text-indent)([^"]*)"',
+        r'style="\1 text-indent: 0 !important;"',
+        content
+    )
+
+    # 2. margin 统一处理（保持舒适的段落间距和呼吸感）
+    # 段落的 margin 设置为舒适值
+    content = re.sub(
+        r'margin:\s*0\s+0\s+\d+px\s+0;',
+        'margin: 0 0 18px 0 !important;',
+        content
+    )
+    content = re.sub(
+        r'margin-bottom:\s*\d+px;',
+        'margin-bottom: 18px !important;',
+        content
+    )
+    # section/卡片 之间的间距（调整为18px，更自然）
+    content = re.sub(
+        r'margin:\s*\d+px\s+0;',
+        'margin: 0 0 18px 0 !important;',
+        content
+    )
+
+    # 3. 添加 !important 到关键对齐属性
+    # vertical-align（防止圆形序号错位）
+    content = re.sub(
+        r'vertical-align:\s*([^;!]+);',
+        r'vertical-align: \1 !important;',
+        content
+    )
+
+    # text-align（防止对齐错位）
+    content = re.sub(
+        r'text-align:\s*([^;!]+);',
+        r'text-align: \1 !important;',
+        content
+    )
+
+    # 4. display 属性加 !important（防止布局打乱）
+    content = re.sub(
+        r'display:\s*inline-block;',
+        'display: inline-block !important;',
+        content
+    )
+
+    # 5. line-height 加 !important（防止行高被重置）
+    content = re.sub(
+        r'line-height:\s*([^;!]+);',
+        r'line-height: \1 !important;',
+        content
+    )
+
+    # 6. font-size 加 !important（防止字体变大）
+    content = re.sub(
+        r'font-size:\s*([^;!]+);',
+        r'font-size: \1 !important;',
+        content
+    )
+
+    # 7. padding 加 !important（防止内边距变化）
+    content = re.sub(
+        r'padding:\s*([^;!]+);',
+        r'padding: \1 !important;',
+        content
+    )
+
+    # === 圆角优化：只给卡片表格（单行无<th>的表格）添加圆角 ===
+    # 1. 将 border-collapse: collapse 改为 separate（允许圆角）- 只对卡片表格
+    # 数据表格（含<th>）保持 collapse 不变
+
+    def add_rounded_corners_to_card_tables(match):
+        """只给卡片表格（不含<th>的表格）添加圆角"""
+        table_html = match.group(0)
+        # 如果表格包含 <th>（数据表格），不添加圆角
+        if '<th' in table_html.lower():
+            return table_html
+        # 卡片表格：添加圆角
+        table_html = table_html.replace(
+            'border-collapse: collapse;',
+            'border-collapse:separate;border-spacing:0;overflow:hidden!important;'
+        ).replace(
+            'border-collapse:collapse;',
+            'border-collapse:separate;border-spacing:0;overflow:hidden!important;'
+        )
+        # 给table添加圆角
+        table_html = re.sub(
+            r'<table\s+style="',
+            '<table style="border-radius:10px!important;',
+            table_html
+        )
+        # 给td添加圆角
+        table_html = re.sub(
+            r'(<td\s+style="[^"]*)(">)',
+            r'\1border-radius:10px!important;\2',
+            table_html
+        )
+        return table_html
+
+    # 匹配完整的表格并处理
+    content = re.sub(
+        r'<table[^>]*>.*?</table>',
+        add_rounded_corners_to_card_tables,
+        content,
+        flags=re.DOTALL | re.IGNORECASE
+    )
+
+    # 4. 去除相关资源部分的边框（让结尾更简洁）
+    content = re.sub(
+        r'border-top:\s*1px\s+dashed\s+#ccc;',
+        '',
+        content
+    )
+
+    # === 图片圆角优化：让所有图片都圆润 ===
+    # 给所有 img 标签添加圆角（修复后的正则）
+    content = re.sub(
+        r'<img([^>]*style="[^"]*)"',
+        r'<img\1;border-radius:8px!important;"',
+        content
+    )
+
+    # 给没有 style 属性的 img 添加圆角
+    content = re.sub(
+        r'<img(?![^>]*style)([^>]*)>',
+        r'<img\1 style="border-radius:8px!important;">',
+        content
+    )
+
+    return content, conversion_count
+
+
+def load_corpus(paths: List[Path]) -> Dict[str, str]:
+    """读取语料：目录下的所有 .html 文件或单个文件"""
+    corpus = {}
+    for path in paths:
+        files = sorted(path.rglob('*.html')) if path.is_dir() else [path]
+        for file in files:
+            corpus[str(file)] = file.read_text(encoding='utf-8')
+    return corpus
+
+
+_TAG_RE = re.compile(r'''<!--.*?-->|<(/?)([a-zA-Z][a-zA-Z0-9-]*)([^>"']*(?:(?:"[^"]*"|'[^']*')[^>"']*)*)>''',
+                     re.DOTALL)
+_ATTR_RE = re.compile(r'''\s+([^\s"'>/=]+)(?:\s*=\s*(?:"[^"]*"|'[^']*'|[^\s"'>]+))?''')
+
+
+def strip_style_attr(attrs: str) -> str:
+    """删除属性串中名为 style 的属性（其他属性取值中的 style= 保留）"""
+    return _ATTR_RE.sub(lambda match: '' if match.group(1).lower() == 'style' else match.group(0), attrs)
+
+
+def without_styles(html: str) -> Tuple[List[str], List[str]]:
+    """拆分为 (去掉 style 属性的标签序列, 非空正文文本序列)；<section> 按 <div> 计"""
+    tags = []
+    for match in _TAG_RE.finditer(html):
+        if match.group(2):
+            tag = match.group(2).lower()
+            attrs = strip_style_attr(match.group(3)).rstrip('/ ')
+            tags.append(f"{match.group(1)}{'div' if tag == 'section' else tag}{attrs}")
+    return tags, [text for text in _TAG_RE.split(html)[::4] if text]
+
+
+VOID_ELEMENTS = frozenset({'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+                           'param', 'source', 'track', 'wbr'})
+
+
+def unbalanced_tags(html: str) -> int:
+    """没有正确配对的开始/结束标签数（空元素和自闭合标签不计）"""
+    stack, unmatched = [], 0
+    for match in _TAG_RE.finditer(html):
+        tag = match.group(2)
+        if not tag or tag.lower() in VOID_ELEMENTS or match.group(3).rstrip().endswith('/'):
+            continue
+        if not match.group(1):
+            stack.append(tag.lower())
+        elif stack and stack[-1] == tag.lower():
+            stack.pop()
+        else:
+            unmatched += 1
+    return unmatched + len(stack)
+
+
+def check(corpus: Dict[str, str]) -> int:
+    """
+    逐个检查：除 style 属性外，输出与不执行样式改写的结果相同；
+    输入的标签正确嵌套时输出也正确嵌套。返回不通过的数量
+    """
+    unstyled_rules = tuple(rule for rule in RULES if not isinstance(rule, StyleRewriter))
+    failures = 0
+    for name, html in corpus.items():
+        fixed = fix_wechat_editor_issues(html)[0]
+        if not unbalanced_tags(html) and unbalanced_tags(fixed):
+            failures += 1
+            print(f'  ❌ 标签嵌套被破坏: {name}')
+            continue
+        tags, texts = without_styles(fixed)
+        expected_tags, expected_texts = without_styles(fix_wechat_editor_issues(html, unstyled_rules)[0])
+        if texts != expected_texts:
+            failures += 1
+            print(f'  ❌ 正文文本被改动: {name}')
+        elif tags != expected_tags:
+            failures += 1
+            print(f'  ❌ 标签或属性被改动: {name}')
+    return failures
+
+
+def build_document(corpus: Dict[str, str], size_kb: int) -> str:
+    """把语料循环拼接到指定大小"""
+    documents = list(corpus.values())
+    parts, total, i = [], 0, 0
+    while total < size_kb * 1024:
+        document = documents[i % len(documents)]
+        parts.append(document)
+        total += len(document.encode('utf-8'))
+        i += 1
+    return ''.join(parts)
+
+
+def measure(func: Callable[[str], Tuple[str, Dict[str, int]]], html: str, repeat: int) -> float:
+    """多次运行取中位数（秒）"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(html)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='验证并对比微信编辑器兼容性修复的新旧实现')
+    parser.add_argument('paths', nargs='*', type=Path, help='追加的语料目录或HTML文件')
+    parser.add_argument('--size', type=int, default=500, help='基准文档大小（KB，默认：500）')
+    parser.add_argument('-n', '--repeat', type=int, default=5, help='重复次数（默认：5）')
+    args = parser.parse_args()
+
+    corpus = load_corpus([path for path in DEFAULT_CORPUS if path.exists()] + args.paths)
+    cases = dict(corpus)
+    cases.update((f'edge-case-{i}', html) for i, html in enumerate(EDGE_CASES, 1))
+
+    print(f'🔍 检查输出: {len(corpus)} 个语料文件 + {len(EDGE_CASES)} 个边界用例')
+    failures = check(cases)
+    if failures:
+        print(f'❌ {failures} 个检查不通过')
+        sys.exit(1)
+    print('✅ 样式改写只改动了 style 属性，标签嵌套完好')
+
+    html = build_document(corpus or {'edge-cases': ''.join(EDGE_CASES)}, args.size)
+    legacy = measure(legacy_fix_wechat_editor_issues, html, args.repeat)
+    current = measure(fix_wechat_editor_issues, html, args.repeat)
+    print()
+    print(f'⏱️  {len(html.encode("utf-8")) / 1024:.0f} KB 文档（中位数，{args.repeat} 次）')
+    print(f'  逐条 re.sub : {legacy * 1000:8.2f} ms')
+    print(f'  规则表      : {current * 1000:8.2f} ms')
+    print(f'  加速        : {legacy / current:8.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+access_token 提供者
+微信每个 AppID 同一时间只有一个有效的 access_token，重新获取会让其他进程手里的旧 token 很快失效。
+发布器和草稿验证脚本统一通过这里获取 token：进程内复用，文件缓存用文件锁保护并原子写入，
+需要刷新时同一时刻只有一个线程/进程请求 token 接口，其余直接使用它的结果
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional, Tuple
+
+import requests
+
+TOKEN_CACHE_FILE = os.path.expanduser("~/.wechat-publisher/token_cache.json")
+TOKEN_URL = "https://api.weixin.qq.com/cgi-bin/token"
+# 提前刷新的时间（秒）
+REFRESH_MARGIN = 300
+# 等待其他进程释放缓存锁的最长时间（秒）
+LOCK_TIMEOUT = 120
+
+
+class TokenError(Exception):
+    """获取 access_token 失败"""
+
+
+if sys.platform == "win32":
+    import msvcrt
+
+    @contextmanager
+    def _file_lock(path: str):
+        with open(path, 'a+b') as f:
+            f.seek(0)
+            # 非阻塞加锁并退避重试（LK_LOCK 等待约10秒后会直接抛出 OSError）
+            deadline = time.monotonic() + LOCK_TIMEOUT
+            delay = 0.05
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    if time.monotonic() >= deadline:
+                        raise TokenError(f"等待token缓存锁超时（{LOCK_TIMEOUT}秒），请检查是否有卡住的发布进程: {path}")
+                    time.sleep(delay)
+                    delay = min(delay * 2, 1.0)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    @contextmanager
+    def _file_lock(path: str):
+        with open(path, 'a+b') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def fetch_token(appid: str, appsecret: str) -> Tuple[str, int]:
+    """请求 token 接口，返回 (access_token, 有效期秒数)"""
+    params = {'grant_type': 'client_credential', 'appid': appid, 'secret': appsecret}
+    result = requests.get(TOKEN_URL, params=params, timeout=(5, 10)).json()
+    if 'access_token' not in result:
+        raise TokenError(f"获取access_token失败 (错误码{result.get('errcode')}): {result.get('errmsg')}")
+    return result['access_token'], result.get('expires_in', 7200)
+
+
+class TokenProvider:
+    """
+    access_token 提供者（可在多个线程中共用）
+
+    Args:
+        appid: 公众号AppID
+        appsecret: 公众号AppSecret
+        cache_file: 文件缓存路径（多个进程共用）
+        fetch: 请求新 token 的函数，返回 (access_token, 有效期秒数)；默认直接请求 token 接口
+    """
+
+    def __init__(self, appid: str, appsecret: str, cache_file: str = TOKEN_CACHE_FILE,
+                 fetch: Optional[Callable[[], Tuple[str, int]]] = None):
+        self.appid = appid
+        self.appsecret = appsecret
+        self.cache_file = cache_file
+        self.fetch = fetch or (lambda: fetch_token(self.appid, self.appsecret))
+
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def _valid(self, expires_at: float) -> bool:
+        return time.time() < expires_at - REFRESH_MARGIN
+
+    def _read_cache(self) -> Optional[Tuple[str, float]]:
+        """读取文件缓存，返回 (access_token, 过期时间)；写入是原子的，读取不需要加锁"""
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"[WARN] 读取token缓存失败: {e}")
+            return None
+        # 旧版本缓存没有记录 appid
+        if cache.get('appid', self.appid) != self.appid or 'access_token' not in cache:
+            return None
+        return cache['access_token'], cache.get('expires_at', 0)
+
+    def _write_cache(self, token: str, expires_at: float) -> None:
+        """先写临时文件再重命名，其他进程不会读到写了一半的缓存"""
+        directory = os.path.dirname(self.cache_file) or '.'
+        os.makedirs(directory, exist_ok=True)
+        cache_data = {
+            'appid': self.appid,
+            'access_token': token,
+            'expires_at': expires_at,
+            'updated_at': time.strftime('%Y-%m-%d %H:%M:%S')
+        }
+        # mkstemp 创建的文件权限为600
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.token-', suffix='.json')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(cache_data, f, indent=2)
+            os.replace(tmp_path, self.cache_file)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def get(self, force_refresh: bool = False, stale: Optional[str] = None) -> str:
+        """
+        获取 access_token
+
+        Args:
+            force_refresh: 当前 token 已失效（40001/42001），需要换一个
+            stale: 已失效的 token（默认为本进程正在使用的 token）；其他进程已经刷新过时直接使用新 token
+
+        Returns:
+            access_token字符串
+        """
+        if not force_refresh and self._token is not None and self._valid(self._expires_at):
+            return self._token
+
+        with self._lock:
+            if force_refresh:
+                stale = stale or self._token
+            # 等锁期间其他线程可能已经刷新
+            if self._token is not None and self._token != stale and self._valid(self._expires_at):
+                return self._token
+
+            cached = self._read_cache()
+            if cached is not None and cached[0] != stale and self._valid(cached[1]):
+                print("[OK] 使用缓存的access_token")
+                self._token, self._expires_at = cached
+                return self._token
+
+            # 锁文件与缓存在同一目录，首次使用或自定义缓存路径时目录可能还不存在
+            os.makedirs(os.path.dirname(self.cache_file) or '.', exist_ok=True)
+            with _file_lock(self.cache_file + '.lock'):
+                # 等锁期间其他进程可能已经刷新
+                cached = self._read_cache()
+                if cached is not None and cached[0] != stale and self._valid(cached[1]):
+                    print("[OK] 使用其他进程刷新的access_token")
+                    self._token, self._expires_at = cached
+                    return self._token
+
+                print("→ 正在获取新的access_token...")
+                token, expires_in = self.fetch()
+                expires_at = time.time() + expires_in
+                self._write_cache(token, expires_at)
+                print(f"[OK] 获取access_token成功 (有效期: {expires_in}秒)")
+
+            self._token, self._expires_at = token, expires_at
+            return token
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片上传缓存
+按图片内容哈希记录已上传到微信的永久素材（media_id、URL、上传时间），重复发布同一篇文章
+或多篇文章复用同一张图时不再重复上传，节省 add_material 的每日调用额度（错误码 45009）
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import NamedTuple, Optional
+
+DEFAULT_CACHE_FILE = os.path.expanduser("~/.wechat-publisher/upload_cache.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    appid TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    media_id TEXT NOT NULL,
+    url TEXT NOT NULL DEFAULT '',
+    filename TEXT NOT NULL DEFAULT '',
+    uploaded_at REAL NOT NULL,
+    PRIMARY KEY (appid, sha256)
+)
+"""
+
+
+def sha256_file(path: str) -> str:
+    """计算文件内容的SHA-256摘要"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CachedUpload(NamedTuple):
+    """一条上传记录"""
+    media_id: str
+    url: str
+    uploaded_at: float
+
+
+class UploadCache:
+    """
+    图片上传缓存（SQLite，可在多个线程中共用）
+
+    media_id 只在所属公众号内有效，因此按 (AppID, 内容哈希) 记录
+
+    Args:
+        appid: 公众号AppID
+        path: 缓存数据库文件
+    """
+
+    def __init__(self, appid: str, path: str = DEFAULT_CACHE_FILE):
+        self.appid = appid or ''
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(_SCHEMA)
+
+    def get(self, sha256: str) -> Optional[CachedUpload]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT media_id, url, uploaded_at FROM uploads WHERE appid = ? AND sha256 = ?",
+                (self.appid, sha256)
+            ).fetchone()
+        return CachedUpload(*row) if row else None
+
+    def put(self, sha256: str, media_id: str, url: str = '', filename: str = '') -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO uploads (appid, sha256, media_id, url, filename, uploaded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self.appid, sha256, media_id, url or '', filename, time.time())
+            )
+
+    def invalidate(self, sha256: str) -> bool:
+        """删除一张图片的记录（素材在公众号后台被删除后使用），返回是否存在该记录"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM uploads WHERE appid = ? AND sha256 = ?", (self.appid, sha256)
+            )
+        return cursor.rowcount > 0
+
+    def clear(self) -> int:
+        """清空当前公众号的全部记录，返回删除的条数"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute("DELETE FROM uploads WHERE appid = ?", (self.appid,))
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
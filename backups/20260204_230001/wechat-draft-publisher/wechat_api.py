@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+微信公众号API客户端
+所有接口共用一个带连接池的 requests.Session（保持连接，避免每次请求重新握手），
+按接口设置超时，系统繁忙（-1）、5xx 和网络错误时按带抖动的指数退避重试（只限可重复发送的请求；
+创建草稿等请求发出后不再重试，以免重复创建），access_token 失效（40001/42001）时自动刷新后重试
+"""
+
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+BASE_URL = "https://api.weixin.qq.com/cgi-bin"
+
+# (连接超时, 读取超时)，单位秒
+DEFAULT_TIMEOUT = (5, 15)
+ENDPOINT_TIMEOUTS = {
+    'token': (5, 10),
+    'material/add_material': (5, 60),
+    'media/uploadimg': (5, 60),
+    'draft/add': (5, 30),
+}
+
+# 可重试的错误：系统繁忙
+RETRY_ERRCODES = frozenset({-1})
+# access_token 无效或已过期：刷新后重试
+TOKEN_ERRCODES = frozenset({40001, 42001})
+
+
+class WeChatAPIError(Exception):
+    """微信接口返回了非零错误码"""
+
+    def __init__(self, errcode: int, errmsg: str, context: str = ""):
+        super().__init__(f"{context}失败 (错误码{errcode}): {errmsg}")
+        self.errcode = errcode
+        self.errmsg = errmsg
+        self.context = context
+
+
+def _request_not_sent(error: requests.RequestException) -> bool:
+    """请求是否在建立连接阶段就失败了（服务端一定没有收到请求）"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class WeChatClient:
+    """
+    微信公众号API客户端（可在多个线程中共用）
+
+    Args:
+        token_getter: 获取 access_token 的函数，接受 force_refresh 参数
+        pool_size: 连接池大小（并发请求数）
+        max_retries: 系统繁忙、5xx 和网络错误的最大重试次数（见 request 的 idempotent 参数）
+        backoff: 退避基数（秒），第 n 次重试前最多等待 backoff * 2^n 秒
+    """
+
+    def __init__(self, token_getter: Callable[..., str], pool_size: int = 4,
+                 max_retries: int = 3, backoff: float = 0.5):
+        self.token_getter = token_getter
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size))
+        self.session.mount('https://', adapter)
+
+        self._token: Optional[str] = None
+        self._token_lock = threading.Lock()
+
+    def token(self) -> str:
+        """当前 access_token（首次使用时获取）"""
+        with self._token_lock:
+            if self._token is None:
+                self._token = self.token_getter(force_refresh=False)
+            return self._token
+
+    def _refresh_token(self, stale: str) -> str:
+        """刷新失效的 access_token；多个线程同时发现失效时只刷新一次"""
+        with self._token_lock:
+            if self._token == stale:
+                print("[WARN] access_token已失效，正在刷新...")
+                self._token = self.token_getter(force_refresh=True)
+            return self._token
+
+    def _sleep_before_retry(self, attempt: int) -> None:
+        # 完全抖动：避免并发请求在同一时刻重试
+        time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    def request(self, method: str, endpoint: str, context: str = "", auth: bool = True,
+                params: Optional[Dict[str, Any]] = None,
+                timeout: Optional[Tuple[float, float]] = None,
+                idempotent: Optional[bool] = None, **kwargs) -> Dict[str, Any]:
+        """
+        调用接口并返回解析后的JSON
+
+        Args:
+            method: HTTP方法
+            endpoint: 接口路径（如 'draft/add'）
+            context: 错误提示中的操作名称
+            auth: 是否附带 access_token
+            params: 查询参数
+            timeout: 超时（默认按接口取 ENDPOINT_TIMEOUTS）
+            idempotent: 请求能否安全地重复发送（默认只有 GET 可以）；为 False 时只在连接失败
+                        （请求没有发出）时重试，5xx、超时、系统繁忙都不重试
+            **kwargs: 传给 requests 的其他参数（data、files、headers 等，重试时会原样重发，
+                      文件内容应传 bytes 而不是文件对象）
+
+        Raises:
+            WeChatAPIError: 接口返回非零错误码（重试和刷新token之后仍失败）
+            requests.RequestException: 网络错误或HTTP错误（重试之后仍失败）
+        """
+        url = f"{BASE_URL}/{endpoint}"
+        if idempotent is None:
+            idempotent = method.upper() == 'GET'
+        timeout = timeout or ENDPOINT_TIMEOUTS.get(endpoint, DEFAULT_TIMEOUT)
+        token = self.token() if auth else None
+        token_refreshed = False
+        attempt = 0
+
+        while True:
+            query = dict(params or {})
+            if token is not None:
+                query['access_token'] = token
+            try:
+                response = self.session.request(method, url, params=query, timeout=timeout, **kwargs)
+                if response.status_code >= 500:
+                    response.raise_for_status()
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                # 请求发出后服务端可能已经处理（如已创建草稿），不可重复的请求不再重试
+                retryable = idempotent or _request_not_sent(e)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                self._sleep_before_retry(attempt)
+                attempt += 1
+                continue
+
+            response.raise_for_status()
+            result = response.json()
+            errcode = result.get('errcode', 0)
+            if not errcode:
+                return result
+
+            if errcode in TOKEN_ERRCODES and token is not None and not token_refreshed:
+                token = self._refresh_token(token)
+                token_refreshed = True
+                continue
+            if errcode in RETRY_ERRCODES and idempotent and attempt < self.max_retries:
+                self._sleep_before_retry(attempt)
+                attempt += 1
+                continue
+            raise WeChatAPIError(errcode, result.get('errmsg', 'Unknown error'), context)
@@ -5,6 +5,12 @@ import sys
 import datetime
 from pathlib import Path
 
+# 与发布器共用 access_token 缓存（重新获取 token 会让发布器手里的 token 失效）
+PUBLISHER_DIR = Path(__file__).resolve().parent.parent.parent / "wechat-draft-publisher"
+if str(PUBLISHER_DIR) not in sys.path:
+    sys.path.insert(0, str(PUBLISHER_DIR))
+from token_provider import TokenProvider
+
 # 加载配置
 try:
     config_path = os.path.join(os.path.expanduser("~"), ".wechat-publisher", "config.json")
@@ -16,13 +22,13 @@ except Exception as e:
     print(f"Error loading config: {e}")
     sys.exit(1)
 
-def get_access_token():
-    url = f"https://api.weixin.qq.com/cgi-bin/token?grant_type=client_credential&appid={APPID}&secret={APPSECRET}"
-    resp = requests.get(url).json()
-    if "access_token" in resp:
-        return resp["access_token"]
-    else:
-        print(f"Error getting token: {resp}")
+token_provider = TokenProvider(APPID, APPSECRET)
+
+def get_access_token(force_refresh=False):
+    try:
+        return token_provider.get(force_refresh=force_refresh)
+    except Exception as e:
+        print(f"Error getting token: {e}")
         sys.exit(1)
 
 def get_draft_list(token):
@@ -32,7 +38,7 @@ def get_draft_list(token):
         "count": 5,
         "no_content": 0
     }
-    resp = requests.post(url, json=data).json()
+    resp = requests.post(url, json=data, timeout=(5, 15)).json()
     return resp
 
 def main():
@@ -43,6 +49,10 @@ def main():
     lines.append("=== Verifying Drafts in WeChat Official Account ===")
     token = get_access_token()
     drafts = get_draft_list(token)
+    if drafts.get("errcode") in (40001, 42001):
+        # 缓存的 token 已失效：刷新后重试一次
+        token = get_access_token(force_refresh=True)
+        drafts = get_draft_list(token)
     if "item" not in drafts:
         msg = "No drafts found or error occurred."
         print(msg)
@@ -34,31 +34,28 @@ def run_markdown_to_html(input_file: str, output_file: str = None, theme: str =
     print("[STEP 1/3] Markdown 转 HTML")
     print("=" * 50)
 
-    md_script = PROJECT_ROOT / ".claude/skills/wechat-article-formatter/scripts/markdown_to_html.py"
+    formatter_dir = PROJECT_ROOT / ".claude/skills/wechat-article-formatter/scripts"
 
-    if not md_script.exists():
-        print(f"[ERROR] Markdown 转换脚本不存在: {md_script}")
+    if not (formatter_dir / "formatter_client.py").exists():
+        print(f"[ERROR] Markdown 转换脚本不存在: {formatter_dir / 'formatter_client.py'}")
         return False
 
-    cmd = [
-        sys.executable, str(md_script),
-        "--input", input_file,
-        "--theme", theme
-    ]
-
-    if output_file:
-        cmd.extend(["--output", output_file])
-
-    print(f"执行命令: {' '.join(cmd)}")
+    # 优先调用常驻格式化服务（formatter_daemon.py），未运行时在进程内转换，无需启动子进程
+    if str(formatter_dir) not in sys.path:
+        sys.path.insert(0, str(formatter_dir))
 
-    result = os.system(" ".join(cmd))
-    if result == 0:
-        print("[OK] Markdown 转换成功")
-        return True
-    else:
-        print(f"[ERROR] Markdown 转换失败 (退出码: {result})")
+    try:
+        from formatter_client import FormatterClient
+        client = FormatterClient()
+        output_path = client.convert_file(input_file, output_file, theme=theme)
+    except Exception as e:
+        print(f"[ERROR] Markdown 转换失败: {e}")
         return False
 
+    backend = "常驻服务" if client.last_backend == "daemon" else "进程内转换"
+    print(f"[OK] Markdown 转换成功（{backend}）: {output_path}")
+    return True
+
 
 def run_smart_cover(title: str, output_file: str = "cover.png") -> bool:
     """执行智能封面生成"""
@@ -28,6 +28,22 @@ def run_step(command, cwd=None, description="Step"):
         return False
     return True
 
+def format_markdown(md_path, html_path, theme="tech"):
+    """Format via the resident formatter daemon, falling back to in-process conversion."""
+    print(f"\n>>> [Formatting to HTML] {md_path} -> {html_path}")
+    formatter_scripts = str(FORMATTER_DIR / "scripts")
+    if formatter_scripts not in sys.path:
+        sys.path.insert(0, formatter_scripts)
+    try:
+        from formatter_client import FormatterClient
+        client = FormatterClient()
+        client.convert_file(str(md_path), str(html_path), theme=theme)
+    except Exception as e:
+        print(f"!!! Error in Formatting to HTML: {e}")
+        return False
+    print(f"Formatted with {'daemon' if client.last_backend == 'daemon' else 'in-process converter'}")
+    return True
+
 def auto_pipeline(topic, title, author, dry_run=False):
     # 1. Ensure directories exist
     ARTICLES_DIR.mkdir(parents=True, exist_ok=True)
@@ -56,14 +72,7 @@ def auto_pipeline(topic, title, author, dry_run=False):
 
     # 4. Format to HTML
     html_path = ARTICLES_DIR / f"{article_name}_formatted.html"
-    format_cmd = [
-        sys.executable,
-        str(FORMATTER_DIR / "scripts" / "markdown_to_html.py"),
-        "--input", str(md_path),
-        "--theme", "tech", # Adjust based on preference
-        "--output", str(html_path)
-    ]
-    if not run_step(format_cmd, cwd=FORMATTER_DIR, description="Formatting to HTML"):
+    if not format_markdown(md_path, html_path, theme="tech"): # Adjust based on preference
         return
 
     # 5. Publish to Drafts